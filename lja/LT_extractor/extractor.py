@@ -1,12 +1,16 @@
-import os.path
 import torch
+import json
 import numpy as np
+from lja.utils.storage import get_storage
+from lja.utils.precision import get_precision_policy, relative_error
+from lja.utils.artifact_cache import ArtifactCache
+from lja.utils.artifact_registry import registry
 
 
 class LTExtractor:
     """Creates an Extractor object, that calculates the jacobians of a given entwork."""
 
-    def __init__(self, net, x0, labels):
+    def __init__(self, net, x0, labels, storage=None):
         super(LTExtractor, self).__init__()
 
         self.net = net
@@ -16,47 +20,108 @@ class LTExtractor:
         self.results_path = "results/transformations/"
         self.labels = labels
         self.preactivation = None
+        self.storage = storage if storage is not None else get_storage()
+        self.precision = get_precision_policy()
+        self.cache = ArtifactCache(storage=self.storage)
 
-    def store(self, end_path):
+    def get_cache_key(self, end_path, append=False):
+        """Key of the extraction: network parameters, input query and code version."""
+
+        path = self.results_path + end_path
+        upstream = [self.cache.read_key(path)] if append else []
+        parameters = [p.detach().cpu().numpy() for p in self.net.state_dict().values()]
+
+        config = {
+            "network": self.cache.hash_arrays(parameters),
+            "inputs": self.cache.hash_arrays(
+                [self.x0.detach().cpu().numpy(), self.labels.detach().cpu().numpy()]
+            ),
+            "append": append,
+            "precision": self.precision.get_config(),
+        }
+
+        return (
+            self.cache.compute_key(
+                "transformations", config, upstream, self.cache.get_code_version(self)
+            ),
+            config,
+            upstream,
+        )
+
+    def is_cached(self, end_path):
+        """Whether the extraction of this network and input query is already stored."""
+        key, _, _ = self.get_cache_key(end_path)
+        return self.cache.is_valid(self.results_path + end_path, key)
+
+    def store(self, end_path, append=False):
+        """
+        Stores activations, transformations and labels.
+        append  - whether the samples should be appended to an already stored extraction
+        """
 
         # root folder
         path = self.results_path + end_path
         print("Store LT in:", path)
 
-        # loop through layer folders
+        # append or overwrite
+        save = self.storage.append if append else self.storage.save
+        key, config, upstream = self.get_cache_key(end_path, append)
+        self.cache.invalidate(path)
+        registry.invalidate(end_path, path)
+
+        # loop through layer folders, arrays are cast to their storage dtype
+        activation_errors = []
         for layer in range(len(self.activations)):
 
-            # create folder
             path_layer = path + "Layer" + str(layer) + "/"
-            if not os.path.exists(path_layer):
-                os.makedirs(path_layer)
 
-            np.save(
-                path_layer + "activation.npy",
-                self.activations[layer].detach().cpu().numpy(),
-            )
+            activation = self.activations[layer].detach().cpu().numpy()
+            activation_stored = self.precision.to_storage("activation", activation)
+            activation_errors.append(relative_error(activation, activation_stored))
+            save(path_layer + "activation.npy", activation_stored)
 
             if layer < len(self.linear_transformations):
-                np.save(
+                save(
                     path_layer + "transformation.npy",
-                    self.linear_transformations[layer].detach().cpu().numpy(),
+                    self.precision.to_storage(
+                        "transformation",
+                        self.linear_transformations[layer].detach().cpu().numpy(),
+                    ),
                 )
 
         # save labels
-        np.save(
+        save(
             path + "labels.npy", self.labels.detach().cpu().numpy(),
         )
 
-        # save labels
-        np.save(
-            path + "preactivations.npy", self.preactivation.detach().cpu().numpy(),
+        # save preactivations
+        save(
+            path + "preactivations.npy",
+            self.precision.to_storage(
+                "preactivation", self.preactivation.detach().cpu().numpy()
+            ),
         )
 
         # save number of layers
-        np.save(
+        self.storage.save(
             path + "number_of_layers.npy", len(self.linear_transformations),
         )
 
+        # record the error of the stored activations
+        self.storage.write_text(
+            path + "precision.json",
+            json.dumps(
+                dict(
+                    self.precision.get_config(),
+                    activation_relative_error=activation_errors,
+                ),
+                indent=4,
+            ),
+        )
+
+        # record what produced the artifact
+        self.cache.write(path, key, "transformations", config, upstream)
+
         pass
 
     def extract(self):
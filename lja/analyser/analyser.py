@@ -13,20 +13,39 @@ from numpy.linalg import norm
 class Analyser:
     """Creates an analysis object, that can provide different statistics about the decompositions."""
 
-    def __init__(self, path, show_plots=False):
+    def __init__(self, path, show_plots=False, storage=None):
         super(Analyser, self).__init__()
 
         self.path = path
         self.plotter = Plotter(path, show_plots)
-        self.data = Dataloader(path)
+        self.data = Dataloader(path, storage=storage)
         self.number_of_layers = None
         self.side = None
 
-    def load(self, side="left", load_cluster=False, load_features=False):
+    def load(
+        self,
+        side="left",
+        load_cluster=False,
+        load_features=False,
+        layers=None,
+        samples=None,
+        label_filter=None,
+        misclassified_only=False,
+    ):
+        """
+        Loads the data, optionally restricted to a subset of layers and samples (see Dataloader.load).
+        Methods taking sample indices expect the original indices of the samples.
+        """
 
         # load transformations and decompositions
         self.side, self.number_of_layers = self.data.load(
-            side, load_cluster=load_cluster, load_features=load_features
+            side,
+            load_cluster=load_cluster,
+            load_features=load_features,
+            layers=layers,
+            samples=samples,
+            label_filter=label_filter,
+            misclassified_only=misclassified_only,
         )
 
         pass
@@ -53,7 +72,7 @@ class Analyser:
 
     def plot_single_sample(self, i):
 
-        sample = self.data.activation_list[0][i]
+        sample = self.data.activation_list[0][self.data.get_index(i)]
         sample = sample.reshape(28, 28)
         self.plotter.plot_image(
             sample,
@@ -65,13 +84,19 @@ class Analyser:
         pass
 
     # -- Util
-    def get_misclassificatin_text_labels(self, samples=range(1000)):
+    def get_misclassificatin_text_labels(self, samples=None):
 
         # add labels for misclassification:
+        if samples is None:
+            samples = range(len(self.data.labels))
         samples = np.array(samples)
         text_labels = np.repeat("", len(samples)).tolist()
         for index in samples[self.data.misclassification_mask]:
-            string = str(self.data.predictions[index]) + "-" + str(index)
+            string = (
+                str(self.data.predictions[index])
+                + "-"
+                + str(self.data.get_original_index(index))
+            )
             text_labels[index] = string
 
         return text_labels
@@ -158,7 +183,7 @@ class Analyser:
         if k_per_layer is None:
             k_per_layer = self.data.k_list
 
-        for layer in range(self.number_of_layers):
+        for layer, _ in self.data.iter_layers(artifacts=("u", "activation")):
             print("\nLayer:", layer)
             self.reduce_write_matrix(layer, k_per_layer[layer])
             self.reduce_activations(layer)
@@ -172,7 +197,7 @@ class Analyser:
 
     def create_all_singluarvalue_plots(self):
 
-        for layer in range(self.number_of_layers):
+        for layer, _ in self.data.iter_layers(artifacts=("s",)):
             self.create_singluarvalue_plot(layer)
 
         pass
@@ -196,7 +221,9 @@ class Analyser:
 
     def test_all_decompositions(self, k_per_layer=None):
 
-        for layer in range(self.number_of_layers):
+        for layer, _ in self.data.iter_layers(
+            artifacts=("u", "s", "vh", "activation")
+        ):
 
             print("\nLayer:", layer)
 
@@ -277,7 +304,9 @@ class Analyser:
 
     def create_all_reconstrcution_error_plots(self, k_range):
 
-        for layer in range(self.number_of_layers):
+        for layer, _ in self.data.iter_layers(
+            artifacts=("u", "s", "vh", "activation")
+        ):
             self.create_reconstrcution_error_plot(layer, k_range)
 
     def create_reconstrcution_error_plot(self, layer, k_range):
@@ -435,9 +464,12 @@ class Analyser:
         k = self.data.k_list[layer]
 
         # centers
-        u_centers = np.zeros((k, n_classes, self.data.u_list[layer].shape[1]))
+        dtype = self.data.precision.compute_dtype
+        u_centers = np.zeros(
+            (k, n_classes, self.data.u_list[layer].shape[1]), dtype=dtype
+        )
         feature_centers = np.zeros(
-            (k, n_classes, self.data.feature_list[layer].shape[2])
+            (k, n_classes, self.data.feature_list[layer].shape[2]), dtype=dtype
         )
 
         # loop through feature dimensions
@@ -528,7 +560,7 @@ class Analyser:
         preds = []
 
         # loop through  layers
-        for layer in range(self.number_of_layers):
+        for layer, _ in self.data.iter_layers(artifacts=("u", "s", "feature")):
 
             k = self.data.k_list[layer]
 
@@ -630,9 +662,12 @@ class Analyser:
 
     def get_feature_devation(self, sample_index):
 
+        # index in the loaded data
+        index = self.data.get_index(sample_index)
+
         # obtain actual label
-        label = self.data.labels[sample_index]
-        mask = self.data.activation_list[0][sample_index] > 0
+        label = self.data.labels[index]
+        mask = self.data.activation_list[0][index] > 0
 
         for layer in range(1, self.number_of_layers):
 
@@ -643,7 +678,7 @@ class Analyser:
 
             # loop through feature dimensions
             for feature_index in range(self.data.k_list[layer]):
-                feature = self.data.feature_list[layer][sample_index, feature_index]
+                feature = self.data.feature_list[layer][index, feature_index]
 
                 # compare
                 difference = np.abs(feature - mean_feature[feature_index, label])
@@ -690,11 +725,16 @@ class Analyser:
 
         # memories
         n_samples = len(self.data.labels)
-        u_computation_path = np.zeros((n_samples, self.number_of_layers))
-        feature_computation_path = np.zeros((n_samples, self.number_of_layers))
+        dtype = self.data.precision.compute_dtype
+        u_computation_path = np.zeros((n_samples, self.number_of_layers), dtype=dtype)
+        feature_computation_path = np.zeros(
+            (n_samples, self.number_of_layers), dtype=dtype
+        )
 
         if samples is None:
             samples = range(n_samples)
+        else:
+            samples = [self.data.get_index(sample_index) for sample_index in samples]
 
         for sample_index in samples:
 
@@ -717,7 +757,7 @@ class Analyser:
                 ] = self.compute_closest_center(feature, feature_centers_list[layer])
 
             if printing:
-                print("\nSample:", sample_index)
+                print("\nSample:", self.data.get_original_index(sample_index))
                 print("Read in:  ", feature_computation_path[sample_index])
                 print("Write out:", u_computation_path[sample_index])
 
@@ -776,17 +816,24 @@ class Analyser:
         # memory
         n_samples = len(self.data.labels)
         k = 10
-        u_computation_path = np.zeros((n_samples, self.number_of_layers, k))
-        feature_computation_path = np.zeros((n_samples, self.number_of_layers, k))
+        dtype = self.data.precision.compute_dtype
+        u_computation_path = np.zeros(
+            (n_samples, self.number_of_layers, k), dtype=dtype
+        )
+        feature_computation_path = np.zeros(
+            (n_samples, self.number_of_layers, k), dtype=dtype
+        )
 
         # lop trough samples
         if samples is None:
             samples = range(n_samples)
+        else:
+            samples = [self.data.get_index(sample_index) for sample_index in samples]
 
         for sample_index in samples:
 
             if printing:
-                print("\nSample:", sample_index)
+                print("\nSample:", self.data.get_original_index(sample_index))
 
             for layer in range(self.number_of_layers):
 
@@ -840,7 +887,9 @@ class Analyser:
             layer_range = range(0, self.number_of_layers)
 
         # memory
-        difference_to_output = np.zeros((len(output), len(layer_range)))
+        difference_to_output = np.zeros(
+            (len(output), len(layer_range)), dtype=self.data.precision.compute_dtype
+        )
 
         for i, layer in enumerate(layer_range):
             for sample_index in range(n_samples):
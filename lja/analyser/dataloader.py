@@ -1,14 +1,76 @@
-import glob, os
+import glob, os, mmap
 import numpy as np
+import warnings
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from lja.feature_constructor.feature_store import FeatureStore
+from lja.utils.storage import get_storage
+from lja.utils.precision import get_precision_policy, ComputeView
+from lja.utils.artifact_registry import load_npy
+from lja.clusterer.profiles import (
+    build_profiles,
+    transition_counts,
+    majority_previous_profile,
+)
+
+
+def advise_will_need(array):
+    """Asks the operating system to read the pages of a memory mapped array ahead, other arrays are ignored."""
+
+    if isinstance(array, ComputeView):
+        array = array.array
+
+    mapping = getattr(array, "_mmap", None)
+    if mapping is not None and hasattr(mapping, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+        mapping.madvise(mmap.MADV_WILLNEED)
+
+    pass
+
+
+class LazyList:
+    """A read-only list proxy, that loads each item on first access and keeps it afterwards."""
+
+    def __init__(self, loaders):
+        super(LazyList, self).__init__()
+
+        self.loaders = list(loaders)
+        self.items = {}
+
+    def __len__(self):
+        return len(self.loaders)
+
+    def __getitem__(self, index):
+
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+
+        if index not in self.items:
+            self.items[index] = self.loaders[index]()
+
+        return self.items[index]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def is_loaded(self, index):
+        return index in self.items
 
 
 class Dataloader:
     """Creates an loader object, that can load all the data from the folder, transformations, decompositions and clusters."""
 
-    def __init__(self, path):
+    def __init__(self, path, mmap_mode="r", storage=None):
         super(Dataloader, self).__init__()
 
         self.path = path
+        self.mmap_mode = mmap_mode
+        self.storage = storage if storage is not None else get_storage()
+        self.precision = get_precision_policy()
 
         # decomposition
         self.u_list = []
@@ -21,9 +83,15 @@ class Dataloader:
         self.transformation_list = []
         self.labels = None
         self.preactivation = None
+        self._predictions = None
+
+        # selection
+        self.layers = None
+        self.sample_indices = None
 
         # clusters
         self.clusters = []
+        self.profiles = []
 
         # general
         self.number_of_layers = None
@@ -32,6 +100,161 @@ class Dataloader:
         # features
         self.feature_list = []
 
+    def load_array(self, path_file):
+        """
+        Opens an array memory mapped, so that only the accessed parts are read from disk.
+        Arrays are shared read-only with all loaders of the process through the artifact registry.
+        Arrays stored in a lower precision are cast to the compute dtype part by part, when they are read.
+        """
+        return self.precision.view(
+            load_npy(self.path, path_file, self.mmap_mode, self.storage)
+        )
+
+    def load_rows(self, path_file):
+        """Opens a per-sample array and reads the selected samples only."""
+        if self.sample_indices is None:
+            return self.load_array(path_file)
+
+        array = load_npy(self.path, path_file, "r", self.storage)
+        return self.precision.to_compute(np.asarray(array[self.sample_indices]))
+
+    def load_scalar(self, path_file):
+        return self.storage.load(path_file).item()
+
+    def load_cluster(self, path_layer):
+        return (
+            self.storage.load(path_layer + "number_of_clusters.npy"),
+            self.load_rows(path_layer + "clusters.npy"),
+            self.load_array(path_layer + "center_of_clusters.npy"),
+        )
+
+    def load_profiles(self, layer):
+        """
+        Profile dictionary of the clusters of a layer: the profiles (distinct label rows), the profile_index of each sample,
+        the counts and previous_profile, the majority profile of the previous layer of each profile (None for the first layer).
+        Built from the loaded cluster labels if not stored, or if samples are selected.
+        """
+
+        path_layer = (
+            "results/clusters/" + self.path + self.side + "/Layer" + str(layer) + "/"
+        )
+        stored = self.sample_indices is None and self.storage.exists(
+            path_layer + "profiles.npy"
+        )
+
+        if stored:
+            profiles, profile_index, counts = (
+                self.storage.load(path_layer + name + ".npy")
+                for name in ["profiles", "profile_index", "profile_counts"]
+            )
+        else:
+            profiles, profile_index, counts = build_profiles(self.clusters[layer][1])
+
+        # transitions from the profiles of the previous layer
+        transitions, previous_profile = None, None
+        if layer > 0:
+            if stored and self.storage.exists(path_layer + "transitions.npz"):
+                transitions = self.storage.load_sparse(path_layer + "transitions.npz")
+            else:
+                previous = self.profiles[layer - 1]
+                transitions = transition_counts(
+                    previous["profile_index"],
+                    profile_index,
+                    len(previous["profiles"]),
+                    len(profiles),
+                )
+            previous_profile = majority_previous_profile(transitions)
+
+        return {
+            "profiles": profiles,
+            "profile_index": profile_index,
+            "counts": counts,
+            "transitions": transitions,
+            "previous_profile": previous_profile,
+        }
+
+    def not_selected(self, layer):
+        raise Exception(
+            "Dataloader: layer " + str(layer) + " was not selected for loading"
+        )
+
+    def lazy_layers(self, loader, paths, layers=None):
+        """Creates a lazy list over layers, where only the selected layers can be accessed."""
+
+        if layers is None:
+            layers = self.layers
+
+        return LazyList(
+            [
+                partial(loader, path)
+                if (layers is None or layer in layers)
+                else partial(self.not_selected, layer)
+                for layer, path in enumerate(paths)
+            ]
+        )
+
+    def select_samples(self, samples=None, label_filter=None, misclassified_only=False):
+        """
+        Determines the indices of the samples to be loaded. The selections are combined,
+        the result is sorted and stored in self.sample_indices (None if all samples are used).
+        """
+
+        if samples is None and label_filter is None and not misclassified_only:
+            return None
+
+        path = "results/transformations/" + self.path
+        labels = self.storage.load(path + "labels.npy", mmap_mode="r")
+        mask = np.ones(len(labels), dtype=bool)
+
+        if samples is not None:
+            mask_samples = np.zeros(len(labels), dtype=bool)
+            mask_samples[np.asarray(samples, dtype=int)] = True
+            mask &= mask_samples
+
+        if label_filter is not None:
+            mask &= np.isin(labels, label_filter)
+
+        if misclassified_only:
+            output = self.storage.load(
+                self.get_activation_path(self.number_of_layers), mmap_mode="r"
+            )
+            mask &= labels != np.argmax(output, axis=1)
+
+        return np.where(mask)[0]
+
+    def get_activation_path(self, layer):
+        return (
+            "results/transformations/"
+            + self.path
+            + "/Layer"
+            + str(layer)
+            + "/activation.npy"
+        )
+
+    def get_index(self, sample_index):
+        """Maps the original index of a sample to its index in the loaded arrays."""
+
+        if self.sample_indices is None:
+            return sample_index
+
+        index = np.searchsorted(self.sample_indices, sample_index)
+        if index >= len(self.sample_indices) or (
+            self.sample_indices[index] != sample_index
+        ):
+            raise Exception(
+                "Dataloader: sample " + str(sample_index) + " was not selected"
+            )
+
+        return index
+
+    def get_original_index(self, index):
+        """Maps the index in the loaded arrays to the original index of the sample."""
+
+        if self.sample_indices is None:
+            return index
+
+        return self.sample_indices[index]
+
     def load(
         self,
         side="left",
@@ -39,108 +262,252 @@ class Dataloader:
         load_decompositions=True,
         load_cluster=False,
         load_features=False,
+        layers=None,
+        samples=None,
+        label_filter=None,
+        misclassified_only=False,
     ):
+        """
+        Prepares the lists of the requested data. The lists are lazy: an array is opened
+        (memory mapped by default) when its layer is accessed for the first time.
+        layers              - indices of the layers that can be accessed, all if None
+        samples             - original indices of the samples to be loaded, all if None
+        label_filter        - labels of the samples to be loaded
+        misclassified_only  - whether only misclassified samples should be loaded
+        All per-sample arrays (activations, transformations, U or VH, cluster labels and features)
+        are restricted to the selected samples, use get_index to map original sample indices.
+        """
 
         print("Loading data ...")
 
         # config
         path = "results/transformations/" + self.path
         self.side = side
-        self.number_of_layers = np.load(path + "number_of_layers.npy").item()
+        self.number_of_layers = self.load_scalar(path + "number_of_layers.npy")
+        self._predictions = None
+
+        # selection
+        self.layers = None if layers is None else set(layers)
+        self.sample_indices = self.select_samples(
+            samples, label_filter, misclassified_only
+        )
 
         if load_decompositions:
             # ----  Set path to decompositions
             path = "results/decompositions/" + self.path + side
-
-            for layer in range(self.number_of_layers):
-
-                path_layer = path + "/Layer" + str(layer) + "/"
-
-                # read and write vectors
-                self.u_list.append(np.load(path_layer + "u.npy"))
-                self.vh_list.append(np.load(path_layer + "vh.npy"))
-                self.s_list.append(np.load(path_layer + "s.npy"))
-                self.k_list.append(np.load(path_layer + "k.npy").item())
+            path_layers = [
+                path + "/Layer" + str(layer) + "/"
+                for layer in range(self.number_of_layers)
+            ]
+
+            # read and write vectors, only the per-sample matrices are restricted to the samples
+            load_u = self.load_rows if side == "left" else self.load_array
+            load_vh = self.load_rows if side == "right" else self.load_array
+
+            self.u_list = self.lazy_layers(load_u, [p + "u.npy" for p in path_layers])
+            self.vh_list = self.lazy_layers(
+                load_vh, [p + "vh.npy" for p in path_layers]
+            )
+            self.s_list = self.lazy_layers(
+                self.load_array, [p + "s.npy" for p in path_layers]
+            )
+            self.k_list = self.lazy_layers(
+                self.load_scalar, [p + "k.npy" for p in path_layers]
+            )
 
         if load_transformations:
             # ----  Set path to transformations
             path = "results/transformations/" + self.path
-            self.labels = np.load(path + "labels.npy")
+            self.labels = self.load_rows(path + "labels.npy")
             # self.preactivation = np.load(path + "preactivations.npy")
 
-            # load activations
-            for layer in range(self.number_of_layers + 1):
-
-                path_layer = path + "/Layer" + str(layer) + "/"
-
-                # load activations
-                self.activation_list.append(np.load(path_layer + "activation.npy"))
-
-                if layer < self.number_of_layers:
-                    self.transformation_list.append(
-                        np.load(path_layer + "transformation.npy")
-                    )
-
-            #  compute misclassification:
-            self.predictions = np.argmax(
-                self.activation_list[self.number_of_layers], axis=1
+            # load activations, the input and output of each selected layer
+            if self.layers is None:
+                activation_layers = None
+            else:
+                activation_layers = self.layers | {layer + 1 for layer in self.layers}
+
+            self.activation_list = self.lazy_layers(
+                self.load_rows,
+                [
+                    self.get_activation_path(layer)
+                    for layer in range(self.number_of_layers + 1)
+                ],
+                activation_layers,
+            )
+            self.transformation_list = self.lazy_layers(
+                self.load_rows,
+                [
+                    path + "/Layer" + str(layer) + "/transformation.npy"
+                    for layer in range(self.number_of_layers)
+                ],
             )
-            self.misclassification_mask = self.labels != self.predictions
 
         # ---- Set path to clusters
         if load_cluster:
             path = "results/clusters/" + self.path + side
 
             # load clusters
-            for layer in range(self.number_of_layers):
+            self.clusters = self.lazy_layers(
+                self.load_cluster,
+                [
+                    path + "/Layer" + str(layer) + "/"
+                    for layer in range(self.number_of_layers)
+                ],
+            )
+            self.profiles = self.lazy_layers(
+                self.load_profiles, range(self.number_of_layers)
+            )
+
+        # ---- Load features
+        if load_features:
+            self.load_feature_list()
+
+        return self.side, self.number_of_layers
+
+    def load_feature_list(self):
+        """Prepares the lazy list of the features of each layer, of the loaded side."""
+
+        feature_store = FeatureStore(
+            self.path, self.side, "sample", "sample", storage=self.storage
+        )
+        self.feature_list = self.lazy_layers(
+            partial(self.load_features, feature_store),
+            range(self.number_of_layers),
+        )
+
+        pass
+
+    def load_features(self, feature_store, layer):
+        """Opens the features of a layer from the feature store, its shape is read from the stored array."""
 
-                path_layer = path + "/Layer" + str(layer) + "/"
+        features, computed = feature_store.open(layer, mode=self.mmap_mode)
 
-                # load activations
-                self.clusters.append(
-                    (
-                        np.load(path_layer + "number_of_clusters.npy"),
-                        np.load(path_layer + "clusters.npy"),
-                        np.load(path_layer + "center_of_clusters.npy"),
+        if self.sample_indices is not None:
+            features = self.precision.to_compute(features[self.sample_indices])
+            computed = computed[self.sample_indices]
+        else:
+            features = self.precision.view(features)
+
+        if not computed.all():
+            warnings.warn(
+                "Dataloader: features of layer "
+                + str(layer)
+                + " are incomplete, missing entries are zero"
+            )
+
+        return features
+
+    @property
+    def predictions(self):
+        """Predicted classes, computed from the output activations on first access."""
+        if self._predictions is None and self.labels is not None:
+            output = self.load_rows(self.get_activation_path(self.number_of_layers))
+            self._predictions = np.argmax(output, axis=1)
+
+        return self._predictions
+
+    @property
+    def misclassification_mask(self):
+        if self.predictions is None:
+            return None
+
+        return self.labels != self.predictions
+
+    def get_layer_lists(self):
+        return {
+            "u": self.u_list,
+            "vh": self.vh_list,
+            "s": self.s_list,
+            "activation": self.activation_list,
+            "transformation": self.transformation_list,
+            "cluster": self.clusters,
+            "feature": self.feature_list,
+        }
+
+    def read_layer(self, layer, artifacts):
+        """
+        Opens the artifacts of a layer, without copying them into memory. The pages of memory mapped
+        arrays are requested from the operating system, so that they are read in the background.
+        """
+
+        lists = self.get_layer_lists()
+        arrays = {}
+        for name in artifacts:
+            item = lists[name][layer]
+            for array in item if isinstance(item, tuple) else (item,):
+                advise_will_need(array)
+            arrays[name] = item
+
+        return arrays
+
+    def iter_layers(
+        self, prefetch=2, artifacts=("u", "vh", "transformation"), layers=None
+    ):
+        """
+        Iterates over the layers and yields (layer, arrays), with arrays a dict of the requested artifacts.
+        A thread pool opens the next layers while the current one is processed, at most prefetch layers are
+        read ahead. The arrays are the lazily loaded ones of the lists, they are not copied into memory.
+        Features are loaded on demand if they are requested but were not loaded.
+        """
+
+        if "feature" in artifacts and not self.feature_list:
+            self.load_feature_list()
+
+        if layers is None:
+            layers = [
+                layer
+                for layer in range(self.number_of_layers)
+                if self.layers is None or layer in self.layers
+            ]
+
+        layer_iterator = iter(layers)
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=max(prefetch, 1)) as executor:
+
+            def submit_next():
+                layer = next(layer_iterator, None)
+                if layer is not None:
+                    pending.append(
+                        (layer, executor.submit(self.read_layer, layer, artifacts))
                     )
-                )
 
-        # ---- Load features
-        if load_features:
+            for _ in range(max(prefetch, 1)):
+                submit_next()
 
-            if False:
-                self.feature_list = np.load("results/feature.npy", allow_pickle=True)
-            else:
-                path = "results/features/" + self.path + side
-                sample = 1000
-                input_dim = 784
-
-                for layer in range(self.number_of_layers):
-                    k = [20, 10, 10, 10][layer]
-                    path_layer = path + "/Layer" + str(layer) + "/"
-
-                    features_layer = np.empty((sample, k, input_dim))
-
-                    for sample_index in range(sample):
-
-                        for feature_index in range(k):
-
-                            path_file = (
-                                path_layer
-                                + "Vector"
-                                + str(feature_index)
-                                + "/by_sample"
-                                + "/granularity_sample"
-                                + "/feature_"
-                                + str(feature_index)
-                                + "_sample_"
-                                + str(sample_index)
-                                + ".npy"
-                            )
-
-                            features_layer[sample_index, feature_index] = np.load(
-                                path_file, allow_pickle=True
-                            )
-                    self.feature_list.append(features_layer)
+            while pending:
+                layer, future = pending.popleft()
+                arrays = future.result()
 
-        return self.side, self.number_of_layers
+                # read ahead
+                if prefetch > 0:
+                    submit_next()
+
+                yield layer, arrays
+
+                if prefetch == 0:
+                    submit_next()
+
+        pass
+
+    def load_transformations_from(self, start):
+        """
+        Loads only the transformations of the samples with index >= start,
+        e.g. the samples that were appended after a decomposition was computed.
+        """
+
+        path = "results/transformations/" + self.path
+        if self.number_of_layers is None:
+            self.number_of_layers = self.load_scalar(path + "number_of_layers.npy")
+
+        transformation_list = []
+        for layer in range(self.number_of_layers):
+
+            path_layer = path + "/Layer" + str(layer) + "/"
+
+            # memory map to read the new rows only
+            T = self.storage.load(path_layer + "transformation.npy", mmap_mode="r")
+            transformation_list.append(np.array(self.precision.to_compute(T[start:])))
+
+        return transformation_list
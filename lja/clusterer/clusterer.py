@@ -7,14 +7,142 @@ import pandas as pd
 from sklearn.cluster import KMeans
 from sklearn.metrics import silhouette_samples, silhouette_score
 from sklearn.cluster import SpectralClustering
-from sklearn.neighbors import kneighbors_graph
+from sklearn.neighbors import kneighbors_graph, NearestNeighbors
 import scipy
+from concurrent.futures import ProcessPoolExecutor
+from lja.clusterer.spectral import spectral_embedding, eigengap_estimate
+from lja.clusterer.scoring import score_silhouette
+from lja.clusterer.minibatch import minibatch_kmeans, predict_batches, assign_to_centers
+from lja.clusterer.knn import approximate_neighbors, connectivity_from_indices
+from lja.clusterer.hierarchy import build_linkage, cut_linkage, linkage_gap_estimate
+from lja.clusterer.minibatch import sum_per_center
+from lja.clusterer.profiles import build_profiles, transition_counts
+from lja.clusterer.stability import (
+    bootstrap_sample,
+    connectivity_of_sample,
+    contingency_table,
+    jaccard_from_contingency,
+    coassignment_from_contingency,
+)
+from lja.utils.storage import get_storage
+from lja.utils.precision import get_precision_policy
+from lja.utils.artifact_cache import ArtifactCache
+from lja.utils.artifact_registry import load_npy, registry, attach
+
+
+def sweep_task(
+    shared_vectors,
+    shared_neighbors,
+    layer,
+    n_neighbors,
+    number_of_clusters_list,
+    n_components,
+    max_number_of_clusters,
+    eigen_solver,
+    silhouette_params,
+):
+    """
+    Evaluates the clusterings of one layer and one n_neighbors for every number of clusters, runs in a worker process.
+    The vectors and the neighbors of the largest kNN graph are read from shared memory, the graph of
+    n_neighbors are the first n_neighbors columns of the sorted neighbors.
+    """
+
+    vectors = attach(shared_vectors)
+    neighbors = attach(shared_neighbors)[:, :n_neighbors]
+
+    # 1. Spectral embedding, shared by all numbers of clusters
+    eigenvalues, embedding = spectral_embedding(
+        connectivity_from_indices(neighbors), n_components, eigen_solver
+    )
+    estimate, _ = eigengap_estimate(eigenvalues[:max_number_of_clusters])
+
+    # 2. Cluster and score
+    rows = []
+    for n_clusters in number_of_clusters_list:
+        labels = KMeans(n_clusters=n_clusters, n_init=10, random_state=1).fit_predict(
+            embedding[:, :n_clusters]
+        )
+
+        silhouette = score_silhouette(vectors, labels, **silhouette_params)
+
+        rows.append(
+            {
+                "layer": layer,
+                "n_neighbors": n_neighbors,
+                "n_clusters": n_clusters,
+                "silhouette": silhouette["silhouette"],
+                "silhouette_lower": silhouette["lower"],
+                "silhouette_upper": silhouette["upper"],
+                "eigengap": eigenvalues[n_clusters] - eigenvalues[n_clusters - 1],
+                "eigengap_estimate": estimate,
+            }
+        )
+
+    return rows
+
+
+def map_tasks(executor, function, tasks):
+    """Runs the tasks, tuples of arguments of function, on the executor or serially if it is None."""
+
+    if executor is None:
+        return [function(*task) for task in tasks]
+
+    return list(executor.map(function, *zip(*tasks)))
+
+
+def stability_task(
+    shared_neighbors,
+    layer,
+    n_neighbors,
+    n_clusters,
+    n_components,
+    eigen_solver,
+    seed,
+):
+    """
+    Clusters the vectors of one bootstrap resample of a layer, runs in a worker process.
+    The kNN graph of the resample is the shared graph of the layer restricted to the resampled vectors.
+    seed is None for the reference clustering of all vectors, its number of clusters is estimated if n_clusters is None.
+    Returns (layer, seed, sample, labels), sample is None for the reference clustering.
+    """
+
+    neighbors = attach(shared_neighbors)
+    sample = None
+    if seed is not None:
+        sample = bootstrap_sample(len(neighbors), np.random.RandomState(seed))
+
+    # 1. Spectral embedding of the restricted graph
+    eigenvalues, embedding = spectral_embedding(
+        connectivity_of_sample(neighbors, sample, n_neighbors),
+        max(n_components, n_clusters or 0),
+        eigen_solver,
+    )
+
+    if n_clusters is None:
+        n_clusters, _ = eigengap_estimate(eigenvalues[:n_components])
+
+    # 2. Cluster
+    labels = KMeans(n_clusters=n_clusters, n_init=10, random_state=1).fit_predict(
+        embedding[:, :n_clusters]
+    )
+
+    return layer, seed, sample, labels
+
+
+# artifacts stored per layer to assign the vectors of new samples, next to the spectral embedding
+ASSIGNMENT_ARTIFACTS = [
+    "reference_vectors",
+    "vector_labels",
+    "embedding_centers",
+    "k",
+    "n_neighbors",
+]
 
 
 class Clusterer:
     """Creates an clustering object, that clusters the read vectors of each layer."""
 
-    def __init__(self, path, show_plots=False):
+    def __init__(self, path, show_plots=False, storage=None):
         super(Clusterer, self).__init__()
 
         self.plotter = Plotter(path, show_plots)
@@ -23,11 +151,37 @@ class Clusterer:
         self.u_list = []
         self.vh_list = []
         self.clusters = []
+        self.embeddings = []
         self.ks = []
 
         self.number_of_layers = None
         self.side = None
         self.labels = None
+        self.max_number_of_clusters = 20
+        self.backend = "spectral"  # spectral, minibatch_kmeans or hierarchical
+        self.minibatch_params = {"batch_size": 10000, "n_epochs": 3, "init_size": 10000}
+        self.hierarchy_params = {
+            "linkage": "pca",  # pca: ward on PCA-reduced vectors, knn: ward along the kNN graph
+            "n_components": 32,
+        }
+        self.hierarchies = {}
+        self.eigen_solver = "auto"  # dense, arpack, lobpcg or auto, see spectral.smallest_eigenpairs
+        self.knn = "exact"  # exact or approximate, see knn.approximate_neighbors
+        self.knn_params = {}  # e.g. recall_target, n_components, n_trees of the approximate graph
+        self.knn_reports = {}
+        self.assignments = {}
+        self.reference_indices = {}
+        self.silhouette_params = {
+            "mode": "sample",  # sample: stratified estimate, exact: all vectors, see scoring.score_silhouette
+            "sample_size": 2000,
+        }
+
+        # storage and cache
+        self.storage = storage if storage is not None else get_storage()
+        self.precision = get_precision_policy()
+        self.cache = ArtifactCache(storage=self.storage)
+        self.reused = False
+        self.hierarchy_reused = False
 
     def load(self, side="left"):
 
@@ -37,74 +191,327 @@ class Clusterer:
 
         # config
         self.side = side
-        self.number_of_layers = len(next(os.walk(path))[1])
+        self.number_of_layers = 0
+        while self.storage.exists(
+            path + "/Layer" + str(self.number_of_layers) + "/k.npy"
+        ):
+            self.number_of_layers += 1
 
         # loop through layer folders
         for layer in range(self.number_of_layers):
 
             path_layer = path + "/Layer" + str(layer) + "/"
 
+            # memory mapped, the vectors are cast to the compute dtype by format_vectors
             if self.side == "left":
-                self.u_list.append(np.load(path_layer + "u.npy"))
+                self.u_list.append(
+                    load_npy(self.path, path_layer + "u.npy", storage=self.storage)
+                )
 
             elif self.side == "right":
-                self.vh_list.append(np.load(path_layer + "vh.npy"))
+                self.vh_list.append(
+                    load_npy(self.path, path_layer + "vh.npy", storage=self.storage)
+                )
 
-            self.ks.append(np.load(path_layer + "k.npy").item())
+            self.ks.append(self.storage.load(path_layer + "k.npy").item())
 
         pass
 
+    def get_results_path(self):
+        return "results/clusters/" + self.path + self.side + "/"
+
+    def get_embedding_path(self):
+        return self.get_results_path() + "embedding/"
+
+    def get_assignment_path(self):
+        return self.get_results_path() + "assignment/"
+
+    def get_hierarchy_path(self):
+        return self.get_results_path() + "hierarchy/"
+
+    def get_cache_key(self, config, stage="clusters"):
+        """Key of the clustering: decomposition, config and code version."""
+
+        upstream = [
+            self.cache.read_key("results/decompositions/" + self.path + self.side + "/")
+        ]
+        config = dict(config, side=self.side)
+        key = self.cache.compute_key(
+            stage, config, upstream, self.cache.get_code_version(self)
+        )
+
+        return key, config, upstream
+
+    def load_stored(self):
+        """Loads the stored clusters of all clustered layers."""
+
+        clusters = []
+        path = self.get_results_path()
+        for layer in self.get_layers_to_cluster():
+            path_layer = path + "Layer" + str(layer) + "/"
+            clusters.append(
+                tuple(
+                    self.storage.load(path_layer + name + ".npy")
+                    for name in ["number_of_clusters", "clusters", "center_of_clusters"]
+                )
+            )
+
+        return clusters
+
+    def load_stored_embeddings(self):
+        """Loads the stored spectral embeddings (eigenvalues, embedding) of all clustered layers."""
+
+        embeddings = []
+        path = self.get_embedding_path()
+        for layer in self.get_layers_to_cluster():
+            path_layer = path + "Layer" + str(layer) + "/"
+            embeddings.append(
+                tuple(
+                    self.storage.load(path_layer + name + ".npy")
+                    for name in ["eigenvalues", "spectral_embedding"]
+                )
+            )
+
+        return embeddings
+
     def store(self):
 
         # Set path to decompositions
-        path = "results/clusters/" + self.path + self.side + "/"
+        path = self.get_results_path()
+
+        if self.reused:
+            print("\nAlready stored in: ", path)
+            return
+
         print("\nStore in: ", path)
+        self.cache.invalidate(path)
+        registry.invalidate(self.path, path)
 
         # loop through layers
         for layer, clusters in enumerate(self.clusters):
 
-            # create folder
-            path_layer = path + "Layer" + str(layer) + "/"
-            if not os.path.exists(path_layer):
-                os.makedirs(path_layer)
-
             # store
+            path_layer = path + "Layer" + str(layer) + "/"
             for item, name in zip(
                 clusters, ["number_of_clusters", "clusters", "center_of_clusters"]
             ):
-                np.save(path_layer + name + ".npy", item)
+                self.storage.save(path_layer + name + ".npy", item)
+
+        # store the profile dictionary of each layer and the profile transitions from the previous layer
+        previous = None
+        for layer, profiles in enumerate(self.get_profiles()):
+            path_layer = path + "Layer" + str(layer) + "/"
+            for item, name in zip(
+                profiles, ["profiles", "profile_index", "profile_counts"]
+            ):
+                self.storage.save(path_layer + name + ".npy", item)
+
+            if previous is not None:
+                self.storage.save_sparse(
+                    path_layer + "transitions.npz",
+                    transition_counts(
+                        previous[1], profiles[1], len(previous[0]), len(profiles[0])
+                    ),
+                )
+            previous = profiles
+
+        # store what is needed to assign the vectors of new samples, see assign
+        # the artifacts of a previous clustering are removed, only the spectral backend supports assignment
+        path_assignment = self.get_assignment_path()
+        self.storage.remove(path_assignment)
+
+        for layer, assignment in self.assignments.items():
+            path_layer = path_assignment + "Layer" + str(layer) + "/"
+            for name in ASSIGNMENT_ARTIFACTS:
+                self.storage.save(
+                    path_layer + name + ".npy",
+                    self.precision.to_storage(name, assignment[name]),
+                )
+
+        # the assignment belongs to the clusters and the spectral embedding it was computed with
+        if self.assignments:
+            key, _, config, upstream = self.cache_entry
+            self.cache.write(
+                path_assignment,
+                key,
+                "assignment",
+                dict(config, embedding_key=self.embedding_cache_entry[0]),
+                upstream,
+            )
+
+        # store the spectral embeddings, unless they were reused
+        path_embedding = self.get_embedding_path()
+        if self.backend == "spectral" and not self.embedding_reused:
+            self.cache.invalidate(path_embedding)
+
+            for layer, embedding in enumerate(self.embeddings):
+                path_layer = path_embedding + "Layer" + str(layer) + "/"
+                for item, name in zip(embedding, ["eigenvalues", "spectral_embedding"]):
+                    self.storage.save(path_layer + name + ".npy", item)
+
+            self.cache.write(path_embedding, *self.embedding_cache_entry)
+
+        # store the linkages, unless they were reused
+        path_hierarchy = self.get_hierarchy_path()
+        if self.backend == "hierarchical" and not self.hierarchy_reused:
+            self.cache.invalidate(path_hierarchy)
+
+            for layer, hierarchy in self.hierarchies.items():
+                path_layer = path_hierarchy + "Layer" + str(layer) + "/"
+                self.storage.save(path_layer + "linkage.npy", hierarchy["linkage"])
+                self.storage.save(path_layer + "k.npy", np.array(hierarchy["k"]))
+
+            self.cache.write(path_hierarchy, *self.hierarchy_cache_entry)
+
+        # record what produced the artifact
+        self.cache.write(path, *self.cache_entry)
+
         pass
 
-    def format_vectors(self, layer, k):
-        if self.side == "left":
-            vectors = self.u_list[layer]
-            vectors = np.transpose(
-                vectors, (0, 2, 1)
-            )  # [sample, vector_index, next_dimension]
+    def get_decompositions(self, layer):
+        """Memory mapped U (left) or VH (right) matrices of the layer, one per sample."""
 
-            # take subset of first k dimensions
-            vectors = vectors[:, :k, :]
-            vectors = vectors.reshape(
-                -1, vectors.shape[1] * vectors.shape[2]
-            )  # this is different
+        if self.side == "left":
+            return self.u_list[layer]
 
         elif self.side == "right":
-            vectors = self.vh
+            return self.vh_list[layer]
+
+        raise Exception("Clusterer: invalid side " + str(self.side))
+
+    def get_vector_blocks(self, layer, u=None):
+        """
+        Vectors of each sample [sample, vector_index, dimension], from the loaded decomposition of the layer
+        or the U (left) / VH (right) matrices u of other samples. U is [sample, dimension, k], VH is [sample, k, dimension].
+        """
+
+        blocks = self.get_decompositions(layer) if u is None else u
+
+        if self.side == "left":
+            return np.transpose(blocks, (0, 2, 1))
+
+        return blocks
+
+    def get_profiles(self):
+        """Profile dictionary (profiles, profile_index, counts) of the clusters of each layer, see profiles.build_profiles."""
+        return [build_profiles(clusters[1]) for clusters in self.clusters]
+
+    def format_vectors(self, layer, k, u=None):
+        """Vectors to be clustered, from the loaded decomposition of the layer or the U / VH matrices u of other samples."""
+
+        vectors = self.get_vector_blocks(layer, u)
 
-        return vectors
+        # take subset of first k dimensions
+        vectors = vectors[:, :k, :]
+        vectors = vectors.reshape(
+            -1, vectors.shape[1] * vectors.shape[2]
+        )  # this is different
 
-    def format_cluster_labels(self, labels, layer, k):
+        return self.precision.to_compute(vectors)
+
+    def iter_vector_batches(self, layer, k, batch_size, rng=None):
+        """
+        Iterates over the vectors of a layer in batches of about batch_size vectors, that are read
+        from the memory mapped decomposition block by block. The order of the blocks is shuffled if rng is given.
+        """
+
+        u = self.get_decompositions(layer)
+        vectors_per_sample = len(self.format_vectors(layer, k, u[:1]))
+        samples_per_batch = max(1, batch_size // vectors_per_sample)
+
+        starts = np.arange(0, len(u), samples_per_batch)
+        if rng is not None:
+            starts = rng.permutation(starts)
+
+        for start in starts:
+            yield self.format_vectors(layer, k, u[start : start + samples_per_batch])
+
+    def sample_vectors(self, layer, k, size, rng):
+        """Vectors of a random sample of samples, about size vectors."""
+
+        u = self.get_decompositions(layer)
+        vectors_per_sample = len(self.format_vectors(layer, k, u[:1]))
+        n_samples = min(len(u), max(1, size // vectors_per_sample))
+        samples = np.sort(rng.choice(len(u), n_samples, replace=False))
+
+        return self.format_vectors(layer, k, u[samples])
+
+    def format_cluster_labels(self, labels, layer, k, u=None):
 
         return labels
 
+    def get_layers_to_cluster(self):
+        return range(self.number_of_layers)
+
     def cluster_all_layers(
         self, k=5, plot=True, n_neighbors=10, number_of_clusters=None
     ):
 
         # reset
         self.clusters = []
+        self.embeddings = []
+        self.assignments = {}
+        self.reference_indices = {}
+        self.hierarchies = {}
 
-        for layer in range(self.number_of_layers):
+        # number of eigenvectors of the embedding, enough for the eigengap and every requested number of clusters
+        n_components = max([self.max_number_of_clusters] + list(number_of_clusters or []))
+
+        # the spectral embedding does not depend on the number of clusters, it is reused if only that changes
+        embedding_config = {
+            "k": k,
+            "n_neighbors": n_neighbors,
+            "eigen_solver": self.eigen_solver,
+            "n_components": n_components,
+            "knn": self.knn,
+            "knn_params": self.knn_params,
+        }
+        key, config, upstream = self.get_cache_key(embedding_config, "spectral_embedding")
+        self.embedding_cache_entry = (key, "spectral_embedding", config, upstream)
+        self.embedding_reused = self.backend == "spectral" and self.cache.is_valid(
+            self.get_embedding_path(), key
+        )
+        stored_embeddings = (
+            self.load_stored_embeddings() if self.embedding_reused else None
+        )
+
+        # the linkage does not depend on the number of clusters either
+        hierarchy_config = {
+            "k": k,
+            "hierarchy_params": self.hierarchy_params,
+            "n_neighbors": n_neighbors,
+            "knn": self.knn,
+            "knn_params": self.knn_params,
+        }
+        key, config, upstream = self.get_cache_key(hierarchy_config, "hierarchy")
+        self.hierarchy_cache_entry = (key, "hierarchy", config, upstream)
+        self.hierarchy_reused = self.backend == "hierarchical" and self.cache.is_valid(
+            self.get_hierarchy_path(), key
+        )
+
+        # reuse the stored clusters if decomposition, config and code are unchanged
+        key, config, upstream = self.get_cache_key(
+            dict(
+                embedding_config,
+                number_of_clusters=number_of_clusters,
+                backend=self.backend,
+                minibatch_params=self.minibatch_params,
+                hierarchy_params=self.hierarchy_params,
+            )
+        )
+        self.cache_entry = (key, "clusters", config, upstream)
+        self.reused = (
+            self.embedding_reused
+            or self.hierarchy_reused
+            or self.backend == "minibatch_kmeans"
+        ) and self.cache.is_valid(self.get_results_path(), key)
+
+        if self.reused:
+            self.clusters = self.load_stored()
+            self.embeddings = stored_embeddings
+            return
+
+        for i, layer in enumerate(self.get_layers_to_cluster()):
 
             # 1. Cluster
             if (number_of_clusters is not None) and (layer < len(number_of_clusters)):
@@ -112,26 +519,246 @@ class Clusterer:
             else:
                 n_clusters = None
 
-            n_clusters, cluster_labels_formatted, centers = self.cluster_one_layer(
-                layer, k, plot, n_neighbors, n_clusters
-            )
+            if self.backend == "spectral":
+                embedding = (
+                    stored_embeddings[i] if stored_embeddings is not None else None
+                )
+                (
+                    n_clusters,
+                    cluster_labels_formatted,
+                    centers,
+                    embedding,
+                ) = self.cluster_one_layer(
+                    layer, k, plot, n_neighbors, n_clusters, embedding, n_components
+                )
+
+            elif self.backend == "minibatch_kmeans":
+                embedding = None
+                (
+                    n_clusters,
+                    cluster_labels_formatted,
+                    centers,
+                ) = self.cluster_one_layer_minibatch(layer, k, n_clusters)
+
+            elif self.backend == "hierarchical":
+                embedding = None
+                self.build_hierarchy(layer, k, n_neighbors)
+
+                if n_clusters is None:
+                    n_clusters = linkage_gap_estimate(
+                        self.hierarchies[layer]["linkage"], self.max_number_of_clusters
+                    )
+                    print("Number of Clusters from the linkage gap:", n_clusters)
+
+                n_clusters, cluster_labels_formatted, centers, _, _ = self.cut(
+                    layer, n_clusters
+                )
+
+            else:
+                raise Exception("Clusterer: invalid backend " + str(self.backend))
 
             # 2. Store
             self.clusters.append((n_clusters, cluster_labels_formatted, centers))
+            self.embeddings.append(embedding)
 
         pass
 
+    def sweep(
+        self,
+        k=5,
+        n_neighbors_list=(5, 10, 20, 30),
+        number_of_clusters_list=range(2, 21),
+        layers=None,
+        n_jobs=4,
+    ):
+        """
+        Evaluates a grid of (layer, n_neighbors, number of clusters) to choose the parameters of cluster_all_layers.
+        The kNN graph of the largest n_neighbors is built once per layer and shared with the worker processes,
+        each worker solves one eigenproblem per (layer, n_neighbors) and clusters its embedding for every number of clusters.
+        Returns a DataFrame with the silhouette score, the eigengap after n_clusters eigenvalues and the eigengap estimate.
+        """
+
+        if layers is None:
+            layers = self.get_layers_to_cluster()
+
+        number_of_clusters_list = list(number_of_clusters_list)
+        n_components = max(self.max_number_of_clusters, max(number_of_clusters_list) + 1)
+
+        # 1. Largest kNN graph of each layer, shared memory for the workers
+        tasks = []
+        for layer in layers:
+            vectors = np.ascontiguousarray(self.format_vectors(layer, k))
+            neighbors = self.get_neighbors(vectors, max(n_neighbors_list), layer)
+
+            path_sweep = "sweep/Layer" + str(layer) + "/"
+            shared_vectors = registry.share_array(
+                self.path, path_sweep + "vectors", vectors
+            )
+            shared_neighbors = registry.share_array(
+                self.path, path_sweep + "neighbors", neighbors
+            )
+
+            for n_neighbors in n_neighbors_list:
+                tasks.append(
+                    (
+                        shared_vectors,
+                        shared_neighbors,
+                        layer,
+                        n_neighbors,
+                        number_of_clusters_list,
+                        n_components,
+                        self.max_number_of_clusters,
+                        self.eigen_solver,
+                        self.silhouette_params,
+                    )
+                )
+
+        # 2. Evaluate the grid
+        try:
+            if n_jobs == 1:
+                results = [sweep_task(*task) for task in tasks]
+            else:
+                with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                    results = list(executor.map(sweep_task, *zip(*tasks)))
+        finally:
+            registry.invalidate(self.path, "sweep/")
+
+        return pd.DataFrame([row for rows in results for row in rows])
+
+    def stability(
+        self,
+        k=5,
+        n_neighbors=10,
+        number_of_clusters=None,
+        n_bootstraps=20,
+        layers=None,
+        n_jobs=4,
+        random_state=1,
+    ):
+        """
+        Bootstrap stability of the spectral clusters of each layer. The vectors of each layer are clustered once
+        (the reference) and for n_bootstraps resamples, on a process pool. The kNN graph is built once per layer,
+        with twice n_neighbors, and shared with the workers, the graph of a resample is restricted to its vectors.
+        Returns (stability, coassignments)
+            stability       - DataFrame with the mean and std of the Jaccard similarity of each reference cluster
+                              with its most similar resample cluster, values above 0.75 are commonly read as stable
+            coassignments   - per layer [clusters, clusters], share of the resampled vectors of a reference cluster (row)
+                              assigned to a resample cluster matched to a reference cluster (column)
+        """
+
+        if layers is None:
+            layers = self.get_layers_to_cluster()
+
+        rng = np.random.RandomState(random_state)
+        seeds = rng.randint(0, 2 ** 31 - 1, n_bootstraps)
+
+        # 1. kNN graph of each layer, shared memory for the workers
+        shared = {}
+        for layer in layers:
+            vectors = np.ascontiguousarray(self.format_vectors(layer, k))
+            neighbors = self.get_neighbors(vectors, 2 * n_neighbors, layer)
+            shared[layer] = registry.share_array(
+                self.path, "stability/Layer" + str(layer) + "/neighbors", neighbors
+            )
+
+        def get_tasks(seeds, n_clusters):
+            return [
+                (
+                    shared[layer],
+                    layer,
+                    n_neighbors,
+                    n_clusters[layer],
+                    self.max_number_of_clusters,
+                    self.eigen_solver,
+                    seed,
+                )
+                for layer in layers
+                for seed in seeds
+            ]
+
+        # 2. Reference clusterings, then the resamples with the same number of clusters
+        n_clusters = {
+            layer: number_of_clusters[layer]
+            if (number_of_clusters is not None) and (layer < len(number_of_clusters))
+            else None
+            for layer in layers
+        }
+        executor = ProcessPoolExecutor(max_workers=n_jobs) if n_jobs != 1 else None
+        try:
+            reference = {
+                layer: labels
+                for layer, _, _, labels in map_tasks(
+                    executor, stability_task, get_tasks([None], n_clusters)
+                )
+            }
+            n_clusters = {layer: int(labels.max()) + 1 for layer, labels in reference.items()}
+            results = map_tasks(executor, stability_task, get_tasks(seeds, n_clusters))
+
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            registry.invalidate(self.path, "stability/")
+
+        # 3. Jaccard similarities and co-assignments from the contingency tables
+        jaccards = {layer: [] for layer in layers}
+        coassignments = {layer: 0 for layer in layers}
+        for layer, _, sample, labels in results:
+            table = contingency_table(
+                reference[layer][sample], labels, n_clusters[layer], n_clusters[layer]
+            )
+            jaccards[layer].append(jaccard_from_contingency(table))
+            coassignments[layer] = coassignments[layer] + coassignment_from_contingency(
+                table
+            )
+
+        rows = []
+        for layer in layers:
+            jaccard = np.array(jaccards[layer])
+            coassignments[layer] = coassignments[layer] / np.maximum(
+                coassignments[layer].sum(axis=1, keepdims=True), 1
+            )
+
+            for cluster in range(n_clusters[layer]):
+                rows.append(
+                    {
+                        "layer": layer,
+                        "cluster": cluster,
+                        "size": int(np.sum(reference[layer] == cluster)),
+                        "jaccard_mean": np.nanmean(jaccard[:, cluster]),
+                        "jaccard_std": np.nanstd(jaccard[:, cluster]),
+                        "coassignment": coassignments[layer][cluster, cluster],
+                    }
+                )
+
+        return pd.DataFrame(rows), coassignments
+
     def cluster_one_layer(
-        self, layer, k=5, plot=True, n_neighbors=10, number_of_clusters=None
+        self,
+        layer,
+        k=5,
+        plot=True,
+        n_neighbors=10,
+        number_of_clusters=None,
+        embedding=None,
+        n_components=None,
     ):
+        """
+        Clusters the vectors of a layer. The spectral embedding (eigenvalues, embedding) is computed
+        once, if not given, and serves both the eigengap estimate and the k-means step.
+        """
 
         print("\n\n --- Layer: ", layer)
 
         # 1. Find number of clusters
         vectors = self.format_vectors(layer, k)
         print(vectors.shape)
-        n_clusters, affinity_matrix = self.find_number_of_clusters(
-            vectors, layer, plot=plot, n_neighbors=n_neighbors
+        n_clusters, embedding = self.find_number_of_clusters(
+            vectors,
+            layer,
+            plot=plot,
+            n_neighbors=n_neighbors,
+            embedding=embedding,
+            n_components=n_components,
         )
 
         # use custom number of clusters
@@ -139,8 +766,8 @@ class Clusterer:
             n_clusters = number_of_clusters
 
         # 2. Clustering
-        cluster_labels = self.cluster_vectors(
-            vectors, layer, affinity_matrix, n_clusters
+        cluster_labels, embedding_centers = self.cluster_vectors(
+            vectors, layer, embedding, n_clusters
         )
         cluster_labels_formatted = self.format_cluster_labels(cluster_labels, layer, k)
 
@@ -149,7 +776,152 @@ class Clusterer:
             vectors, layer, cluster_labels, n_clusters
         )
 
-        return n_clusters, cluster_labels_formatted, centers
+        # 4. Keep what is needed to assign the vectors of new samples
+        self.assignments[layer] = {
+            "reference_vectors": np.asarray(vectors),
+            "vector_labels": cluster_labels,
+            "embedding_centers": embedding_centers,
+            "k": k,
+            "n_neighbors": n_neighbors,
+            "eigenvalues": embedding[0],
+            "spectral_embedding": embedding[1],
+        }
+
+        return n_clusters, cluster_labels_formatted, centers, embedding
+
+    def cluster_one_layer_minibatch(self, layer, k=5, number_of_clusters=None):
+        """
+        Clusters the vectors of a layer by mini-batch k-means. The vectors are streamed from the
+        memory mapped U in batches, only the labels of all vectors are kept in memory.
+        The number of clusters is chosen by the silhouette score on the init sample, if not given.
+        """
+
+        print("\n\n --- Layer: ", layer)
+
+        params = self.minibatch_params
+        rng = np.random.RandomState(1)
+
+        def iter_batches():
+            return self.iter_vector_batches(layer, k, params["batch_size"], rng)
+
+        # 1. Sample for the k-means++ init
+        init_vectors = self.sample_vectors(layer, k, params["init_size"], rng)
+
+        if number_of_clusters is None:
+            number_of_clusters = self.find_number_of_clusters_on_sample(init_vectors)
+
+        # 2. Clustering
+        centers, _ = minibatch_kmeans(
+            iter_batches, init_vectors, number_of_clusters, params["n_epochs"]
+        )
+        cluster_labels, inertia, means = predict_batches(
+            lambda: self.iter_vector_batches(layer, k, params["batch_size"]), centers
+        )
+        cluster_labels_formatted = self.format_cluster_labels(cluster_labels, layer, k)
+
+        # stats, on the init sample
+        silhouette = score_silhouette(
+            init_vectors,
+            assign_to_centers(init_vectors, centers)[0],
+            **self.silhouette_params
+        )
+        print(
+            "Number of Clusters:",
+            number_of_clusters,
+            " - The average silhouette_score is :",
+            silhouette["silhouette"],
+            " - Inertia:",
+            inertia,
+        )
+
+        # 3. Centers, the means of the assigned vectors
+        centers = list(self.precision.to_compute(means))
+
+        return number_of_clusters, cluster_labels_formatted, centers
+
+    def build_hierarchy(self, layer, k=5, n_neighbors=10):
+        """
+        Builds the ward linkage of the vectors of a layer once, or loads it if stored for the same config,
+        see hierarchy.build_linkage. Any number of clusters is then cut from it by cut.
+        """
+
+        if layer in self.hierarchies and self.hierarchies[layer]["k"] == k:
+            return self.hierarchies[layer]
+
+        print("\n\n --- Layer: ", layer)
+
+        vectors = self.format_vectors(layer, k)
+
+        path_layer = self.get_hierarchy_path() + "Layer" + str(layer) + "/"
+        if self.hierarchy_reused and self.storage.load(path_layer + "k.npy").item() == k:
+            linkage = self.storage.load(path_layer + "linkage.npy")
+
+        else:
+            params = dict(self.hierarchy_params)
+            method = params.pop("linkage")
+            connectivity = None
+            if method == "knn":
+                connectivity = self.get_connectivity(vectors, n_neighbors, layer)
+
+            linkage = build_linkage(vectors, method, connectivity=connectivity, **params)
+
+        # the vectors are kept in memory, so that a cut does not read the decomposition again
+        self.hierarchies[layer] = {
+            "linkage": linkage,
+            "k": k,
+            "vectors": np.asarray(vectors),
+        }
+
+        return self.hierarchies[layer]
+
+    def cut(self, layer, n_clusters):
+        """
+        Cuts the linkage of a layer, built by build_hierarchy, into n_clusters clusters.
+        Returns (n_clusters, cluster labels formatted, centers, profiles, profile index),
+        the profiles are the distinct rows of the formatted labels and the profile index the profile of each row.
+        """
+
+        if layer not in self.hierarchies:
+            raise Exception(
+                "Clusterer: no hierarchy of layer " + str(layer) + ", call build_hierarchy first"
+            )
+
+        hierarchy = self.hierarchies[layer]
+        vectors = hierarchy["vectors"]
+
+        # 1. Labels
+        cluster_labels = cut_linkage(hierarchy["linkage"], n_clusters)
+        cluster_labels_formatted = self.format_cluster_labels(
+            cluster_labels, layer, hierarchy["k"]
+        )
+
+        # 2. Centers, the means of the vectors of each cluster
+        counts = np.bincount(cluster_labels, minlength=n_clusters)
+        means = sum_per_center(vectors, cluster_labels, n_clusters) / counts[:, None]
+        centers = list(self.precision.to_compute(means))
+
+        # 3. Profiles
+        profiles, profile_index, _ = build_profiles(cluster_labels_formatted)
+
+        return n_clusters, cluster_labels_formatted, centers, profiles, profile_index
+
+    def find_number_of_clusters_on_sample(self, vectors, max_number_of_clusters=None):
+        """Number of clusters with the best silhouette score of k-means on a sample of vectors."""
+
+        if max_number_of_clusters is None:
+            max_number_of_clusters = self.max_number_of_clusters
+
+        scores = []
+        candidates = range(2, min(max_number_of_clusters, len(vectors) - 1) + 1)
+        for n_clusters in candidates:
+            labels = KMeans(n_clusters=n_clusters, n_init=3, random_state=1).fit_predict(
+                vectors
+            )
+            scores.append(
+                score_silhouette(vectors, labels, **self.silhouette_params)["silhouette"]
+            )
+
+        return candidates[int(np.nanargmax(scores))]
 
     def get_center_of_clusters(self, vectors, layer, cluster_labels, n_clusters):
 
@@ -165,60 +937,169 @@ class Clusterer:
 
         return centers
 
-    def cluster_vectors(self, vectors, layer, affinity_matrix, n_clusters):
+    def cluster_vectors(self, vectors, layer, embedding, n_clusters):
 
-        # clustering
-        clusterer = SpectralClustering(
-            n_clusters=n_clusters, affinity="precomputed_nearest_neighbors",
-        )
-        cluster_labels = clusterer.fit_predict(affinity_matrix)
+        # clustering, k-means on the first n_clusters dimensions of the spectral embedding
+        _, embedding_vectors = embedding
+        if embedding_vectors.shape[1] < n_clusters:
+            raise Exception(
+                "Clusterer: the spectral embedding has less than "
+                + str(n_clusters)
+                + " dimensions"
+            )
 
-        # stats
-        silhouette_avg = silhouette_score(vectors, cluster_labels)
+        clusterer = KMeans(n_clusters=n_clusters, n_init=10, random_state=1)
+        cluster_labels = clusterer.fit_predict(embedding_vectors[:, :n_clusters])
+        embedding_centers = clusterer.cluster_centers_
+
+        # stats, estimated on a sample unless silhouette_params select the exact score
+        silhouette = score_silhouette(vectors, cluster_labels, **self.silhouette_params)
 
         print(
             "Number of Clusters:",
             n_clusters,
             " - The average silhouette_score is :",
-            silhouette_avg,
+            silhouette["silhouette"],
+            "[" + str(silhouette["lower"]) + ", " + str(silhouette["upper"]) + "]",
+        )
+
+        return cluster_labels, embedding_centers
+
+    def load_assignment(self, layer):
+        """
+        Loads what is needed to assign new vectors to the stored clusters of a layer.
+        The stored assignment has to match the key of the stored clusters and of the stored spectral embedding.
+        """
+
+        if layer not in self.assignments:
+            path_layer = self.get_assignment_path() + "Layer" + str(layer) + "/"
+            path_embedding = self.get_embedding_path() + "Layer" + str(layer) + "/"
+
+            manifest = self.cache.read_manifest(self.get_assignment_path())
+            if manifest is None or not self.storage.exists(path_layer + "k.npy"):
+                raise Exception(
+                    "Clusterer: no assignment stored for layer "
+                    + str(layer)
+                    + ", assignment needs clusters of the spectral backend"
+                )
+
+            if manifest["key"] != self.cache.read_key(
+                self.get_results_path()
+            ) or manifest["config"]["embedding_key"] != self.cache.read_key(
+                self.get_embedding_path()
+            ):
+                raise Exception(
+                    "Clusterer: the stored assignment does not belong to the stored clusters, recluster with the spectral backend"
+                )
+
+            assignment = {
+                name: self.precision.to_compute(self.storage.load(path_layer + name + ".npy"))
+                for name in ASSIGNMENT_ARTIFACTS
+            }
+            for name in ["eigenvalues", "spectral_embedding"]:
+                assignment[name] = self.storage.load(path_embedding + name + ".npy")
+
+            assignment["k"] = assignment["k"].item()
+            assignment["n_neighbors"] = assignment["n_neighbors"].item()
+            self.assignments[layer] = assignment
+
+        return self.assignments[layer]
+
+    def assign(self, u, layer, method="nystrom", n_neighbors=None):
+        """
+        Assigns the vectors of new samples to the existing clusters of a layer, without reclustering.
+        The cluster ids of the stored clustering are kept.
+        u           - U (left) or VH (right) matrices of the new samples
+        method      - nystrom: Nyström extension of the spectral embedding, the nearest k-means center in the embedding
+                    - vote: majority of the cluster labels of the nearest reference vectors
+        n_neighbors - number of nearest reference vectors, the n_neighbors of the clustering if None
+        Returns the cluster labels of the new samples, formatted like the stored clusters.
+        """
+
+        if self.backend != "spectral":
+            raise Exception(
+                "Clusterer: assign is not supported by the " + self.backend + " backend"
+            )
+
+        assignment = self.load_assignment(layer)
+        k = assignment["k"]
+        if n_neighbors is None:
+            n_neighbors = assignment["n_neighbors"]
+
+        vectors = self.format_vectors(layer, k, u)
+        n_clusters = len(assignment["embedding_centers"])
+
+        # 1. Nearest reference vectors, the index is built once per layer
+        if layer not in self.reference_indices:
+            self.reference_indices[layer] = NearestNeighbors().fit(
+                assignment["reference_vectors"]
+            )
+        neighbors = self.reference_indices[layer].kneighbors(
+            vectors, n_neighbors, return_distance=False
         )
 
-        return cluster_labels
+        # 2. Assign
+        if method == "vote":
+            votes = np.zeros((len(vectors), n_clusters), dtype=int)
+            rows = np.repeat(np.arange(len(vectors)), n_neighbors)
+            np.add.at(votes, (rows, assignment["vector_labels"][neighbors].ravel()), 1)
+            cluster_labels = np.argmax(votes, axis=1)
+
+        elif method == "nystrom":
+            # the embedding of a new vector is the mean embedding of its neighbors divided by the
+            # eigenvalue 1 - lambda of the normalized affinity matrix
+            eigenvalues = assignment["eigenvalues"][:n_clusters]
+            embedding = assignment["spectral_embedding"][:, :n_clusters]
+            embedding = embedding[neighbors].mean(axis=1) / np.maximum(
+                1 - eigenvalues, np.finfo(np.float32).eps
+            )
+
+            distances = np.sum(
+                (embedding[:, None, :] - assignment["embedding_centers"][None, :, :]) ** 2,
+                axis=2,
+            )
+            cluster_labels = np.argmin(distances, axis=1)
+
+        else:
+            raise Exception("Clusterer: invalid assignment method " + str(method))
+
+        return self.format_cluster_labels(cluster_labels, layer, k, u)
 
     def find_number_of_clusters(
         self,
         vectors,
         layer,
-        max_number_of_clusters=20,
+        max_number_of_clusters=None,
         size_of_candidate_clusters=2,
         plot=False,
         n_neighbors=10,
+        eigen_solver=None,
+        embedding=None,
+        n_components=None,
     ):
+        """
+        Estimates the number of clusters with the eigengap heuristic.
+        Returns (number of clusters, embedding), the embedding is computed if not given.
+        n_components    - number of eigenvectors of the embedding, at least max_number_of_clusters
+        """
 
-        # clustering
-        print("Start constructing nn-grpah")
-        connectivity = kneighbors_graph(
-            vectors, n_neighbors=n_neighbors, include_self=True, n_jobs=6
-        )
-        A = 0.5 * (connectivity + connectivity.T)
-
-        # eigengap heursitic
-
-        L = scipy.sparse.csgraph.laplacian(A, normed=True).todense()
-        eigenvalues, _ = np.linalg.eig(L)
-        eigenvalues = eigenvalues[0:max_number_of_clusters]
-
-        # compute gaps without considering only one cluster
-        gaps = np.diff(eigenvalues[1:])
-
-        # order gaps and correct indices
-        gaps_indices = np.argsort(gaps)[::-1] + 2
+        if max_number_of_clusters is None:
+            max_number_of_clusters = self.max_number_of_clusters
 
-        # select top x candidates and order from small to large
-        gaps_indices = np.sort(gaps_indices[:size_of_candidate_clusters])
-        optimal_gap = gaps_indices[0]
+        if embedding is None:
+            embedding = self.compute_spectral_embedding(
+                vectors,
+                max(max_number_of_clusters, n_components or 0),
+                n_neighbors,
+                eigen_solver,
+                layer,
+            )
 
-        print("Finished constructing nn-grpah")
+        # eigengap heursitic
+        eigenvalues = embedding[0][0:max_number_of_clusters]
+        optimal_gap, gaps_indices = eigengap_estimate(
+            eigenvalues, size_of_candidate_clusters
+        )
 
         # data for plotting the first n
         if plot:
@@ -236,4 +1117,55 @@ class Clusterer:
                 data, title="eigengap plot: " + str(gaps_indices), filename="eigengap_"
             )
 
-        return optimal_gap, A
+        return optimal_gap, embedding
+
+    def compute_spectral_embedding(
+        self, vectors, n_components, n_neighbors=10, eigen_solver=None, layer=None
+    ):
+        """
+        Spectral embedding of the kNN graph of the vectors, see spectral.spectral_embedding.
+        Returns (eigenvalues, embedding).
+        """
+
+        if eigen_solver is None:
+            eigen_solver = self.eigen_solver
+
+        # clustering
+        print("Start constructing nn-grpah")
+        connectivity = self.get_connectivity(vectors, n_neighbors, layer)
+        print("Finished constructing nn-grpah")
+
+        # only the smallest eigenpairs of the sparse Laplacian are computed
+        eigenvalues, embedding = spectral_embedding(
+            connectivity, n_components, eigen_solver
+        )
+
+        return eigenvalues, self.precision.to_compute(embedding)
+
+    def get_connectivity(self, vectors, n_neighbors=10, layer=None):
+        """Connectivity matrix of the kNN graph of the vectors, the vectors themselves included."""
+        return connectivity_from_indices(
+            self.get_neighbors(vectors, n_neighbors, layer)
+        )
+
+    def get_neighbors(self, vectors, n_neighbors=10, layer=None):
+        """
+        Indices of the n_neighbors nearest neighbors of each vector, sorted by distance, the vector itself included.
+        The approximate neighbors report their recall measured against the exact neighbors of a sample.
+        """
+
+        if self.knn == "exact":
+            neighbors = NearestNeighbors(n_neighbors=n_neighbors, n_jobs=6).fit(vectors)
+            return neighbors.kneighbors(vectors, return_distance=False)
+
+        elif self.knn == "approximate":
+            indices, _, report = approximate_neighbors(
+                vectors, n_neighbors=n_neighbors, **self.knn_params
+            )
+            print("Approximate nn-graph:", report)
+            self.knn_reports[layer] = report
+
+            return indices
+
+        else:
+            raise Exception("Clusterer: invalid knn " + str(self.knn))
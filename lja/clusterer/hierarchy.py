@@ -0,0 +1,92 @@
+import warnings
+import numpy as np
+import scipy.cluster.hierarchy
+from sklearn.cluster import ward_tree
+from lja.clusterer.knn import reduce_dimension
+
+
+def linkage_from_children(children, distances, n_leaves):
+    """Converts the merge tree of sklearn (children, distances) to a scipy linkage matrix."""
+
+    counts = np.ones(2 * n_leaves - 1)
+    for i, (a, b) in enumerate(children):
+        counts[n_leaves + i] = counts[a] + counts[b]
+
+    return np.column_stack(
+        (children, distances, counts[n_leaves:]),
+    ).astype(np.float64)
+
+
+def build_linkage(vectors, method="pca", n_components=32, connectivity=None):
+    """
+    Ward linkage of the vectors, built once and cut for any number of clusters.
+    method  - pca: ward on the vectors projected on their first n_components principal components
+            - knn: ward restricted to merges along the kNN graph given by connectivity, memory linear in the vectors
+    """
+
+    X = reduce_dimension(np.asarray(vectors, dtype=np.float64), n_components)
+
+    if method == "pca":
+        return scipy.cluster.hierarchy.linkage(X, method="ward")
+
+    elif method == "knn":
+        if connectivity is None:
+            raise Exception("Clusterer: the knn linkage needs a connectivity matrix")
+
+        # components of the graph are connected by sklearn, with a warning
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            children, _, n_leaves, _, distances = ward_tree(
+                X, connectivity=connectivity, return_distance=True
+            )
+
+        # merges are not strictly ordered by distance on a graph
+        distances = np.maximum.accumulate(distances)
+
+        return linkage_from_children(children, distances, n_leaves)
+
+    else:
+        raise Exception("Clusterer: invalid linkage " + str(method))
+
+
+def cut_linkage(Z, n_clusters):
+    """
+    Labels of the clustering with exactly n_clusters clusters, the state of the tree before its last n_clusters - 1 merges.
+    Labels are ordered by cluster size, 0 is the largest cluster.
+    """
+
+    # the merge index is a strictly increasing height, ties of the distances cannot merge additional clusters
+    Z_ranked = np.array(Z)
+    Z_ranked[:, 2] = np.arange(1, len(Z) + 1)
+    n_vectors = len(Z) + 1
+
+    labels = scipy.cluster.hierarchy.fcluster(
+        Z_ranked, t=n_vectors - n_clusters + 0.5, criterion="distance"
+    )
+
+    # order by size
+    _, labels, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    rank = np.empty(len(counts), dtype=int)
+    rank[np.argsort(-counts, kind="stable")] = np.arange(len(counts))
+
+    return rank[labels]
+
+
+def linkage_gap_estimate(Z, max_number_of_clusters=20):
+    """
+    Number of clusters before the largest jump of the merge distances, like the eigengap heuristic.
+    The j-th merge from the top (j = 0 is the last merge) joins j + 2 clusters into j + 1, so cutting
+    between the merges j and j + 1 from the top leaves j + 2 clusters.
+    """
+
+    distances = Z[:, 2]
+    max_number_of_clusters = min(max_number_of_clusters, len(distances))
+
+    if max_number_of_clusters < 2:
+        return 1
+
+    # gaps[j] is the jump between the merges j and j + 1 from the top, a cut in between leaves j + 2 clusters
+    top = distances[::-1][:max_number_of_clusters]
+    gaps = top[:-1] - top[1:]
+
+    return int(np.argmax(gaps) + 2)
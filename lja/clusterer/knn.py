@@ -0,0 +1,222 @@
+import numpy as np
+import scipy.sparse
+from sklearn.decomposition import PCA
+
+# number of floats of the temporary arrays of a block of distance computations
+BLOCK_SIZE = 2 ** 24
+
+
+def reduce_dimension(vectors, n_components, random_state=1):
+    """Projects the vectors on their first n_components principal components."""
+
+    if n_components is None or n_components >= vectors.shape[1]:
+        return vectors
+
+    pca = PCA(n_components=n_components, svd_solver="randomized", random_state=random_state)
+    return pca.fit_transform(vectors).astype(vectors.dtype, copy=False)
+
+
+def squared_distances(X, rows, columns):
+    """Squared euclidean distances between the vectors X[rows] and X[columns]."""
+
+    D = (
+        np.sum(X[rows] ** 2, axis=1)[:, None]
+        + np.sum(X[columns] ** 2, axis=1)[None, :]
+        - 2 * X[rows] @ X[columns].T
+    )
+    return np.maximum(D, 0)
+
+
+def merge_neighbors(indices, distances, candidate_indices, candidate_distances):
+    """Merges candidate neighbors into the current neighbors of each vector, keeping the closest distinct ones."""
+
+    n_neighbors = indices.shape[1]
+    indices = np.concatenate((indices, candidate_indices), axis=1)
+    distances = np.concatenate((distances, candidate_distances), axis=1)
+
+    # drop repeated candidates, the closest copy is kept
+    order = np.lexsort((distances, indices), axis=1)
+    indices = np.take_along_axis(indices, order, axis=1)
+    distances = np.take_along_axis(distances, order, axis=1)
+    distances[:, 1:][indices[:, 1:] == indices[:, :-1]] = np.inf
+
+    # keep the closest, sorted by distance
+    order = np.argsort(distances, axis=1, kind="stable")[:, :n_neighbors]
+
+    return (
+        np.take_along_axis(indices, order, axis=1),
+        np.take_along_axis(distances, order, axis=1),
+    )
+
+
+def rp_tree_leaves(X, leaf_size, rng):
+    """
+    Splits the vectors recursively by random hyperplanes, the normal of each hyperplane is the difference
+    of two random vectors of the node and the node is split at the median of the projections.
+    Returns the indices of the vectors of each leaf.
+    """
+
+    leaves = []
+    nodes = [np.arange(len(X))]
+
+    while nodes:
+        node = nodes.pop()
+
+        if len(node) <= leaf_size:
+            leaves.append(node)
+            continue
+
+        a, b = rng.choice(node, 2, replace=False)
+        projection = X[node] @ (X[a] - X[b])
+        mask = projection < np.median(projection)
+
+        # degenerated split, e.g. identical vectors
+        if mask.all() or not mask.any():
+            mask = rng.permutation(len(node)) < len(node) // 2
+
+        nodes.append(node[mask])
+        nodes.append(node[~mask])
+
+    return leaves
+
+
+def tree_neighbors(X, n_neighbors, leaf_size, rng):
+    """Candidate neighbors of each vector among the vectors of its leaf in one random projection tree."""
+
+    N = len(X)
+    indices = np.tile(np.arange(N)[:, None], (1, n_neighbors))
+    distances = np.full((N, n_neighbors), np.inf, dtype=np.float64)
+
+    for leaf in rp_tree_leaves(X, leaf_size, rng):
+        D = squared_distances(X, leaf, leaf)
+        m = min(n_neighbors, len(leaf))
+        order = np.argsort(D, axis=1)[:, :m]
+        indices[leaf, :m] = leaf[order]
+        distances[leaf, :m] = np.take_along_axis(D, order, axis=1)
+
+    return indices, distances
+
+
+def refine_neighbors(X, indices, distances):
+    """One round of neighbor descent: the neighbors of the neighbors of each vector become candidates."""
+
+    N, n_neighbors = indices.shape
+    block = max(1, BLOCK_SIZE // (n_neighbors * n_neighbors * X.shape[1]))
+    squared_norms = np.sum(X ** 2, axis=1)
+
+    new_indices = np.empty_like(indices)
+    new_distances = np.empty_like(distances)
+
+    for start in range(0, N, block):
+        rows = np.arange(start, min(start + block, N))
+        candidates = indices[indices[rows]].reshape(len(rows), -1)
+
+        D = (
+            squared_norms[rows][:, None]
+            + squared_norms[candidates]
+            - 2 * np.einsum("id,ijd->ij", X[rows], X[candidates])
+        )
+
+        new_indices[rows], new_distances[rows] = merge_neighbors(
+            indices[rows], distances[rows], candidates, np.maximum(D, 0)
+        )
+
+    return new_indices, new_distances
+
+
+def exact_neighbors(vectors, rows, n_neighbors):
+    """Exact neighbors of the vectors[rows] among all vectors, computed blockwise."""
+
+    block = max(1, BLOCK_SIZE // len(vectors))
+    indices = []
+
+    for start in range(0, len(rows), block):
+        D = squared_distances(vectors, rows[start : start + block], np.arange(len(vectors)))
+        indices.append(np.argsort(D, axis=1)[:, :n_neighbors])
+
+    return np.concatenate(indices)
+
+
+def measure_recall(vectors, indices, sample):
+    """Share of the exact neighbors of the sampled vectors, that are found by the approximate neighbors."""
+
+    exact = exact_neighbors(vectors, sample, indices.shape[1])
+    found = (indices[sample][:, :, None] == exact[:, None, :]).any(axis=2)
+
+    return float(found.mean())
+
+
+def approximate_neighbors(
+    vectors,
+    n_neighbors=10,
+    n_trees=8,
+    leaf_size=None,
+    n_components=None,
+    recall_target=0.9,
+    max_iterations=5,
+    n_recall_samples=256,
+    random_state=1,
+):
+    """
+    Approximate k nearest neighbors, the vector itself included, by a forest of random projection trees
+    refined by neighbor descent rounds until the recall measured on a sample reaches recall_target.
+    n_components    - dimension of a PCA projection the neighbors are searched in, no projection if None
+    Returns (indices, distances, report), the neighbors of each vector sorted by their distance.
+    """
+
+    rng = np.random.RandomState(random_state)
+    vectors = np.asarray(vectors)
+    N = len(vectors)
+    n_neighbors = min(n_neighbors, N)
+
+    if leaf_size is None:
+        leaf_size = max(5 * n_neighbors, 64)
+
+    # 1. Reduce dimension
+    X = reduce_dimension(vectors, n_components, random_state)
+
+    # 2. Candidates of a forest of random projection trees
+    indices = np.tile(np.arange(N)[:, None], (1, n_neighbors))
+    distances = np.full((N, n_neighbors), np.inf, dtype=np.float64)
+    for _ in range(n_trees):
+        indices, distances = merge_neighbors(
+            indices, distances, *tree_neighbors(X, n_neighbors, leaf_size, rng)
+        )
+
+    # 3. Refine until the recall target is reached, measured against the exact neighbors of a sample
+    sample = np.sort(rng.choice(N, min(N, n_recall_samples), replace=False))
+    recall = measure_recall(vectors, indices, sample)
+    iterations = 0
+
+    while recall < recall_target and iterations < max_iterations:
+        indices, distances = refine_neighbors(X, indices, distances)
+        recall = measure_recall(vectors, indices, sample)
+        iterations += 1
+
+    report = {
+        "recall": recall,
+        "recall_target": recall_target,
+        "refinement_iterations": iterations,
+        "n_trees": n_trees,
+        "n_components": X.shape[1],
+        "n_recall_samples": len(sample),
+    }
+
+    return indices, distances, report
+
+
+def connectivity_from_indices(indices, number_of_vectors=None):
+    """Sparse connectivity matrix of the neighbors, like kneighbors_graph(mode="connectivity")."""
+
+    N, n_neighbors = indices.shape
+    if number_of_vectors is None:
+        number_of_vectors = N
+
+    return scipy.sparse.csr_matrix(
+        (
+            np.ones(N * n_neighbors),
+            indices.ravel(),
+            np.arange(0, N * n_neighbors + 1, n_neighbors),
+        ),
+        shape=(N, number_of_vectors),
+    )
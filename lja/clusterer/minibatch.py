@@ -0,0 +1,99 @@
+import numpy as np
+import scipy.sparse
+from sklearn.cluster import kmeans_plusplus
+
+
+def squared_distances_to_centers(vectors, centers):
+    """Squared euclidean distances [vectors, centers]."""
+
+    D = (
+        np.sum(vectors ** 2, axis=1)[:, None]
+        + np.sum(centers ** 2, axis=1)[None, :]
+        - 2 * vectors @ centers.T
+    )
+    return np.maximum(D, 0)
+
+
+def sum_per_center(vectors, labels, n_clusters):
+    """Sums of the vectors assigned to each center, as product with the sparse one-hot assignment matrix."""
+
+    assignment = scipy.sparse.csr_matrix(
+        (np.ones(len(labels)), (labels, np.arange(len(labels)))),
+        shape=(n_clusters, len(labels)),
+    )
+    return np.asarray(assignment @ vectors)
+
+
+def assign_to_centers(vectors, centers):
+    """Returns (labels, squared distances) of the nearest center of each vector."""
+
+    D = squared_distances_to_centers(vectors, centers)
+    labels = np.argmin(D, axis=1)
+
+    return labels, D[np.arange(len(vectors)), labels]
+
+
+def minibatch_kmeans(
+    iter_batches,
+    init_vectors,
+    n_clusters,
+    n_epochs=3,
+    random_state=1,
+):
+    """
+    Mini-batch k-means on vectors that are streamed in batches, so only one batch is held in memory.
+    iter_batches    - function returning an iterator over the batches of vectors, called once per epoch
+    init_vectors    - sample of the vectors, the centers are initialised by k-means++ on it
+    Each center moves towards the mean of its assigned batch vectors with learning rate batch count / total count,
+    so after an epoch a center is the running mean of all vectors assigned to it.
+    Returns (centers, counts).
+    """
+
+    # 1. k-means++ init on the sample
+    centers, _ = kmeans_plusplus(
+        np.asarray(init_vectors, dtype=np.float64), n_clusters, random_state=random_state
+    )
+    counts = np.zeros(n_clusters)
+
+    # 2. Vectorized center updates per batch
+    for epoch in range(n_epochs):
+        for batch in iter_batches():
+            batch = np.asarray(batch, dtype=np.float64)
+            labels, _ = assign_to_centers(batch, centers)
+
+            batch_counts = np.bincount(labels, minlength=n_clusters)
+            batch_sums = sum_per_center(batch, labels, n_clusters)
+
+            counts += batch_counts
+            updated = batch_counts > 0
+            centers[updated] += (
+                batch_sums[updated] - batch_counts[updated, None] * centers[updated]
+            ) / counts[updated, None]
+
+    return centers, counts
+
+
+def predict_batches(iter_batches, centers):
+    """
+    Labels of all streamed vectors, their inertia and the means of the vectors assigned to each center.
+    Centers without vectors keep their position as mean.
+    """
+
+    labels = []
+    inertia = 0.0
+    sums = np.zeros_like(centers, dtype=np.float64)
+    counts = np.zeros(len(centers))
+
+    for batch in iter_batches():
+        batch = np.asarray(batch, dtype=np.float64)
+        batch_labels, distances = assign_to_centers(batch, centers)
+
+        labels.append(batch_labels)
+        inertia += distances.sum()
+        sums += sum_per_center(batch, batch_labels, len(centers))
+        counts += np.bincount(batch_labels, minlength=len(centers))
+
+    means = np.array(centers, dtype=np.float64)
+    means[counts > 0] = sums[counts > 0] / counts[counts > 0, None]
+
+    return np.concatenate(labels), inertia, means
@@ -0,0 +1,31 @@
+import numpy as np
+import scipy.sparse
+
+
+def build_profiles(labels):
+    """
+    Profile dictionary of the cluster labels of a layer, a profile is a distinct row of labels.
+    Returns (profiles, profile_index, counts), profiles [profiles, k] are sorted like np.unique,
+    profile_index is the profile of each sample and counts the number of samples of each profile.
+    """
+
+    labels = np.asarray(labels)
+    profiles, profile_index, counts = np.unique(
+        labels.reshape(len(labels), -1), axis=0, return_inverse=True, return_counts=True
+    )
+
+    return profiles, profile_index.ravel(), counts
+
+
+def transition_counts(previous_index, profile_index, n_previous, n_profiles):
+    """Sparse number of samples of each pair (profile of the previous layer, profile) [n_previous, n_profiles]."""
+
+    return scipy.sparse.csr_matrix(
+        (np.ones(len(profile_index)), (previous_index, profile_index)),
+        shape=(n_previous, n_profiles),
+    )
+
+
+def majority_previous_profile(transitions):
+    """Most frequent profile of the previous layer of the samples of each profile, ties go to the smallest index."""
+    return np.asarray(transitions.argmax(axis=0)).ravel()
@@ -0,0 +1,128 @@
+import numpy as np
+import scipy.stats
+
+# number of floats of the distance block of a chunk of rows
+BLOCK_SIZE = 2 ** 24
+
+
+def silhouette_samples_blocked(vectors, labels, rows=None, block_size=BLOCK_SIZE):
+    """
+    Exact silhouette values of the vectors[rows] (all if None) against all vectors.
+    The distances are computed in chunks of rows, so memory is bounded by block_size floats.
+    """
+
+    vectors = np.asarray(vectors)
+    _, labels = np.unique(labels, return_inverse=True)
+    N = len(vectors)
+
+    if rows is None:
+        rows = np.arange(N)
+
+    # cluster memberships
+    counts = np.bincount(labels)
+    membership = np.zeros((N, len(counts)), dtype=vectors.dtype)
+    membership[np.arange(N), labels] = 1
+
+    squared_norms = np.sum(vectors.astype(np.float64) ** 2, axis=1)
+    chunk = max(1, block_size // N)
+    values = np.empty(len(rows))
+
+    for start in range(0, len(rows), chunk):
+        chunk_rows = rows[start : start + chunk]
+
+        # 1. Distances of the chunk to all vectors
+        D = (
+            squared_norms[chunk_rows][:, None]
+            + squared_norms[None, :]
+            - 2 * (vectors[chunk_rows] @ vectors.T)
+        )
+        D = np.sqrt(np.maximum(D, 0))
+
+        # 2. Sum of distances to each cluster
+        sums = D @ membership
+        own = labels[chunk_rows]
+        index = np.arange(len(chunk_rows))
+
+        # 3. Mean distance to the own cluster (without itself) and to the nearest other cluster
+        own_counts = counts[own] - 1
+        a = sums[index, own] / np.maximum(own_counts, 1)
+        means = sums / counts[None, :]
+        means[index, own] = np.inf
+        b = np.min(means, axis=1)
+
+        s = (b - a) / np.maximum(np.maximum(a, b), np.finfo(np.float64).tiny)
+
+        # silhouette of vectors in singleton clusters is 0
+        s[own_counts == 0] = 0
+        values[start : start + chunk] = s
+
+    return values
+
+
+def stratified_sample(labels, sample_size, rng):
+    """Sample of indices with a share of each cluster proportional to its size, at least one per cluster."""
+
+    sample = []
+    for label in np.unique(labels):
+        members = np.where(labels == label)[0]
+        n = int(np.clip(round(sample_size * len(members) / len(labels)), 1, len(members)))
+        sample.append(rng.choice(members, n, replace=False))
+
+    return np.sort(np.concatenate(sample))
+
+
+def score_silhouette(
+    vectors,
+    labels,
+    mode="sample",
+    sample_size=2000,
+    confidence=0.95,
+    block_size=BLOCK_SIZE,
+    random_state=1,
+):
+    """
+    Silhouette score of a clustering.
+    mode    - sample: estimated from the exact silhouette values of a stratified sample of vectors, with a confidence interval
+            - exact: mean of the silhouette values of all vectors, computed blockwise
+    Returns a dict with the score, the bounds of the confidence interval and the number of scored vectors.
+    """
+
+    labels = np.asarray(labels)
+    N = len(labels)
+
+    if len(np.unique(labels)) < 2:
+        return {"silhouette": np.nan, "lower": np.nan, "upper": np.nan, "n_scored": 0}
+
+    if mode == "exact" or sample_size >= N:
+        score = float(np.mean(silhouette_samples_blocked(vectors, labels, None, block_size)))
+        return {"silhouette": score, "lower": score, "upper": score, "n_scored": N}
+
+    elif mode != "sample":
+        raise Exception("Clusterer: invalid silhouette mode " + str(mode))
+
+    # 1. Silhouette values of a stratified sample
+    rng = np.random.RandomState(random_state)
+    sample = stratified_sample(labels, sample_size, rng)
+    values = silhouette_samples_blocked(vectors, labels, sample, block_size)
+
+    # 2. Stratified estimate of the mean and its variance
+    score, variance = 0.0, 0.0
+    for label in np.unique(labels):
+        stratum = values[labels[sample] == label]
+        weight = np.sum(labels == label) / N
+        score += weight * np.mean(stratum)
+
+        if len(stratum) > 1:
+            correction = 1 - len(stratum) / np.sum(labels == label)
+            variance += weight ** 2 * np.var(stratum, ddof=1) / len(stratum) * correction
+
+    # 3. Confidence interval
+    z = scipy.stats.norm.ppf(0.5 + confidence / 2)
+    margin = z * np.sqrt(variance)
+
+    return {
+        "silhouette": float(score),
+        "lower": float(score - margin),
+        "upper": float(score + margin),
+        "n_scored": len(sample),
+    }
@@ -0,0 +1,122 @@
+import numpy as np
+import scipy
+import scipy.sparse
+import scipy.sparse.csgraph
+import scipy.sparse.linalg
+
+# number of vectors up to which the auto solver uses the dense and the shift-invert solver
+DENSE_LIMIT = 1000
+ARPACK_LIMIT = 20000
+
+
+def get_laplacian(affinity_matrix):
+    """
+    Normalized graph Laplacian of a symmetric sparse affinity matrix, kept sparse.
+    Returns (L, sqrt_degrees), sqrt_degrees is the eigenvector of eigenvalue 0 of a connected graph.
+    """
+
+    A = scipy.sparse.csr_matrix(affinity_matrix, dtype=np.float64)
+    L, sqrt_degrees = scipy.sparse.csgraph.laplacian(A, normed=True, return_diag=True)
+
+    return scipy.sparse.csr_matrix(L), sqrt_degrees
+
+
+def get_eigen_solver(number_of_vectors, eigen_solver="auto"):
+
+    if eigen_solver != "auto":
+        return eigen_solver
+
+    if number_of_vectors <= DENSE_LIMIT:
+        return "dense"
+
+    elif number_of_vectors <= ARPACK_LIMIT:
+        return "arpack"
+
+    return "lobpcg"
+
+
+def smallest_eigenpairs(
+    L, n, eigen_solver="auto", random_state=1, tol=1e-6, initial_vector=None
+):
+    """
+    Computes the n smallest eigenvalues and eigenvectors of a symmetric normalized Laplacian.
+    Returns (eigenvalues, eigenvectors), sorted ascending, eigenvectors are the columns.
+    eigen_solver    - dense: full symmetric solver, for small graphs
+                    - arpack: shift-invert Lanczos, only the requested eigenpairs
+                    - lobpcg: block preconditioned solver, scales to 100k+ vectors
+                    - auto: chosen by the number of vectors
+    initial_vector  - approximation of the first eigenvector, e.g. sqrt_degrees of get_laplacian
+    """
+
+    N = L.shape[0]
+    n = min(n, N)
+    eigen_solver = get_eigen_solver(N, eigen_solver)
+
+    # the sparse solvers need a few more vectors than requested eigenpairs
+    if eigen_solver != "dense" and N <= 5 * n:
+        eigen_solver = "dense"
+
+    if eigen_solver == "dense":
+        L = L.toarray() if scipy.sparse.issparse(L) else np.asarray(L)
+        eigenvalues, eigenvectors = np.linalg.eigh(L)
+        eigenvalues, eigenvectors = eigenvalues[:n], eigenvectors[:, :n]
+
+    elif eigen_solver == "arpack":
+        # the eigenvalues of -L lie in [-2, 0], shift-invert around 1 returns
+        # the largest of -L (the smallest of L) and keeps the factorized matrix regular
+        v0 = np.random.RandomState(random_state).uniform(-1, 1, N)
+        eigenvalues, eigenvectors = scipy.sparse.linalg.eigsh(
+            -L, k=n, sigma=1.0, which="LM", tol=tol, v0=v0
+        )
+        eigenvalues = -eigenvalues
+
+    elif eigen_solver == "lobpcg":
+        X = np.random.RandomState(random_state).normal(size=(N, n))
+        if initial_vector is not None:
+            X[:, 0] = initial_vector
+        eigenvalues, eigenvectors = scipy.sparse.linalg.lobpcg(
+            L, X, tol=tol, largest=False, maxiter=2000
+        )
+
+    else:
+        raise Exception("Clusterer: invalid eigen solver " + str(eigen_solver))
+
+    # sort ascending
+    order = np.argsort(eigenvalues)
+
+    return eigenvalues[order], eigenvectors[:, order]
+
+
+def spectral_embedding(connectivity, n_components, eigen_solver="auto"):
+    """
+    Spectral embedding of a kNN graph given by its connectivity matrix.
+    Returns (eigenvalues, embedding) of the n_components smallest eigenvalues of the normalized Laplacian,
+    the embedding are the eigenvectors divided by the square root of the degrees, as in SpectralClustering.
+    """
+
+    A = 0.5 * (connectivity + connectivity.T)
+
+    L, sqrt_degrees = get_laplacian(A)
+    eigenvalues, eigenvectors = smallest_eigenpairs(
+        L, n_components, eigen_solver, initial_vector=sqrt_degrees
+    )
+
+    return eigenvalues, eigenvectors / sqrt_degrees[:, None]
+
+
+def eigengap_estimate(eigenvalues, size_of_candidate_clusters=2):
+    """
+    Eigengap heuristic on sorted eigenvalues.
+    Returns (number of clusters, candidates), the candidates are the numbers of clusters of the largest gaps.
+    """
+
+    # compute gaps without considering only one cluster
+    gaps = np.diff(eigenvalues[1:])
+
+    # order gaps and correct indices
+    gaps_indices = np.argsort(gaps)[::-1] + 2
+
+    # select top x candidates and order from small to large
+    gaps_indices = np.sort(gaps_indices[:size_of_candidate_clusters])
+
+    return gaps_indices[0], gaps_indices
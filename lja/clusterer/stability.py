@@ -0,0 +1,75 @@
+import numpy as np
+import scipy.sparse
+from lja.clusterer.knn import connectivity_from_indices
+
+
+def bootstrap_sample(number_of_vectors, rng):
+    """Distinct indices of a bootstrap resample, drawn with replacement, about 63% of the vectors."""
+    return np.unique(rng.randint(0, number_of_vectors, number_of_vectors))
+
+
+def restrict_neighbors(neighbors, sample, n_neighbors):
+    """
+    Connectivity matrix of the kNN graph restricted to the vectors of the sample.
+    neighbors are sorted by distance and include the vector itself, so every vector keeps at least itself.
+    Each vector keeps its first n_neighbors neighbors that are part of the sample.
+    """
+
+    position = np.full(len(neighbors), -1)
+    position[sample] = np.arange(len(sample))
+
+    candidates = position[neighbors[sample]]
+    keep = candidates >= 0
+    keep &= np.cumsum(keep, axis=1) <= n_neighbors
+
+    rows = np.repeat(np.arange(len(sample)), keep.sum(axis=1))
+
+    return scipy.sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, candidates[keep])), shape=(len(sample), len(sample))
+    )
+
+
+def contingency_table(reference_labels, labels, n_reference, n_labels):
+    """Number of vectors of each pair (reference cluster, cluster) [n_reference, n_labels]."""
+
+    table = scipy.sparse.coo_matrix(
+        (np.ones(len(labels)), (reference_labels, labels)), shape=(n_reference, n_labels)
+    )
+    return table.toarray()
+
+
+def jaccard_from_contingency(table):
+    """
+    Jaccard similarity of each reference cluster with its most similar cluster of a resample,
+    restricted to the vectors of the resample. Clusters without vectors in the resample are nan.
+    """
+
+    reference_sizes = table.sum(axis=1)
+    sizes = table.sum(axis=0)
+    union = reference_sizes[:, None] + sizes[None, :] - table
+    jaccard = np.max(table / np.maximum(union, 1), axis=1)
+    jaccard[reference_sizes == 0] = np.nan
+
+    return jaccard
+
+
+def coassignment_from_contingency(table):
+    """
+    Number of vectors of each reference cluster (rows), that are assigned to a resample cluster matched to
+    each reference cluster (columns). A resample cluster is matched to the reference cluster most of its vectors belong to.
+    """
+
+    match = np.argmax(table, axis=0)
+    coassignment = np.zeros((table.shape[0], table.shape[0]))
+    np.add.at(coassignment.T, match, table.T)
+
+    return coassignment
+
+
+def connectivity_of_sample(neighbors, sample, n_neighbors):
+    """Connectivity of the full kNN graph if sample is None, of the graph restricted to the sample otherwise."""
+
+    if sample is None:
+        return connectivity_from_indices(neighbors[:, :n_neighbors])
+
+    return restrict_neighbors(neighbors, sample, n_neighbors)
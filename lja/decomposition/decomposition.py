@@ -1,71 +1,258 @@
 import glob, os
+import json
 import numpy as np
 from sklearn.utils import extmath
 import warnings
 import matplotlib.pyplot as plt
 from lja.analyser.plotter import Plotter
 from lja.analyser.dataloader import Dataloader
+from lja.utils.storage import get_storage
+from lja.utils.precision import get_precision_policy, relative_error
+from lja.utils.artifact_cache import ArtifactCache
+from lja.utils.artifact_registry import registry, save_npy
 
 
 class Decomposition:
     """Creates an Decomposition object, that calculates singular vectors using regularized, randomized SVD."""
 
-    def __init__(self, path, show_plots=False):
+    def __init__(self, path, show_plots=False, storage=None):
         super(Decomposition, self).__init__()
 
         self.path = path
-        self.data = Dataloader(path)
+        self.storage = storage if storage is not None else get_storage()
+        self.data = Dataloader(path, storage=self.storage)
         self.number_of_layers = None
         self.side = None
         self.decompositions = []
+        self.precision = get_precision_policy()
+        self.precision_report = []
+        self.cache = ArtifactCache(storage=self.storage)
+        self.reused = False
+
+    def load(self, side="left", append=False):
+        """
+        Loads the transformations.
+        append  - whether to load the stored decomposition and only the transformations of samples appended since
+        """
+
+        if append:
+            # load stored decompositions
+            self.side, self.number_of_layers = self.data.load(
+                side,
+                load_transformations=False,
+                load_decompositions=True,
+                load_cluster=False,
+            )
 
-    def load(self):
+            # number of samples that are already decomposed
+            if side == "left":
+                n_decomposed = self.data.u_list[0].shape[0]
+            else:
+                n_decomposed = self.data.vh_list[0].shape[0]
 
-        # load transformations and decompositions
-        side, self.number_of_layers = self.data.load(
-            load_transformations=True, load_decompositions=False, load_cluster=False,
-        )
+            # load new transformations only
+            self.data.transformation_list = self.data.load_transformations_from(
+                n_decomposed
+            )
+            print("Number of appended samples:", len(self.data.transformation_list[0]))
+
+        else:
+            # load transformations
+            self.side, self.number_of_layers = self.data.load(
+                side,
+                load_transformations=True,
+                load_decompositions=False,
+                load_cluster=False,
+            )
 
         pass
 
+    def get_results_path(self, side):
+        return "results/decompositions/" + self.path + side + "/"
+
+    def get_cache_key(self, k_list, side, append=False):
+        """Key of the decomposition: transformations, k per layer, side and code version."""
+
+        upstream = [self.cache.read_key("results/transformations/" + self.path)]
+        if append:
+            upstream.append(self.cache.read_key(self.get_results_path(side)))
+
+        config = {
+            "k_list": k_list,
+            "side": side,
+            "append": append,
+            "precision": self.precision.get_config(),
+        }
+        key = self.cache.compute_key(
+            "decompositions", config, upstream, self.cache.get_code_version(self)
+        )
+
+        return key, config, upstream
+
+    def load_stored(self, side):
+        """Loads a stored decomposition of all layers."""
+
+        decompositions = []
+        path = self.get_results_path(side)
+        for layer in range(self.number_of_layers):
+            path_layer = path + "Layer" + str(layer) + "/"
+            decompositions.append(
+                tuple(
+                    self.precision.to_compute(self.storage.load(path_layer + name + ".npy"))
+                    for name in ["u", "s", "vh", "k"]
+                )
+            )
+
+        return decompositions
+
     def store(self):
 
         # path
-        path = "results/decompositions/" + self.path + self.side + "/"
+        path = self.get_results_path(self.side)
+
+        if self.reused:
+            print("\nAlready stored in: ", path)
+            return
+
         print("\nStore in: ", path)
+        self.cache.invalidate(path)
+        registry.invalidate(self.path, path)
 
         # loop through layers
         for layer, decomposition in enumerate(self.decompositions):
 
-            # create folder
             path_layer = path + "Layer" + str(layer) + "/"
-            if not os.path.exists(path_layer):
-                os.makedirs(path_layer)
 
-            # store
+            # store in the storage dtype of each artifact
             for item, name in zip(decomposition, ["u", "s", "vh", "k"]):
-                np.save(path_layer + name + ".npy", item)
+                save_npy(
+                    self.path,
+                    path_layer + name + ".npy",
+                    self.precision.to_storage(name, item),
+                    self.storage,
+                )
+
+        # record the reconstruction error of the stored decomposition
+        self.storage.write_text(
+            path + "precision.json",
+            json.dumps(
+                dict(self.precision.get_config(), layers=self.precision_report),
+                indent=4,
+            ),
+        )
+
+        # record what produced the artifact
+        self.cache.write(path, *self.cache_entry)
 
         pass
 
-    def decompose(self, k_list, side="left"):
+    def decompose(self, k_list, side="left", append=False):
+        """
+        Decomposes the transformations of all layers.
+        append  - whether to update the loaded decomposition with the appended samples (see load), k_list is ignored
+        """
 
         # reset decompositions
         self.decompositions = []
+        self.precision_report = []
         self.side = side
 
-        # loop through layers
-        for layer, T in enumerate(self.data.transformation_list):
+        # reuse the stored decomposition if transformations, config and code are unchanged
+        key, config, upstream = self.get_cache_key(k_list, side, append)
+        self.cache_entry = (key, "decompositions", config, upstream)
+        self.reused = not append and self.cache.is_valid(
+            self.get_results_path(side), key
+        )
+
+        if self.reused:
+            self.decompositions = self.load_stored(side)
+            return
+
+        # loop through layers, the transformations of the next layer are read in the background
+        for layer, arrays in self.data.iter_layers(
+            prefetch=1,
+            artifacts=("transformation",),
+            layers=range(len(self.data.transformation_list)),
+        ):
             print("\nLayer:", layer)
+            T = self.precision.to_compute(arrays["transformation"])
 
             # obtain decomposition
-            u, s, vh, k = self.get_decomposition(T, k_list[layer], self.side)
+            if append:
+                u, s, vh, k = self.update_decomposition(
+                    T,
+                    self.data.u_list[layer],
+                    self.data.s_list[layer],
+                    self.data.vh_list[layer],
+                    self.data.k_list[layer],
+                    self.side,
+                )
+            else:
+                u, s, vh, k = self.get_decomposition(T, k_list[layer], self.side)
+
+            # compute dtype, randomized_svd promotes to float64
+            u, s, vh = [self.precision.to_compute(item) for item in (u, s, vh)]
 
             # store
             self.decompositions.append((u, s, vh, k))
 
+            # in append mode T holds only the appended samples, they are the last rows of u (left) or vh (right)
+            u_T, vh_T = u, vh
+            if self.side == "left":
+                u_T = u[-len(T) :]
+            else:
+                vh_T = vh[-len(T) :]
+
+            self.precision_report.append(
+                dict(self.measure_precision(T, u_T, s, vh_T, self.side), layer=layer)
+            )
+
         pass
 
+    def reconstruct(self, u, s, vh, side):
+        """Reconstructs the transformations of the samples from their decomposition."""
+
+        if side == "left":
+            return u @ (s[:, None] * vh)
+
+        elif side == "right":
+            return (u * s) @ vh
+
+        else:
+            raise Exception("Decomposition: invalid side")
+
+    def measure_precision(self, T, u, s, vh, side, number_of_samples=64):
+        """
+        Measures the relative reconstruction error of the decomposition on a subset of samples,
+        once in the compute dtype and once after casting to the storage dtypes.
+        """
+
+        # 1. Evenly spaced subset of samples
+        samples = np.unique(
+            np.linspace(0, len(T) - 1, min(number_of_samples, len(T))).astype(int)
+        )
+        T = T[samples]
+        if side == "left":
+            u = u[samples]
+        else:
+            vh = vh[samples]
+
+        # 2. Cast to storage dtypes and back
+        stored = [
+            self.precision.to_compute(self.precision.to_storage(name, item))
+            for item, name in zip((u, s, vh), ["u", "s", "vh"])
+        ]
+
+        # 3. Compare the reconstructions
+        error = relative_error(T, self.reconstruct(u, s, vh, side))
+        error_stored = relative_error(T, self.reconstruct(*stored, side))
+
+        return {
+            "reconstruction_error": error,
+            "reconstruction_error_stored": error_stored,
+            "storage_impact": error_stored - error,
+        }
+
     def get_decomposition(self, T, k, side):
 
         if side == "left":
@@ -117,6 +304,53 @@ class Decomposition:
         else:
             raise Exception("Decomposition: invalid side")
 
+    def update_decomposition(self, T, u, s, vh, k, side):
+        """
+        Rank-k SVD update of an existing decomposition with the transformations T of new samples.
+        Only the k x k core of the old decomposition and the new samples enter the SVD,
+        the write (left) or read (right) matrices of the new samples are obtained by projection.
+        """
+
+        if side == "left":
+
+            # 1. stack transformations of the new inputs
+            T_stacked = np.vstack(T)
+
+            # 2. Apply SVD to the old core and the new rows
+            K = np.vstack((np.diag(s) @ vh, T_stacked))
+            u_k, s, vh = extmath.randomized_svd(K, k, random_state=1)
+
+            # 3. Rotate the existing U matrices into the new basis
+            U_old = u @ u_k[:k, :]
+
+            # 4. Project new samples on the updated read vectors
+            U_new = (T_stacked @ vh.T) / s
+            U_new = U_new.reshape(T.shape[0], T.shape[1], k)
+
+            return np.concatenate((U_old, U_new)), s, vh, k
+
+        elif side == "right":
+
+            # 1. stack transformations of the new inputs
+            T_stacked = np.hstack(T)
+
+            # 2. Apply SVD to the old core and the new columns
+            K = np.hstack((u * s, T_stacked))
+            u, s, vh_k = extmath.randomized_svd(
+                K, k, random_state=1, n_oversamples=100
+            )
+
+            # 3. Rotate the existing VH matrices into the new basis
+            VH_old = vh_k[:, :k] @ vh
+
+            # 4. Project new samples on the updated write vectors
+            VH_new = (u.T @ T) / s[:, None]
+
+            return u, s, np.concatenate((VH_old, VH_new)), k
+
+        else:
+            raise Exception("Decomposition: invalid side")
+
     def get_decomposition_by_layer_index(self, layer, k, side="left"):
 
         # config
@@ -0,0 +1,67 @@
+import numpy as np
+from collections import OrderedDict
+
+
+class FeatureCache:
+    """
+    Creates a bounded in-memory LRU cache of features in front of the feature stores.
+    A memory hit never reads the feature store, a memory miss falls through to the loader (the store).
+    """
+
+    def __init__(self, max_features=50000):
+        super(FeatureCache, self).__init__()
+
+        self.max_features = max_features
+        self.features = OrderedDict()
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.store_hits = 0
+        self.store_misses = 0
+
+    def get(self, key, loader):
+        """Returns the feature of key from memory, or from loader on a miss (None if it is not stored either)."""
+
+        if key in self.features:
+            self.hits += 1
+            self.features.move_to_end(key)
+            return self.features[key]
+
+        self.misses += 1
+        feature = loader()
+
+        if feature is None:
+            self.store_misses += 1
+        else:
+            self.store_hits += 1
+            self.put(key, feature)
+
+        return feature
+
+    def put(self, key, feature):
+        """Keeps a copy of the feature in memory, memory mapped features are read once."""
+
+        self.features[key] = np.array(feature)
+        self.features.move_to_end(key)
+
+        # evict the least recently used
+        while len(self.features) > self.max_features:
+            self.features.popitem(last=False)
+
+        pass
+
+    def clear(self):
+        self.features = OrderedDict()
+
+        pass
+
+    def get_stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "store_hits": self.store_hits,
+            "store_misses": self.store_misses,
+            "size": len(self.features),
+            "nbytes": int(sum(np.asarray(f).nbytes for f in self.features.values())),
+        }
@@ -2,26 +2,108 @@ import os
 import numpy as np
 from lja.analyser.plotter import Plotter
 from lja.analyser.dataloader import Dataloader
+from lja.feature_constructor.feature_store import FeatureStore
+from lja.feature_constructor.feature_cache import FeatureCache
+from lja.utils.storage import get_storage
+from lja.utils.precision import get_precision_policy, relative_error
+from lja.utils.artifact_cache import ArtifactCache
+from lja.utils.artifact_registry import registry, attach
+from lja.clusterer.minibatch import sum_per_center
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib.pyplot as plt
 import pandas as pd
 import itertools
 from numpy.linalg import norm
 
+# number of floats of the similarity and combination tensors of a chunk of targets
+BLOCK_SIZE = 2 ** 24
+
+
+def prune_similarity(similarity, top_m=None, similarity_threshold=None):
+    """
+    Zeroes the similarities of the write vectors (last axis), that contribute little to a feature.
+    top_m                   - keeps the top_m largest absolute similarities, all if None
+    similarity_threshold    - keeps the absolute similarities of at least the threshold, all if None
+    """
+
+    similarity = np.array(similarity)
+    magnitude = np.abs(similarity)
+
+    if top_m is not None and top_m < similarity.shape[-1]:
+        smallest = np.argpartition(-magnitude, top_m, axis=-1)[..., top_m:]
+        np.put_along_axis(similarity, smallest, 0, axis=-1)
+
+    if similarity_threshold is not None:
+        similarity[magnitude < similarity_threshold] = 0
+
+    return similarity
+
+
+def combine_features(write_vectors, read_vectors, construction_vectors, pruning=None):
+    """
+    Features [targets, features, input_dimension] of a chunk of targets, the features of the previous layer
+    construction_vectors [targets, k, input_dimension] weighted by the cosine similarities of the
+    read vectors [features, dimension] with the write vectors [targets, write_vectors, dimension] of each target.
+    pruning     - arguments of prune_similarity, exact if None
+    """
+
+    similarity = np.einsum("tmd,fd->tfm", write_vectors, read_vectors) / (
+        norm(write_vectors, axis=2)[:, None, :] * norm(read_vectors, axis=1)[None, :, None]
+    )
+
+    if pruning is not None:
+        similarity = prune_similarity(similarity, **pruning)
+
+    return np.einsum(
+        "tfm,tmx->tfx", similarity, construction_vectors[:, : write_vectors.shape[1]]
+    )
+
+
+def construct_targets_task(
+    shared_features,
+    shared_previous_features,
+    shared_write_vectors,
+    read_vectors,
+    rows,
+    target_indices,
+    next_target_indices,
+    pruning=None,
+):
+    """
+    Constructs the features of a chunk of targets of a layer, runs in a worker process.
+    The features are written into the shared feature tensor of the layer, rows are the rows of the
+    chunk in the shared write vectors and next_target_indices the targets of the previous layer.
+    """
+
+    features = attach(shared_features, writeable=True)
+    features[target_indices] = combine_features(
+        attach(shared_write_vectors)[rows],
+        read_vectors,
+        attach(shared_previous_features)[next_target_indices],
+        pruning,
+    )
+
+    return len(target_indices)
+
 
 class Constructor:
     """Creates an feature visualisation object, that visualises the read vectors of the decompositions."""
 
-    def __init__(self, path, target, show_plots=False):
+    def __init__(self, path, target, show_plots=False, storage=None):
         super(Constructor, self).__init__()
 
         self.path = path
+        self.storage = storage if storage is not None else get_storage()
+        self.precision = get_precision_policy()
         self.plotter = Plotter("/features/", show_plots)
-        self.data = Dataloader(path)
+        self.data = Dataloader(path, storage=self.storage)
         self.number_of_layers = None
         self.side = None
         self.target = target
-        self.feature_memory = []
-        self.feature_memory_available = []
+        self.feature_cache = FeatureCache()
+        self.feature_stores = {}
+        self.pruning = None
+        self.cache = ArtifactCache(storage=self.storage)
 
     def load(self, side="left"):
 
@@ -46,16 +128,15 @@ class Constructor:
             u = self.data.u_list[layer][:, :, :k]
             vh = self.data.vh_list[layer][:k, :]
 
-            if layer == 0:
-                input_dimension = vh.shape[1] - 1
-
-            feature_memory = np.zeros((u.shape[0], k, input_dimension))
-            feature_memory_available = np.zeros((u.shape[0], k))
-
             self.u_list.append(u)
             self.vh_list.append(vh)
-            self.feature_memory.append(feature_memory)
-            self.feature_memory_available.append(feature_memory_available)
+
+        # cached features were constructed with other k, the stores are reopened with the key of the new k
+        self.feature_cache.clear()
+        self.flush_feature_stores()
+        self.feature_stores = {}
+
+        pass
 
     def set_plot_path2(self, layer, feature_index, target_index):
         self.plotter.set_layer_and_vector(layer, feature_index)
@@ -75,25 +156,116 @@ class Constructor:
 
         pass
 
-    def set_results_path(self, layer, feature_index, create_folder=True):
-        self.results_path = (
-            "results/features/"
-            + self.path
-            + self.side
-            + "/Layer"
-            + str(layer)
-            + "/Vector"
-            + str(feature_index)
-            + "/by_"
-            + str(self.target)
-            + "/granularity_"
-            + self.granularity
+    def set_pruning(self, top_m=None, similarity_threshold=None):
+        """
+        Approximate construction, each feature combines only the features of the write vectors with the
+        top_m largest absolute similarities and / or an absolute similarity of at least similarity_threshold.
+        The recursion only descends into these write vectors. Pruned features are stored apart from the exact ones.
+        Exact construction if both are None, see measure_pruning_error for the error of the approximation.
+        """
+
+        if top_m is None and similarity_threshold is None:
+            self.pruning = None
+        else:
+            self.pruning = {"top_m": top_m, "similarity_threshold": similarity_threshold}
+
+        pass
+
+    def get_pruning_tag(self):
+        """Suffix of the feature store of pruned features, empty for exact features."""
+
+        if self.pruning is None:
+            return ""
+
+        tag = ""
+        if self.pruning["top_m"] is not None:
+            tag += "_top" + str(self.pruning["top_m"])
+        if self.pruning["similarity_threshold"] is not None:
+            tag += "_similarity" + str(self.pruning["similarity_threshold"])
+
+        return tag
+
+    def get_feature_store(self):
+        """
+        Returns the feature store of the current granularity.
+        The store of a layer is allocated on first use with the number of targets, k and the input dimension.
+        """
+
+        name = self.granularity + self.get_pruning_tag()
+
+        if name not in self.feature_stores:
+            store = FeatureStore(
+                self.path, self.side, self.target, name, self.storage
+            )
+
+            # discard stored features computed from other decompositions, clusters, config or code
+            key, config, upstream = self.get_cache_key()
+            if not self.cache.is_valid(store.path, key):
+                store.clear()
+            store.cache_entry = (key, "features", config, upstream)
+            store.written = False
+
+            self.feature_stores[name] = store
+
+        return self.feature_stores[name]
+
+    def get_cache_key(self):
+        """Key of the features: decomposition, clusters, k per layer, target, granularity and code version."""
+
+        upstream = [
+            self.cache.read_key(
+                "results/decompositions/" + self.path + self.side + "/"
+            ),
+            self.cache.read_key("results/clusters/" + self.path + self.side + "/"),
+        ]
+        config = {
+            "k_list": [
+                self.vh_list[layer].shape[0] for layer in range(self.number_of_layers)
+            ],
+            "target": self.target,
+            "granularity": self.granularity,
+            "precision": self.precision.get_config(),
+            "pruning": self.pruning,
+        }
+        key = self.cache.compute_key(
+            "features", config, upstream, self.cache.get_code_version(self)
         )
-        if not os.path.exists(self.results_path):
-            os.makedirs(self.results_path)
+
+        return key, config, upstream
+
+    def mark_written(self, store):
+        """
+        Records the key of a store on its first write in this run, so that its features are reused by the next run.
+        Stores that are only read keep the manifest they were opened with.
+        """
+
+        if not store.written:
+            self.cache.write(store.path, *store.cache_entry)
+            store.written = True
 
         pass
 
+    def flush_feature_stores(self):
+
+        for store in self.feature_stores.values():
+            store.flush()
+
+        pass
+
+    def open_feature_store(self, layer):
+
+        store = self.get_feature_store()
+
+        if layer not in store.features:
+            store.create(
+                layer,
+                self.get_number_of_targets(layer),
+                self.vh_list[layer].shape[0],
+                self.vh_list[0].shape[1] - 1,
+            )
+
+        return store
+
     def get_filename(self, feature_index, target_index, mode):
         name = (
             "/feature_"
@@ -107,9 +279,6 @@ class Constructor:
         if mode == "plot":
             filename = self.plot_path + name
 
-        elif mode == "file":
-            filename = self.results_path + name + ".npy"
-
         else:
             filename = ""
 
@@ -117,28 +286,22 @@ class Constructor:
 
     def load_feature(self, layer, feature_index, target_index):
         """
-        Loads an already computed feature from the disk
+        Loads an already computed feature from the feature store, in the compute dtype
         """
-        # set path
-        self.set_results_path(layer, feature_index, create_folder=False)
-        file_path = self.get_filename(feature_index, target_index, "file")
+        feature = self.open_feature_store(layer).get(layer, feature_index, target_index)
 
-        # load if possible
-        if os.path.exists(file_path):
-            feature = np.load(file_path, allow_pickle=True)
-            return feature
-        else:
+        if feature is None:
             return None
 
+        return self.precision.to_compute(feature)
+
     def store_feature(self, feature, layer, feature_index, target_index):
         """
-        Stores a feature to the disk as numpy array
+        Stores a feature in the memory mapped feature store
         """
-        # set path
-        self.set_results_path(layer, feature_index)
-        np.save(
-            self.get_filename(feature_index, target_index, "file"), feature,
-        )
+        store = self.open_feature_store(layer)
+        store.put(feature, layer, feature_index, target_index)
+        self.mark_written(store)
 
         pass
 
@@ -167,6 +330,25 @@ class Constructor:
 
         pass
 
+    def plot_target_feature(self, feature, layer, feature_index, target_index):
+        """
+        PLots the feature masked by the input of the target
+        """
+        if True:
+            feature_masked = feature * self.data.activation_list[0][target_index]
+            self.plot_feature(feature_masked, layer, feature_index, target_index)
+        else:
+            self.plot_feature(feature, layer, feature_index, target_index)
+
+        pass
+
+    def get_representative_targets(self, layer, target_indices):
+        """
+        returns for each target the target its features of the layer are computed for.
+        Targets whose write vectors are the same in all layers up to the layer share a representative
+        """
+        return target_indices
+
     def construct_single_feature(
         self,
         layer,
@@ -188,29 +370,33 @@ class Constructor:
         store_all_computed_features     - whether the features that are computed on the fly should be stored (slows down the computation)
         """
 
-        # 0. Check if already computed:
+        # 0. Check if already computed, in memory or in the feature store
         feature = None
         already_stored = False
+        key = (self.granularity + self.get_pruning_tag(), layer, feature_index, target_index)
 
         if reuse_stored_features:
+            feature = self.feature_cache.get(
+                key, lambda: self.load_feature(layer, feature_index, target_index)
+            )
+            already_stored = feature is not None
 
-            # test if already loaded and in memory
-            if self.feature_memory_available[layer][target_index, feature_index] == 1:
-                feature = self.feature_memory[layer][target_index, feature_index, :]
-                already_stored = True
-
-            if reuse_stored_features:
-                feature = self.load_feature(layer, feature_index, target_index)
-
-                if feature is not None:
-                    self.feature_memory_available[layer][
-                        target_index, feature_index
-                    ] = 1
-                    self.feature_memory[layer][target_index, feature_index] = feature
-                    already_stored = True
+        # targets with the same write vectors in all layers share their features
+        representative = int(self.get_representative_targets(layer, target_index))
 
         # Compute feature if not pre-computed
-        if feature is None:
+        if feature is None and representative != target_index:
+            feature = self.construct_single_feature(
+                layer,
+                feature_index,
+                representative,
+                plot=False,
+                store=store,
+                reuse_stored_features=reuse_stored_features,
+                store_all_computed_features=store_all_computed_features,
+            )
+
+        elif feature is None:
 
             # 1. Select the read vector
             read_vector = self.vh_list[layer][feature_index, :-1]
@@ -241,10 +427,16 @@ class Constructor:
                     layer, target_index
                 )
 
-                # 5.2. Collect constrcutor vectors
+                # 5.2. Collect constrcutor vectors, only of the write vectors kept by the pruning
+                if self.pruning is not None:
+                    similarity = prune_similarity(similarity, **self.pruning)
+                    (kept,) = np.nonzero(similarity)
+                else:
+                    kept = np.arange(len(write_vector_candidates))
+
+                similarity = similarity[kept]
                 construction_vectors = []
-                number_write_vectors = len(write_vector_candidates)
-                for write_vector_index in range(number_write_vectors):
+                for write_vector_index in kept:
                     construction_vectors.append(
                         self.construct_single_feature(
                             layer - 1,
@@ -255,7 +447,9 @@ class Constructor:
                             reuse_stored_features=reuse_stored_features,
                         )
                     )
-                construction_vectors = np.array(construction_vectors)
+                construction_vectors = np.array(construction_vectors).reshape(
+                    len(kept), self.vh_list[0].shape[1] - 1
+                )
 
                 # 6. Construct the feature as linear combination the previous features
                 construction_vectors_weighted = (
@@ -267,18 +461,230 @@ class Constructor:
                 )
                 feature = construction_vectors_combined
 
+            # only stored features are cached, so that a memory hit implies the feature is stored
+            if reuse_stored_features and store:
+                self.feature_cache.put(key, feature)
+
         if plot:
-            if True:
-                feature_masked = feature * self.data.activation_list[0][target_index]
-                self.plot_feature(feature_masked, layer, feature_index, target_index)
-            else:
-                self.plot_feature(feature, layer, feature_index, target_index)
+            self.plot_target_feature(feature, layer, feature_index, target_index)
 
         if store and not already_stored:
             self.store_feature(feature, layer, feature_index, target_index)
 
         return feature
 
+    def construct_layer_features(
+        self,
+        layers,
+        feature_indices,
+        target_indices,
+        plot=True,
+        store=True,
+        reuse_stored_features=True,
+        n_jobs=1,
+    ):
+        """
+        Batched engine, constructs all features of a layer for all needed targets in one step, bottom-up.
+        The features of layer L are the cosine similarities of its read vectors with the write vectors of each
+        target, as einsum over the targets, combined with the feature tensor of layer L - 1.
+        Gives the same features as construct_single_feature, whose recursion computes the same
+        (layer, feature, target) entries one at a time.
+        n_jobs  - number of worker processes, the targets of a layer are distributed over them. The write vectors
+                  and the feature tensors are shared memory, workers write the features of their targets into it.
+        Returns the feature tensors {layer: [number_of_targets, k, input_dimension]}, filled for the needed targets.
+        """
+
+        top = max(layers)
+
+        # 1. Targets needed per layer, top-down. Targets with the same write vectors in all layers up to a layer
+        # share the features of their representative, the representatives are computed as well
+        targets = {top: np.unique(target_indices)}
+        for layer in range(top, -1, -1):
+            targets[layer] = np.unique(
+                np.concatenate(
+                    (targets[layer], self.get_representative_targets(layer, targets[layer]))
+                )
+            )
+
+            if layer > 0:
+                needed = self.get_corresponding_target_indices(layer, targets[layer])
+                if layer - 1 in layers:
+                    needed = np.concatenate((needed, target_indices))
+                targets[layer - 1] = np.unique(needed)
+
+        # 2. Features of each layer, bottom-up
+        tensors = {}
+        shared = {}
+        executor = ProcessPoolExecutor(max_workers=n_jobs) if n_jobs != 1 else None
+        try:
+            for layer in range(top + 1):
+
+                read_vectors = self.precision.to_compute(
+                    np.asarray(self.vh_list[layer][:, :-1])
+                )
+                shape = (
+                    self.get_number_of_targets(layer),
+                    len(read_vectors),
+                    self.vh_list[0].shape[1] - 1,
+                )
+                if executor is None:
+                    features = np.zeros(shape, dtype=self.precision.compute_dtype)
+                else:
+                    shared[layer], features = registry.allocate(
+                        self.path,
+                        "features/Layer" + str(layer) + "/features",
+                        shape,
+                        self.precision.compute_dtype,
+                    )
+                missing = targets[layer]
+
+                # 2.1 Reuse the targets whose features are all stored
+                if store or reuse_stored_features:
+                    feature_store = self.open_feature_store(layer)
+
+                if reuse_stored_features:
+                    stored = feature_store.computed[layer][missing].all(axis=1)
+                    features[missing[stored]] = self.precision.to_compute(
+                        feature_store.features[layer][missing[stored]]
+                    )
+                    missing = missing[~stored]
+
+                # 2.2 Compute the others, in chunks of targets. Targets with the same write vectors in
+                # all layers share their features, only one representative of them is computed
+                representatives = self.get_representative_targets(layer, missing)
+                compute = np.unique(representatives)
+
+                if layer == 0:
+                    features[missing] = read_vectors
+
+                elif len(missing) > 0 and executor is None:
+                    chunk = max(1, BLOCK_SIZE // read_vectors.size)
+
+                    for start in range(0, len(compute), chunk):
+                        chunk_targets = compute[start : start + chunk]
+                        write_vectors = self.get_write_vector_tensor(layer, chunk_targets)
+                        features[chunk_targets] = combine_features(
+                            write_vectors,
+                            read_vectors,
+                            tensors[layer - 1][
+                                self.get_corresponding_target_indices(layer, chunk_targets)
+                            ],
+                            self.pruning,
+                        )
+
+                elif len(missing) > 0:
+                    shared_write_vectors = registry.share_array(
+                        self.path,
+                        "features/Layer" + str(layer) + "/write_vectors",
+                        self.get_write_vector_tensor(layer, compute),
+                    )
+                    next_targets = self.get_corresponding_target_indices(layer, compute)
+
+                    # a few chunks per worker, each bounded like the serial chunks
+                    chunk = max(
+                        1,
+                        min(
+                            BLOCK_SIZE // read_vectors.size,
+                            int(np.ceil(len(compute) / (4 * n_jobs))),
+                        ),
+                    )
+                    starts = range(0, len(compute), chunk)
+                    list(
+                        executor.map(
+                            construct_targets_task,
+                            [shared[layer]] * len(starts),
+                            [shared[layer - 1]] * len(starts),
+                            [shared_write_vectors] * len(starts),
+                            [read_vectors] * len(starts),
+                            [np.arange(start, min(start + chunk, len(compute))) for start in starts],
+                            [compute[start : start + chunk] for start in starts],
+                            [next_targets[start : start + chunk] for start in starts],
+                            [self.pruning] * len(starts),
+                        )
+                    )
+
+                features[missing] = features[representatives]
+
+                if store and len(missing) > 0:
+                    feature_store.put_targets(features[missing], layer, missing)
+                    self.mark_written(feature_store)
+
+                # 3. Plot the requested features
+                if plot and layer in layers:
+                    for (feature_index, target_index) in itertools.product(
+                        feature_indices, target_indices
+                    ):
+                        self.plot_target_feature(
+                            features[target_index, feature_index],
+                            layer,
+                            feature_index,
+                            target_index,
+                        )
+
+                tensors[layer] = features
+
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+                # copy out of the shared memory, which is released
+                tensors = {layer: np.array(tensor) for layer, tensor in tensors.items()}
+                features = None
+                registry.invalidate(self.path, "features/")
+
+        return tensors
+
+    def measure_pruning_error(
+        self,
+        layers,
+        feature_indices,
+        target_indices,
+        top_m=None,
+        similarity_threshold=None,
+    ):
+        """
+        Reconstruction error of the pruned features versus the exact features, see set_pruning.
+        Both are constructed by the batched engine, without the feature store.
+        Returns a DataFrame with the relative error of all requested features of each layer
+        and the largest relative error of a single feature.
+        """
+
+        target_indices = np.asarray(target_indices, dtype=int)
+        pruning = self.pruning
+
+        try:
+            self.set_pruning()
+            exact = self.construct_layer_features(
+                layers, feature_indices, target_indices, False, False, False
+            )
+            self.set_pruning(top_m, similarity_threshold)
+            pruned = self.construct_layer_features(
+                layers, feature_indices, target_indices, False, False, False
+            )
+        finally:
+            self.pruning = pruning
+
+        rows = []
+        for layer in layers:
+            index = np.ix_(target_indices, list(feature_indices))
+            reference, approximation = exact[layer][index], pruned[layer][index]
+
+            feature_errors = norm(reference - approximation, axis=2) / np.maximum(
+                norm(reference, axis=2), np.finfo(np.float32).tiny
+            )
+
+            rows.append(
+                {
+                    "layer": layer,
+                    "top_m": top_m,
+                    "similarity_threshold": similarity_threshold,
+                    "relative_error": relative_error(reference, approximation),
+                    "max_relative_error": float(feature_errors.max()),
+                }
+            )
+
+        return pd.DataFrame(rows)
+
     def construct_multiple_features(
         self,
         layers,
@@ -288,14 +694,46 @@ class Constructor:
         plot=True,
         store=True,
         reuse_stored_features=True,
+        engine="recursive",
+        n_jobs=1,
     ):
         """
         Construct multiple features based on the list contents.
-        granularites  - defines which U matrix should be used for reconstruction one of ['sample', 'profile', 'profile_cluster']
+        granularites  - defines which U matrix should be used for reconstruction, see set_granularity of the constructor
+        engine        - recursive: one feature at a time by construct_single_feature
+                      - batched: one layer at a time by construct_layer_features, much faster for many targets
+        n_jobs        - number of worker processes of the batched engine, the targets of each layer are distributed over them
 
         See above
         """
 
+        if engine == "recursive" and n_jobs != 1:
+            raise Exception("Constructor: n_jobs needs the batched engine")
+
+        if engine == "batched":
+            for granularity in granularites:
+                print("\nGranularity: ", granularity)
+                print("Layers: ", layers)
+
+                self.set_granularity(granularity)
+                self.construct_layer_features(
+                    layers,
+                    feature_indices,
+                    np.asarray(target_indices, dtype=int),
+                    plot=plot,
+                    store=store,
+                    reuse_stored_features=reuse_stored_features,
+                    n_jobs=n_jobs,
+                )
+
+            # write features to disk
+            self.flush_feature_stores()
+
+            return
+
+        elif engine != "recursive":
+            raise Exception("Constructor: invalid engine " + str(engine))
+
         config_memory = ["-"]
         for (granularity, layer, feature_index, target_index) in itertools.product(
             granularites, layers, feature_indices, target_indices
@@ -324,18 +762,35 @@ class Constructor:
                 store=store,
                 reuse_stored_features=reuse_stored_features,
             )
+
+        # write features to disk
+        self.flush_feature_stores()
+        print("Feature cache:", self.feature_cache.get_stats())
+
         pass
 
 
 class ConstructorBySample(Constructor):
-    def __init__(self, path, granularity="sample", show_plots=False):
-        Constructor.__init__(self, path, "sample", show_plots)
+    def __init__(self, path, granularity="sample", show_plots=False, storage=None):
+        Constructor.__init__(self, path, "sample", show_plots, storage)
         self.set_granularity(granularity)
+        self.group_means = {}
 
     def set_granularity(self, granularity):
+        """
+        sample              - the U matrix of the sample
+        profile             - the cluster centers of the profile of the sample
+        profile_cluster     - the mean U matrix of the samples of the same profile in the layer
+        layer_average       - the mean U matrix of the samples of the same profiles in all layers up to the layer
+        vector_average      - each write vector is the mean of the write vectors of the same index in the same cluster
+        sample_average      - the mean U matrix of all samples
+        The averaged granularities are computed once per group of samples, see get_groups.
+        """
+
         if granularity in [
             "sample",
             "profile",
+            "profile_cluster",
             "layer_average",
             "vector_average",
             "sample_average",
@@ -343,11 +798,114 @@ class ConstructorBySample(Constructor):
             self.granularity = granularity
         else:
             raise Exception(
-                "Invaild granularity argument \n it must be one of [sample, profile"
+                "Invaild granularity argument \n it must be one of [sample, profile, profile_cluster, layer_average, vector_average, sample_average]"
             )
 
         pass
 
+    def get_number_of_targets(self, layer):
+        return self.u_list[0].shape[0]
+
+    def get_groups(self, layer):
+        """
+        returns (groups, write_vectors) of the averaged granularities for the U matrices of a layer,
+        the group of each sample and the write vectors of each group [groups, write_vectors, dimension].
+        The group means are computed in one pass over the U matrices and kept
+        """
+
+        key = (self.granularity, layer, self.u_list[layer].shape[2])
+
+        if key not in self.group_means:
+            u = self.u_list[layer]
+            number_of_samples = u.shape[0]
+
+            # 1. Group of each sample
+            if self.granularity == "sample_average":
+                groups = np.zeros(number_of_samples, dtype=int)
+
+            elif self.granularity == "profile_cluster":
+                groups = self.data.profiles[layer]["profile_index"]
+
+            elif self.granularity == "layer_average":
+                paths = np.stack(
+                    [self.data.profiles[l]["profile_index"] for l in range(layer + 1)],
+                    axis=1,
+                )
+                _, groups = np.unique(paths, axis=0, return_inverse=True)
+
+            elif self.granularity == "vector_average":
+                groups = self.data.profiles[layer]["profile_index"]
+
+            else:
+                raise Exception(
+                    "Constructor: granularity " + str(self.granularity) + " has no groups"
+                )
+
+            groups = np.asarray(groups).ravel()
+            number_of_groups = groups.max() + 1
+
+            # 2. Segment means of the U matrices
+            if self.granularity == "vector_average":
+
+                # mean per (vector index, cluster), the write vectors of a profile are the means of its clusters
+                # the labels cover the k of the clustering, only the write vectors of the current k are used
+                (cluster_n, cluster_labels, cluster_centers) = self.data.clusters[layer]
+                k = min(cluster_labels.shape[1], u.shape[2])
+                number_of_clusters = len(cluster_centers)
+                segments = (
+                    np.arange(k)[None, :] * number_of_clusters + cluster_labels[:, :k]
+                ).ravel()
+
+                vectors = np.transpose(u[:, :, :k], (0, 2, 1)).reshape(-1, u.shape[1])
+                sums = sum_per_center(vectors, segments, k * number_of_clusters)
+                counts = np.bincount(segments, minlength=k * number_of_clusters)
+                means = sums / np.maximum(counts, 1)[:, None]
+
+                profiles = self.data.profiles[layer]["profiles"][:, :k]
+                write_vectors = means[np.arange(k)[None, :] * number_of_clusters + profiles]
+
+            else:
+                sums = sum_per_center(
+                    np.asarray(u).reshape(number_of_samples, -1), groups, number_of_groups
+                )
+                counts = np.bincount(groups, minlength=number_of_groups)
+                means = (sums / counts[:, None]).reshape(number_of_groups, *u.shape[1:])
+                write_vectors = np.transpose(means, (0, 2, 1))
+
+            self.group_means[key] = (
+                groups,
+                self.precision.to_compute(write_vectors),
+            )
+
+        return self.group_means[key]
+
+    def get_representative_targets(self, layer, sample_indices):
+        """
+        returns for each sample the first sample with the same groups in all layers below the layer
+        """
+
+        if self.granularity in ["sample", "profile"]:
+            return sample_indices
+
+        key = ("representatives", self.granularity, layer) + tuple(
+            u.shape[2] for u in self.u_list[:layer]
+        )
+
+        if key not in self.group_means:
+            if layer == 0:
+                representatives = np.zeros(self.get_number_of_targets(0), dtype=int)
+
+            else:
+                paths = np.stack([self.get_groups(l)[0] for l in range(layer)], axis=1)
+                _, first, path_index = np.unique(
+                    paths, axis=0, return_index=True, return_inverse=True
+                )
+                representatives = first[path_index.ravel()]
+
+            self.group_means[key] = representatives
+
+        return self.group_means[key][sample_indices]
+
     def get_write_vector_candidates(self, layer, sample_index):
         """
         returns a set of write vectors that is used to match the read vector
@@ -369,6 +927,12 @@ class ConstructorBySample(Constructor):
             # pick the profle centers in the U vector space of the profile
             write_vector_candidates = cluster_centers[profile]
 
+        else:
+
+            # 2. Pick the mean write vectors of the group of the sample
+            groups, write_vectors = self.get_groups(layer - 1)
+            write_vector_candidates = write_vectors[groups[sample_index]]
+
         return write_vector_candidates
 
     def get_corresponding_target_index(self, layer, sample_index):
@@ -381,10 +945,31 @@ class ConstructorBySample(Constructor):
         # the corresponding feature is ined by the sample index again: easy mapping
         return sample_index
 
+    def get_write_vector_tensor(self, layer, sample_indices):
+        """
+        returns the write vectors of get_write_vector_candidates for many samples [samples, write_vectors, dimension]
+        """
+
+        if self.granularity == "sample":
+            write_vectors = np.transpose(self.u_list[layer - 1][sample_indices], (0, 2, 1))
+
+        elif self.granularity == "profile":
+            (cluster_n, cluster_labels, cluster_centers) = self.data.clusters[layer - 1]
+            write_vectors = cluster_centers[cluster_labels[sample_indices]]
+
+        else:
+            groups, write_vectors = self.get_groups(layer - 1)
+            write_vectors = write_vectors[groups[sample_indices]]
+
+        return self.precision.to_compute(np.asarray(write_vectors))
+
+    def get_corresponding_target_indices(self, layer, sample_indices):
+        return sample_indices
+
 
 class ConstructorByProfile(Constructor):
-    def __init__(self, path, granularity="profile", show_plots=False):
-        Constructor.__init__(self, path, "profile", show_plots)
+    def __init__(self, path, granularity="profile", show_plots=False, storage=None):
+        Constructor.__init__(self, path, "profile", show_plots, storage)
         self.set_granularity(granularity)
 
     def set_granularity(self, granularity):
@@ -398,6 +983,11 @@ class ConstructorByProfile(Constructor):
 
         pass
 
+    def get_number_of_targets(self, layer):
+
+        # profiles of the write vectors the features of the layer are constructed for
+        return len(self.data.profiles[max(layer - 1, 0)]["profiles"])
+
     def get_write_vector_candidates(self, layer, profile_index):
         """
         returns a set of write vectors that is used to match the read vector
@@ -407,8 +997,7 @@ class ConstructorByProfile(Constructor):
 
             # pick profile
             (cluster_n, cluster_labels, cluster_centers) = self.data.clusters[layer - 1]
-            unique_profiles = np.unique(cluster_labels, axis=0)
-            profile = unique_profiles[profile_index, :]
+            profile = self.data.profiles[layer - 1]["profiles"][profile_index, :]
 
             # pick the profle centers in the U vector space of the profile
             write_vector_candidates = cluster_centers[profile]
@@ -430,30 +1019,28 @@ class ConstructorByProfile(Constructor):
 
         else:
 
-            # 1. Find samples of the profile that needs to be mapped
-            # 1.2 pick profile to be mapped
-            (cluster_n, cluster_labels, cluster_centers) = self.data.clusters[layer - 1]
+            # the most frequent profile in the previous layer of the samples of the profile, by majority vote:
+            # precomputed from the profile transition counts, see Dataloader.load_profiles
+            # TODO: better methods?
+            target_index_next = self.data.profiles[layer - 1]["previous_profile"][
+                profile_index
+            ].item()
 
-            unique_profiles = np.unique(cluster_labels, axis=0)
-            profile = unique_profiles[profile_index, :]
+        return target_index_next
 
-            # 1.3 identify samples of that profile; this is a mask
-            members_profile = np.equal(cluster_labels, profile).all(axis=1)
+    def get_write_vector_tensor(self, layer, profile_indices):
+        """
+        returns the write vectors of get_write_vector_candidates for many profiles [profiles, write_vectors, dimension]
+        """
 
-            # 2. Find the profiles of the samples in the previous layer
-            (cluster_n, cluster_labels, cluster_centers) = self.data.clusters[layer - 2]
-            previous_profiles = cluster_labels[members_profile, :]
+        (cluster_n, cluster_labels, cluster_centers) = self.data.clusters[layer - 1]
+        profiles = self.data.profiles[layer - 1]["profiles"][profile_indices]
 
-            # 3. Pick one of these profiles as the next target, by the method of majority vote:
-            # TODO: better methods?
-            values, counts = np.unique(previous_profiles, axis=0, return_counts=True)
-            most_frequent_previous_profile = values[np.argmax(counts)]
+        return self.precision.to_compute(np.asarray(cluster_centers[profiles]))
 
-            # 4. Find the index of this profile to be passed on
-            unique_profiles = np.unique(cluster_labels, axis=0)
-            (target_index_next,) = np.where(
-                np.equal(unique_profiles, most_frequent_previous_profile).all(axis=1)
-            )
-            target_index_next = target_index_next.item()
+    def get_corresponding_target_indices(self, layer, profile_indices):
 
-        return target_index_next
+        if layer == 1:
+            return profile_indices
+
+        return self.data.profiles[layer - 1]["previous_profile"][profile_indices]
@@ -0,0 +1,135 @@
+import numpy as np
+from lja.utils.storage import get_storage
+from lja.utils.precision import get_precision_policy
+
+
+class FeatureStore:
+    """
+    Creates a feature store, that keeps all features of a layer in one memory mapped
+    [number_of_targets, k, input_dimension] array, next to a bitmap of the computed entries.
+    """
+
+    def __init__(self, path, side, target="sample", granularity="sample", storage=None):
+        super(FeatureStore, self).__init__()
+
+        self.storage = storage if storage is not None else get_storage()
+        self.path = (
+            "results/features/"
+            + path
+            + side
+            + "/by_"
+            + str(target)
+            + "/granularity_"
+            + granularity
+            + "/"
+        )
+        self.features = {}
+        self.computed = {}
+
+    def get_path_layer(self, layer):
+        return self.path + "Layer" + str(layer) + "/"
+
+    def exists(self, layer):
+        path_layer = self.get_path_layer(layer)
+        return self.storage.exists(path_layer + "features.npy") and self.storage.exists(
+            path_layer + "computed.npy"
+        )
+
+    def get_shape(self, layer):
+        """Reads the shape of a stored layer from the header of the array."""
+        features = self.storage.load(
+            self.get_path_layer(layer) + "features.npy", mmap_mode="r"
+        )
+        return features.shape
+
+    def get_dtype(self, layer):
+        features = self.storage.load(
+            self.get_path_layer(layer) + "features.npy", mmap_mode="r"
+        )
+        return features.dtype
+
+    def open(self, layer, mode="r"):
+        """Opens the features and the bitmap of a stored layer memory mapped."""
+
+        path_layer = self.get_path_layer(layer)
+        self.features[layer] = self.storage.load(
+            path_layer + "features.npy", mmap_mode=mode
+        )
+        self.computed[layer] = self.storage.load(
+            path_layer + "computed.npy", mmap_mode=mode
+        )
+
+        return self.features[layer], self.computed[layer]
+
+    def create(self, layer, number_of_targets, k, input_dimension, dtype=None):
+        """
+        Opens the store of a layer for writing.
+        It is (re)allocated, if it does not exist yet or the stored shape or dtype differs.
+        dtype  - the storage dtype of the precision policy if None
+        """
+
+        shape = (number_of_targets, k, input_dimension)
+        if dtype is None:
+            dtype = get_precision_policy().get_storage_dtype("feature")
+
+        if self.exists(layer) and self.get_shape(layer) == shape and (
+            self.get_dtype(layer) == dtype
+        ):
+            return self.open(layer, mode="r+")
+
+        # allocate
+        path_layer = self.get_path_layer(layer)
+        self.features[layer] = self.storage.open_memmap(
+            path_layer + "features.npy", mode="w+", dtype=dtype, shape=shape
+        )
+        self.computed[layer] = self.storage.open_memmap(
+            path_layer + "computed.npy", mode="w+", dtype=bool, shape=shape[:2]
+        )
+
+        return self.features[layer], self.computed[layer]
+
+    def clear(self):
+        """Deletes all stored layers."""
+
+        self.features = {}
+        self.computed = {}
+        self.storage.remove(self.path)
+
+        pass
+
+    def get(self, layer, feature_index, target_index):
+        """Returns the feature or None, if it has not been computed yet."""
+
+        if layer not in self.computed:
+            return None
+
+        if not self.computed[layer][target_index, feature_index]:
+            return None
+
+        return self.features[layer][target_index, feature_index]
+
+    def put(self, feature, layer, feature_index, target_index):
+
+        self.features[layer][target_index, feature_index] = feature
+        self.computed[layer][target_index, feature_index] = True
+
+        pass
+
+    def put_targets(self, features, layer, target_indices):
+        """Stores all features [targets, k, input_dimension] of the target_indices of a layer at once."""
+
+        self.features[layer][target_indices] = features
+        self.computed[layer][target_indices] = True
+
+        pass
+
+    def flush(self):
+
+        for layer in self.features:
+            if isinstance(self.features[layer], np.memmap):
+                self.features[layer].flush()
+                self.computed[layer].flush()
+
+        self.storage.flush()
+
+        pass
@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+import inspect
+import numpy as np
+from lja.utils.storage import get_storage
+
+
+class ArtifactCache:
+    """
+    Creates a cache, that records for every stored artifact a key computed from its upstream artifacts,
+    its config and the code version of the stage that produced it. A stage can reuse an artifact
+    whenever the recorded key matches the key of the current run.
+    """
+
+    def __init__(self, manifest_name="manifest.json", storage=None):
+        super(ArtifactCache, self).__init__()
+
+        self.manifest_name = manifest_name
+        self.storage = storage if storage is not None else get_storage()
+
+    def get_manifest_path(self, path):
+        return os.path.join(path, self.manifest_name)
+
+    def get_code_version(self, obj):
+        """Hash of the source files that define the class of obj and its base classes within lja."""
+
+        h = hashlib.sha256()
+        for cls in type(obj).__mro__:
+            if cls.__module__.split(".")[0] != "lja":
+                continue
+
+            with open(inspect.getsourcefile(cls), "rb") as f:
+                h.update(f.read())
+
+        return h.hexdigest()
+
+    def hash_arrays(self, arrays):
+        """Hash of the contents of a list of arrays."""
+
+        h = hashlib.sha256()
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            h.update(str(array.dtype).encode())
+            h.update(str(array.shape).encode())
+            h.update(array.tobytes())
+
+        return h.hexdigest()
+
+    def compute_key(self, stage, config, upstream=(), code_version=""):
+
+        h = hashlib.sha256()
+        h.update(stage.encode())
+        h.update(json.dumps(config, sort_keys=True, default=str).encode())
+        for upstream_key in upstream:
+            h.update(str(upstream_key).encode())
+        h.update(code_version.encode())
+
+        return h.hexdigest()
+
+    def get_fingerprint(self, path):
+        """Fallback key for artifacts without manifest, changes whenever a file of the artifact is written."""
+        return self.storage.get_fingerprint(path)
+
+    def read_manifest(self, path):
+
+        manifest_path = self.get_manifest_path(path)
+        if not self.storage.exists(manifest_path):
+            return None
+
+        return json.loads(self.storage.read_text(manifest_path))
+
+    def read_key(self, path):
+        """Returns the key of a stored artifact, used as upstream key by the next stage."""
+
+        manifest = self.read_manifest(path)
+        if manifest is not None:
+            return manifest["key"]
+
+        if len(self.storage.list(path)) > 0:
+            return self.get_fingerprint(path)
+
+        return None
+
+    def is_valid(self, path, key):
+
+        manifest = self.read_manifest(path)
+        valid = manifest is not None and manifest["key"] == key
+
+        if valid:
+            print("Reuse cached artifact:", path)
+
+        return valid
+
+    def write(self, path, key, stage, config, upstream=()):
+
+        manifest = {
+            "key": key,
+            "stage": stage,
+            "config": config,
+            "upstream": list(upstream),
+        }
+        self.storage.write_text(
+            self.get_manifest_path(path), json.dumps(manifest, indent=4, default=str)
+        )
+
+        pass
+
+    def invalidate(self, path):
+
+        manifest_path = self.get_manifest_path(path)
+        if self.storage.exists(manifest_path):
+            self.storage.remove(manifest_path)
+
+        pass
@@ -0,0 +1,183 @@
+import atexit
+import threading
+import numpy as np
+from collections import namedtuple
+from functools import partial
+from multiprocessing import shared_memory
+from lja.utils.storage import get_storage, normalize_path
+
+# description of an array in a shared memory segment, can be passed to worker processes
+SharedArray = namedtuple("SharedArray", ["name", "shape", "dtype"])
+
+# segments attached in this process, kept alive as long as the process runs
+_attached_segments = {}
+
+
+class ArtifactRegistry:
+    """
+    Creates a process-wide registry of loaded artifacts, keyed by experiment path, artifact name and the storage they come from.
+    Every artifact is loaded once and handed out as read-only view, so objects that load the same
+    experiment share the same arrays. Artifacts can also be copied into shared memory segments for worker processes.
+    """
+
+    def __init__(self):
+        super(ArtifactRegistry, self).__init__()
+
+        self.artifacts = {}
+        self.segments = {}
+        self.lock = threading.RLock()
+
+    def get(self, path, name, loader, source=None):
+        """
+        Returns a read-only view of the artifact, loader is only called if it is not registered yet.
+        source identifies the storage of the artifact, e.g. storage.get_identity().
+        """
+
+        key = (path, name, source)
+
+        with self.lock:
+            if key not in self.artifacts:
+                array = loader()
+                if isinstance(array, np.ndarray):
+                    array.flags.writeable = False
+                self.artifacts[key] = array
+
+            array = self.artifacts[key]
+
+        if isinstance(array, np.ndarray):
+            return array.view()
+
+        return array
+
+    def share(self, path, name, loader):
+        """Copies the artifact into a shared memory segment (once) and returns its SharedArray description."""
+
+        key = (path, name)
+
+        with self.lock:
+            if key not in self.segments:
+                array = np.ascontiguousarray(self.get(path, name, loader))
+                segment = shared_memory.SharedMemory(
+                    create=True, size=max(array.nbytes, 1)
+                )
+                shared = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)
+                shared[...] = array
+                self.segments[key] = (
+                    segment,
+                    SharedArray(segment.name, array.shape, array.dtype.str),
+                )
+
+            return self.segments[key][1]
+
+    def share_array(self, path, name, array):
+        """Registers an array computed in memory and copies it into shared memory."""
+        return self.share(path, name, lambda: array)
+
+    def allocate(self, path, name, shape, dtype):
+        """
+        Allocates a zero initialised shared memory segment, that worker processes attach writable.
+        Returns (SharedArray, array of this process), the array has to be dropped before the segment is invalidated.
+        """
+
+        key = (path, name)
+        dtype = np.dtype(dtype)
+
+        with self.lock:
+            if key in self.segments:
+                self.release_segment(key)
+
+            segment = shared_memory.SharedMemory(
+                create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1)
+            )
+            array = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+            array[...] = 0
+            self.segments[key] = (segment, SharedArray(segment.name, tuple(shape), dtype.str))
+
+            return self.segments[key][1], array
+
+    def invalidate(self, path, prefix=""):
+        """Drops the artifacts of an experiment whose names start with prefix, e.g. after they were rewritten."""
+
+        prefix = normalize_path(prefix)
+
+        with self.lock:
+            for key in list(self.artifacts):
+                if key[0] == path and str(key[1]).startswith(prefix):
+                    del self.artifacts[key]
+
+            for key in list(self.segments):
+                if key[0] == path and str(key[1]).startswith(prefix):
+                    self.release_segment(key)
+
+        pass
+
+    def release_segment(self, key):
+        segment, _ = self.segments.pop(key)
+        segment.close()
+        segment.unlink()
+
+        pass
+
+    def clear(self):
+
+        with self.lock:
+            self.artifacts = {}
+            for key in list(self.segments):
+                self.release_segment(key)
+
+        pass
+
+
+def attach(shared_array, writeable=False):
+    """Returns an array backed by the shared memory segment described by shared_array, read-only unless writeable."""
+
+    if shared_array.name not in _attached_segments:
+        try:
+            segment = shared_memory.SharedMemory(name=shared_array.name, track=False)
+        except TypeError:
+            # python < 3.13 has no track argument
+            segment = shared_memory.SharedMemory(name=shared_array.name)
+        _attached_segments[shared_array.name] = segment
+
+    array = np.ndarray(
+        shared_array.shape,
+        dtype=np.dtype(shared_array.dtype),
+        buffer=_attached_segments[shared_array.name].buf,
+    )
+    array.flags.writeable = writeable
+
+    return array
+
+
+def load_npy(path, path_file, mmap_mode="r", storage=None):
+    """Loads an array of the experiment path from the storage through the registry of this process."""
+
+    if storage is None:
+        storage = get_storage()
+
+    return registry.get(
+        path,
+        normalize_path(path_file) + ":" + str(mmap_mode),
+        partial(storage.load, path_file, mmap_mode=mmap_mode),
+        storage.get_identity(),
+    )
+
+
+def save_npy(path, path_file, array, storage=None):
+    """
+    Saves an array of the experiment path and drops it from the registry, so that it is loaded again.
+    Views handed out before keep the previous array.
+    """
+
+    if storage is None:
+        storage = get_storage()
+
+    storage.save(path_file, array)
+    registry.invalidate(path, path_file)
+
+    pass
+
+
+# the registry of this process
+registry = ArtifactRegistry()
+atexit.register(registry.clear)
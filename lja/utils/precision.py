@@ -0,0 +1,156 @@
+import os
+import numpy as np
+from numpy.lib.mixins import NDArrayOperatorsMixin
+import lja.utils.config_functions as cfg_funcs
+
+
+class ComputeView(NDArrayOperatorsMixin):
+    """
+    A read-only view of an array stored in a lower precision, e.g. a float16 memmap.
+    Each indexed part is cast to the compute dtype when it is read, the array itself stays on disk.
+    Operations on the whole view (numpy functions, arithmetic) cast the whole array.
+    """
+
+    def __init__(self, array, dtype):
+        super(ComputeView, self).__init__()
+
+        self.array = array
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    @property
+    def ndim(self):
+        return self.array.ndim
+
+    @property
+    def size(self):
+        return self.array.size
+
+    @property
+    def T(self):
+        return np.asarray(self).T
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        return np.asarray(self.array[index]).astype(self.dtype)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.array).astype(self.dtype if dtype is None else dtype)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = [np.asarray(i) if isinstance(i, ComputeView) else i for i in inputs]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def reshape(self, *shape):
+        return np.asarray(self).reshape(*shape)
+
+    def astype(self, dtype):
+        return np.asarray(self, dtype=dtype)
+
+
+class PrecisionPolicy:
+    """
+    Creates a precision policy, that defines the dtype all stages compute in and the dtype
+    each artifact is stored with, e.g. float16 for U, features and activations.
+    Artifacts without an entry are stored in the compute dtype.
+    """
+
+    def __init__(self, compute="float32", storage=None):
+        super(PrecisionPolicy, self).__init__()
+
+        self.compute_dtype = np.dtype(compute)
+        self.storage_dtypes = {
+            name: np.dtype(dtype) for name, dtype in dict(storage or {}).items()
+        }
+
+    def get_storage_dtype(self, name):
+        return self.storage_dtypes.get(name, self.compute_dtype)
+
+    def to_compute(self, array):
+        """Casts floating point arrays to the compute dtype, other arrays are returned unchanged."""
+
+        array = np.asanyarray(array)
+        if np.issubdtype(array.dtype, np.floating) and array.dtype != self.compute_dtype:
+            return array.astype(self.compute_dtype)
+
+        return array
+
+    def view(self, array):
+        """
+        Like to_compute, but without reading the array: arrays stored in another floating point dtype
+        are wrapped in a ComputeView, that casts only the parts that are read.
+        """
+
+        if np.issubdtype(array.dtype, np.floating) and array.dtype != self.compute_dtype:
+            return ComputeView(array, self.compute_dtype)
+
+        return array
+
+    def to_storage(self, name, array):
+        """Casts floating point arrays to the storage dtype of the artifact name."""
+
+        array = np.asanyarray(array)
+        dtype = self.get_storage_dtype(name)
+        if np.issubdtype(array.dtype, np.floating) and array.dtype != dtype:
+            return array.astype(dtype)
+
+        return array
+
+    def get_config(self):
+        """Description of the policy, part of the cache keys of the stages."""
+        return {
+            "compute": self.compute_dtype.name,
+            "storage": {
+                name: dtype.name for name, dtype in sorted(self.storage_dtypes.items())
+            },
+        }
+
+
+def relative_error(reference, approximation):
+    """Relative Frobenius error of an approximation, computed in float64."""
+
+    reference = np.asarray(reference, dtype=np.float64)
+    approximation = np.asarray(approximation, dtype=np.float64)
+    norm = np.linalg.norm(reference)
+
+    if norm == 0:
+        return float(np.linalg.norm(approximation))
+
+    return float(np.linalg.norm(reference - approximation) / norm)
+
+
+# precision policy of this process, read from configs.yml on first use
+_precision_policy = None
+
+
+def get_precision_policy():
+    """Returns the precision policy of this process, configured under defaults: precision: in configs.yml."""
+
+    global _precision_policy
+
+    if _precision_policy is None:
+        config = {}
+        if os.path.exists("configs/configs.yml"):
+            config = cfg_funcs.load_configs("defaults").get("precision", {})
+
+        _precision_policy = PrecisionPolicy(**config)
+
+    return _precision_policy
+
+
+def set_precision_policy(policy):
+    """Replaces the precision policy of this process, e.g. to compare float16 against float32 storage."""
+
+    global _precision_policy
+    _precision_policy = policy
+
+    pass
@@ -0,0 +1,559 @@
+import io
+import os
+import re
+import json
+import shutil
+import uuid
+import hashlib
+import abc
+import threading
+import numpy as np
+import scipy.sparse
+import lja.utils.config_functions as cfg_funcs
+from lja.utils.storage_functions import append_npy
+
+
+def normalize_path(path):
+    """Key of an artifact, repeated slashes of concatenated paths are collapsed."""
+    return re.sub("/+", "/", path)
+
+
+class Storage(abc.ABC):
+    """
+    Base class of the storage backends. Artifacts are addressed by their relative path,
+    e.g. results/decompositions/mnist/dropout/left/Layer0/u.npy
+    """
+
+    @abc.abstractmethod
+    def save(self, path, array):
+        pass
+
+    @abc.abstractmethod
+    def load(self, path, mmap_mode=None):
+        pass
+
+    @abc.abstractmethod
+    def append(self, path, array):
+        """Appends an array along the first axis, creates the artifact if it does not exist."""
+        pass
+
+    @abc.abstractmethod
+    def open_memmap(self, path, mode="r+", dtype=None, shape=None):
+        """Opens a writable array, mode w+ allocates it with dtype and shape (zero initialised)."""
+        pass
+
+    @abc.abstractmethod
+    def exists(self, path):
+        pass
+
+    @abc.abstractmethod
+    def list(self, prefix):
+        """Returns the paths of all artifacts starting with prefix."""
+        pass
+
+    @abc.abstractmethod
+    def remove(self, prefix):
+        """Removes all artifacts starting with prefix."""
+        pass
+
+    @abc.abstractmethod
+    def write_text(self, path, text):
+        pass
+
+    @abc.abstractmethod
+    def read_text(self, path):
+        pass
+
+    @abc.abstractmethod
+    def get_fingerprint(self, prefix):
+        """A hash that changes whenever an artifact starting with prefix is written."""
+        pass
+
+    @abc.abstractmethod
+    def get_identity(self):
+        """Identifies where the artifacts are stored, storages with the same identity hold the same artifacts."""
+        pass
+
+    def save_sparse(self, path, matrix):
+        """Saves a sparse matrix in the format of scipy.sparse.save_npz, as bytes array."""
+
+        buffer = io.BytesIO()
+        scipy.sparse.save_npz(buffer, matrix)
+        self.save(path, np.frombuffer(buffer.getvalue(), dtype=np.uint8))
+
+        pass
+
+    def load_sparse(self, path):
+        return scipy.sparse.load_npz(io.BytesIO(np.asarray(self.load(path)).tobytes()))
+
+    def flush(self):
+        pass
+
+    def normalize(self, path):
+        return normalize_path(path)
+
+
+class LocalStorage(Storage):
+    """Stores every artifact as .npy file in the local file system, relative to root."""
+
+    def __init__(self, root=""):
+        super(LocalStorage, self).__init__()
+
+        self.root = root
+
+    def get_file_path(self, path):
+        return os.path.join(self.root, path)
+
+    def create_folder(self, path):
+        folder = os.path.dirname(self.get_file_path(path))
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        pass
+
+    def save(self, path, array):
+        """Writes a new file, that replaces the old one, arrays memory mapped from the old file stay valid."""
+
+        self.create_folder(path)
+        file_path = self.get_file_path(path)
+        with open(file_path + ".tmp", "wb") as f:
+            np.save(f, array)
+        os.replace(file_path + ".tmp", file_path)
+
+        pass
+
+    def load(self, path, mmap_mode=None):
+        return np.load(self.get_file_path(path), mmap_mode=mmap_mode)
+
+    def append(self, path, array):
+        self.create_folder(path)
+        append_npy(self.get_file_path(path), array)
+
+        pass
+
+    def open_memmap(self, path, mode="r+", dtype=None, shape=None):
+        self.create_folder(path)
+        return np.lib.format.open_memmap(
+            self.get_file_path(path), mode=mode, dtype=dtype, shape=shape
+        )
+
+    def save_sparse(self, path, matrix):
+        self.create_folder(path)
+        scipy.sparse.save_npz(self.get_file_path(path), matrix)
+
+        pass
+
+    def load_sparse(self, path):
+        return scipy.sparse.load_npz(self.get_file_path(path))
+
+    def exists(self, path):
+        return os.path.exists(self.get_file_path(path))
+
+    def list(self, prefix):
+
+        paths = []
+        folder = self.get_file_path(prefix)
+        if os.path.isfile(folder):
+            return [prefix]
+
+        for root, dirs, files in os.walk(folder):
+            for name in files:
+                paths.append(os.path.relpath(os.path.join(root, name), self.root or "."))
+
+        return sorted(paths)
+
+    def remove(self, prefix):
+
+        file_path = self.get_file_path(prefix)
+        if os.path.isdir(file_path):
+            shutil.rmtree(file_path)
+        elif os.path.exists(file_path):
+            os.remove(file_path)
+
+        pass
+
+    def write_text(self, path, text):
+        self.create_folder(path)
+        with open(self.get_file_path(path), "w") as f:
+            f.write(text)
+
+        pass
+
+    def read_text(self, path):
+        with open(self.get_file_path(path), "r") as f:
+            return f.read()
+
+    def get_fingerprint(self, prefix):
+
+        h = hashlib.sha256()
+        for path in self.list(prefix):
+            stat = os.stat(self.get_file_path(path))
+            h.update(path.encode())
+            h.update(str((stat.st_size, stat.st_mtime_ns)).encode())
+
+        return h.hexdigest()
+
+    def get_identity(self):
+        return "local:" + os.path.abspath(self.root or ".")
+
+
+class MemoryStorage(Storage):
+    """Keeps all artifacts in memory of the running process, e.g. for benchmarks and short sweeps."""
+
+    def __init__(self):
+        super(MemoryStorage, self).__init__()
+
+        self.arrays = {}
+        self.texts = {}
+        self.versions = {}
+        self.lock = threading.RLock()
+        self.identity = "memory:" + uuid.uuid4().hex
+
+    def touch(self, path):
+        self.versions[path] = self.versions.get(path, 0) + 1
+
+    def save(self, path, array):
+        path = self.normalize(path)
+        with self.lock:
+            self.arrays[path] = np.array(array)
+            self.touch(path)
+
+        pass
+
+    def load(self, path, mmap_mode=None):
+        path = self.normalize(path)
+        if path not in self.arrays:
+            raise FileNotFoundError("MemoryStorage: no artifact " + path)
+
+        if mmap_mode is None or mmap_mode == "c":
+            return self.arrays[path].copy()
+
+        # read-only or writable view, like a memory map
+        array = self.arrays[path].view()
+        array.flags.writeable = mmap_mode != "r"
+        return array
+
+    def append(self, path, array):
+        path = self.normalize(path)
+        with self.lock:
+            if path in self.arrays:
+                stored = self.arrays[path]
+                array = np.concatenate((stored, np.asarray(array, stored.dtype)))
+            self.save(path, array)
+
+        pass
+
+    def open_memmap(self, path, mode="r+", dtype=None, shape=None):
+        path = self.normalize(path)
+        with self.lock:
+            if mode == "w+":
+                self.arrays[path] = np.zeros(shape, dtype=dtype)
+            self.touch(path)
+
+        return self.load(path, mmap_mode=mode)
+
+    def exists(self, path):
+        path = self.normalize(path)
+        return path in self.arrays or path in self.texts
+
+    def list(self, prefix):
+        prefix = self.normalize(prefix)
+        return sorted(p for p in list(self.arrays) + list(self.texts) if p.startswith(prefix))
+
+    def remove(self, prefix):
+        prefix = self.normalize(prefix)
+        with self.lock:
+            for path in self.list(prefix):
+                self.arrays.pop(path, None)
+                self.texts.pop(path, None)
+                self.touch(path)
+
+        pass
+
+    def write_text(self, path, text):
+        path = self.normalize(path)
+        with self.lock:
+            self.texts[path] = text
+            self.touch(path)
+
+        pass
+
+    def read_text(self, path):
+        path = self.normalize(path)
+        if path not in self.texts:
+            raise FileNotFoundError("MemoryStorage: no artifact " + path)
+
+        return self.texts[path]
+
+    def get_fingerprint(self, prefix):
+        prefix = self.normalize(prefix)
+        h = hashlib.sha256()
+        for path in self.list(prefix):
+            h.update(path.encode())
+            h.update(str(self.versions.get(path, 0)).encode())
+
+        return h.hexdigest()
+
+    def get_identity(self):
+        return self.identity
+
+
+class ContainerStorage(Storage):
+    """
+    Consolidates all artifacts into one binary container file with a json index of offsets,
+    shapes and dtypes. Arrays are memory mapped directly from the container. Rewritten artifacts
+    are appended, the space of the old version is reclaimed by compact().
+    """
+
+    def __init__(self, root="results/container/", alignment=64):
+        super(ContainerStorage, self).__init__()
+
+        self.root = root
+        self.alignment = alignment
+        self.data_path = os.path.join(root, "container.bin")
+        self.index_path = os.path.join(root, "index.json")
+        self.lock = threading.RLock()
+
+        if not os.path.exists(root):
+            os.makedirs(root)
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+
+        if not os.path.exists(self.data_path):
+            open(self.data_path, "wb").close()
+
+    def write_index(self):
+        with open(self.index_path, "w") as f:
+            json.dump(self.index, f)
+
+        pass
+
+    def allocate(self, nbytes):
+        """Returns the aligned offset at the end of the container, that can hold nbytes."""
+
+        size = os.path.getsize(self.data_path)
+        offset = -(-size // self.alignment) * self.alignment
+        with open(self.data_path, "r+b") as f:
+            f.truncate(offset + nbytes)
+
+        return offset
+
+    def write_bytes(self, offset, data):
+        with open(self.data_path, "r+b") as f:
+            f.seek(offset)
+            f.write(data)
+
+        pass
+
+    def save(self, path, array):
+        path = self.normalize(path)
+        array = np.ascontiguousarray(array)
+
+        with self.lock:
+            offset = self.allocate(array.nbytes)
+            self.write_bytes(offset, array.tobytes())
+            self.index[path] = {
+                "offset": offset,
+                "shape": list(array.shape),
+                "dtype": array.dtype.str,
+                "version": self.index.get(path, {}).get("version", 0) + 1,
+            }
+            self.write_index()
+
+        pass
+
+    def load(self, path, mmap_mode=None):
+        path = self.normalize(path)
+        if path not in self.index:
+            raise FileNotFoundError("ContainerStorage: no artifact " + path)
+
+        entry = self.index[path]
+        if "text" in entry:
+            raise Exception("ContainerStorage: " + path + " is a text artifact")
+
+        dtype = np.dtype(entry["dtype"])
+        shape = tuple(entry["shape"])
+
+        if int(np.prod(shape)) == 0:
+            return np.empty(shape, dtype=dtype)
+
+        array = np.memmap(
+            self.data_path,
+            dtype=dtype,
+            mode=mmap_mode or "r",
+            offset=entry["offset"],
+            shape=shape,
+        )
+
+        if mmap_mode is None:
+            return np.array(array)
+
+        return array
+
+    def append(self, path, array):
+        path = self.normalize(path)
+        array = np.asarray(array)
+
+        with self.lock:
+            if path not in self.index:
+                self.save(path, array)
+                return
+
+            entry = self.index[path]
+            dtype = np.dtype(entry["dtype"])
+            end = entry["offset"] + int(np.prod(entry["shape"])) * dtype.itemsize
+
+            # extend in place if the artifact is the last one in the container
+            if end == os.path.getsize(self.data_path):
+                self.write_bytes(end, np.ascontiguousarray(array, dtype=dtype).tobytes())
+                entry["shape"][0] += array.shape[0]
+                entry["version"] += 1
+                self.write_index()
+            else:
+                stored = self.load(path)
+                self.save(path, np.concatenate((stored, array.astype(dtype))))
+
+        pass
+
+    def open_memmap(self, path, mode="r+", dtype=None, shape=None):
+        path = self.normalize(path)
+        with self.lock:
+            if mode == "w+":
+                dtype = np.dtype(dtype)
+                offset = self.allocate(int(np.prod(shape)) * dtype.itemsize)
+                self.index[path] = {
+                    "offset": offset,
+                    "shape": list(shape),
+                    "dtype": dtype.str,
+                    "version": self.index.get(path, {}).get("version", 0) + 1,
+                }
+                self.write_index()
+                mode = "r+"
+
+        return self.load(path, mmap_mode=mode)
+
+    def exists(self, path):
+        path = self.normalize(path)
+        return path in self.index
+
+    def list(self, prefix):
+        prefix = self.normalize(prefix)
+        return sorted(p for p in self.index if p.startswith(prefix))
+
+    def remove(self, prefix):
+        prefix = self.normalize(prefix)
+        with self.lock:
+            for path in self.list(prefix):
+                del self.index[path]
+            self.write_index()
+
+        pass
+
+    def write_text(self, path, text):
+        path = self.normalize(path)
+        with self.lock:
+            self.index[path] = {
+                "text": text,
+                "version": self.index.get(path, {}).get("version", 0) + 1,
+            }
+            self.write_index()
+
+        pass
+
+    def read_text(self, path):
+        path = self.normalize(path)
+        if path not in self.index or "text" not in self.index[path]:
+            raise FileNotFoundError("ContainerStorage: no text artifact " + path)
+
+        return self.index[path]["text"]
+
+    def get_fingerprint(self, prefix):
+        prefix = self.normalize(prefix)
+        h = hashlib.sha256()
+        for path in self.list(prefix):
+            h.update(path.encode())
+            h.update(str(self.index[path]["version"]).encode())
+
+        return h.hexdigest()
+
+    def get_identity(self):
+        return "container:" + os.path.abspath(self.root)
+
+    def compact(self):
+        """
+        Rewrites the container without the space of removed or overwritten artifacts.
+        The artifacts are copied into a new file, that replaces the old one, arrays memory mapped
+        from the old container stay valid.
+        """
+
+        with self.lock:
+            offsets = {}
+            compacted_path = self.data_path + ".compact"
+
+            with open(self.data_path, "rb") as source, open(compacted_path, "wb") as f:
+                for path, entry in self.index.items():
+                    if "text" in entry:
+                        continue
+
+                    nbytes = int(np.prod(entry["shape"])) * np.dtype(entry["dtype"]).itemsize
+                    offsets[path] = -(-f.tell() // self.alignment) * self.alignment
+                    f.truncate(offsets[path])
+                    f.seek(offsets[path])
+
+                    source.seek(entry["offset"])
+                    f.write(source.read(nbytes))
+
+            os.replace(compacted_path, self.data_path)
+
+            for path, offset in offsets.items():
+                self.index[path]["offset"] = offset
+            self.write_index()
+
+        pass
+
+
+# storage of this process, selected from configs.yml on first use
+_storage = None
+
+
+def create_storage(backend="local", root="", container_path="results/container/"):
+
+    if backend == "local":
+        return LocalStorage(root)
+
+    elif backend == "memory":
+        return MemoryStorage()
+
+    elif backend == "container":
+        return ContainerStorage(container_path)
+
+    else:
+        raise Exception("Storage: invalid backend " + str(backend))
+
+
+def get_storage():
+    """Returns the storage backend of this process, configured under defaults: storage: in configs.yml."""
+
+    global _storage
+
+    if _storage is None:
+        config = {}
+        if os.path.exists("configs/configs.yml"):
+            config = cfg_funcs.load_configs("defaults").get("storage", {})
+
+        _storage = create_storage(**config)
+
+    return _storage
+
+
+def set_storage(storage):
+    """Replaces the storage backend of this process, e.g. by a MemoryStorage for a benchmark."""
+
+    global _storage
+    _storage = storage
+
+    pass
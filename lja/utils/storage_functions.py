@@ -0,0 +1,81 @@
+import os
+import numpy as np
+
+
+def read_npy_header(f):
+    """Reads the header of an opened .npy file and returns (shape, fortran_order, dtype, data_offset)."""
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+
+    return shape, fortran_order, dtype, f.tell()
+
+
+def write_npy_header_inplace(f, shape, dtype, data_offset):
+    """
+    Overwrites the header of an opened .npy file with a new shape.
+    Returns False if the new header does not fit into the space of the old one.
+    """
+
+    header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (
+        np.lib.format.dtype_to_descr(dtype),
+        tuple(shape),
+    )
+
+    # magic string (6) + version (2) + header length field (2 for v1.0, 4 otherwise)
+    f.seek(6)
+    major = np.frombuffer(f.read(2), dtype=np.uint8)[0]
+    length_field = 2 if major == 1 else 4
+    header_space = data_offset - 8 - length_field
+
+    if len(header) + 1 > header_space:
+        return False
+
+    header = header + " " * (header_space - len(header) - 1) + "\n"
+    f.seek(8 + length_field)
+    f.write(header.encode("latin1"))
+
+    return True
+
+
+def append_npy(path, array):
+    """
+    Appends an array along the first axis to the .npy file at path.
+    The data is written to the end of the file and only the header is rewritten,
+    so the cost is proportional to the appended array. Falls back to a full rewrite
+    if the file is fortran ordered or the header cannot grow in place.
+    """
+
+    array = np.asarray(array)
+
+    # create new file
+    if not os.path.exists(path):
+        np.save(path, array)
+        return
+
+    with open(path, "r+b") as f:
+        shape, fortran_order, dtype, data_offset = read_npy_header(f)
+
+        if tuple(shape[1:]) != tuple(array.shape[1:]):
+            raise Exception(
+                "append_npy: shape mismatch " + str(shape) + " and " + str(array.shape)
+            )
+
+        new_shape = (shape[0] + array.shape[0],) + tuple(shape[1:])
+
+        if not fortran_order and write_npy_header_inplace(
+            f, new_shape, dtype, data_offset
+        ):
+            f.seek(0, os.SEEK_END)
+            f.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+            return
+
+    # fallback: rewrite the whole file into a new one, arrays memory mapped from the old file stay valid
+    stored = np.load(path)
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, np.concatenate((stored, array.astype(stored.dtype)), axis=0))
+    os.replace(path + ".tmp", path)
+
+    pass
@@ -26,8 +26,9 @@ labels = labels[indices]
 # 3. Create extractor
 extractor = LTExtractor(manager.net, x0, labels)
 
-# 4. Extract linear transformations
-extractor.extract()
+# 4. Extract linear transformations, unless already stored for this network and query
+if not extractor.is_cached("mnist/dropout/"):
+    extractor.extract()
 
-# 5. Store
-extractor.store("mnist/dropout/")
+    # 5. Store
+    extractor.store("mnist/dropout/")
@@ -1,3 +1,14 @@
+"""
+Decomposes the transformations extracted from the mnist network.
+
+To update the decomposition with samples appended by extractor.store(..., append=True):
+
+    decomp = Decomposition("mnist/dropout/")
+    decomp.load(side="left", append=True)
+    decomp.decompose(None, "left", append=True)
+    decomp.store()
+"""
+
 from lja.decomposition.decomposition import Decomposition
 
 # Create Decomposition Object
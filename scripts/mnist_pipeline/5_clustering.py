@@ -1,3 +1,14 @@
+"""
+Clusters the decomposed transformations of the mnist network.
+
+To choose n_neighbors and number_of_clusters from a sweep over the parameters:
+
+    scores = clusterer.sweep(
+        k=10, n_neighbors_list=(10, 20, 30), number_of_clusters_list=range(2, 21)
+    )
+    print(scores.sort_values("silhouette", ascending=False).groupby("layer").head(3))
+"""
+
 from lja.clusterer.clusterer import Clusterer
 
 clusterer = Clusterer("mnist/dropout/")
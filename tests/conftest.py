@@ -0,0 +1,119 @@
+import os
+import numpy as np
+import pytest
+from lja.utils.storage import LocalStorage, set_storage
+from lja.utils.precision import PrecisionPolicy, set_precision_policy
+from lja.utils.artifact_registry import registry
+
+# layer sizes of the synthetic network, input first
+SIZES = [20, 12, 8, 6]
+NUMBER_OF_SAMPLES = 40
+PATH = "synthetic/test/"
+
+
+def write_extraction(number_of_samples=NUMBER_OF_SAMPLES, seed=0, path=PATH):
+    """
+    Stores the activations, transformations and labels of a random ReLU network, like LTExtractor.store.
+    The transformation of a sample is the weight matrix with the rows of inactive units set to zero.
+    """
+
+    rng = np.random.default_rng(seed)
+    root = "results/transformations/" + path
+    weights = [
+        rng.normal(size=(SIZES[i + 1], SIZES[i] + 1)).astype(np.float32) / 3
+        for i in range(len(SIZES) - 1)
+    ]
+
+    activations = [np.abs(rng.normal(size=(number_of_samples, SIZES[0]))).astype(np.float32)]
+    transformations = []
+    for W in weights:
+        x = np.concatenate(
+            (activations[-1], np.ones((number_of_samples, 1), np.float32)), axis=1
+        )
+        preactivation = x @ W.T
+        active = (preactivation > 0).astype(np.float32)
+        transformations.append(W[None] * active[:, :, None])
+        activations.append(preactivation * active)
+
+    for layer, activation in enumerate(activations):
+        os.makedirs(root + "Layer" + str(layer), exist_ok=True)
+        np.save(root + "Layer" + str(layer) + "/activation.npy", activation)
+        if layer < len(transformations):
+            np.save(
+                root + "Layer" + str(layer) + "/transformation.npy",
+                transformations[layer],
+            )
+
+    np.save(root + "labels.npy", rng.integers(0, 10, number_of_samples))
+    np.save(root + "number_of_layers.npy", len(transformations))
+
+    return transformations
+
+
+def write_decomposition(k_list=(6, 5, 4), side="left", path=PATH):
+    """Decomposes and stores the transformations of the stored extraction."""
+
+    from lja.decomposition.decomposition import Decomposition
+
+    decomposition = Decomposition(path)
+    decomposition.load(side)
+    decomposition.decompose(list(k_list), side)
+    decomposition.store()
+
+    pass
+
+
+@pytest.fixture
+def working_directory(tmp_path):
+    """An empty temporary working directory, with the local storage and float32 precision."""
+
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    set_storage(LocalStorage())
+    set_precision_policy(PrecisionPolicy("float32"))
+    registry.clear()
+
+    try:
+        yield tmp_path
+
+    finally:
+        os.chdir(cwd)
+        set_storage(None)
+        set_precision_policy(None)
+        registry.clear()
+
+
+@pytest.fixture(scope="session")
+def experiment(tmp_path_factory):
+    """
+    A results tree of a synthetic network in a temporary working directory: the extraction, the left
+    decomposition and the clusters of the write vectors. Stored with float32 and the local storage.
+    """
+
+    from lja.clusterer.clusterer_stackedvectors import Clusterer
+
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("experiment"))
+    set_storage(LocalStorage())
+    set_precision_policy(PrecisionPolicy("float32"))
+    registry.clear()
+
+    try:
+        write_extraction()
+
+        write_decomposition()
+
+        clusterer = Clusterer(PATH)
+        clusterer.load()
+        clusterer.cluster_all_layers(
+            k=4, plot=False, n_neighbors=8, number_of_clusters=[3, 3]
+        )
+        clusterer.store()
+
+        yield PATH
+
+    finally:
+        os.chdir(cwd)
+        set_storage(None)
+        set_precision_policy(None)
+        registry.clear()
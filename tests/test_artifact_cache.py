@@ -0,0 +1,30 @@
+from lja.decomposition.decomposition import Decomposition
+from lja.utils.storage import get_storage
+from conftest import PATH, write_extraction
+
+
+def decompose(k_list):
+    decomposition = Decomposition(PATH)
+    decomposition.load()
+    decomposition.decompose(k_list, "left")
+    decomposition.store()
+
+    return decomposition
+
+
+def test_decomposition_is_reused_for_unchanged_inputs(working_directory):
+    write_extraction()
+
+    assert not decompose([6, 5, 4]).reused
+    assert decompose([6, 5, 4]).reused
+
+    # another config
+    assert not decompose([5, 5, 4]).reused
+    assert decompose([5, 5, 4]).reused
+
+    # rewritten transformations
+    storage = get_storage()
+    path = "results/transformations/" + PATH + "Layer0/transformation.npy"
+    storage.save(path, storage.load(path) * 2)
+
+    assert not decompose([5, 5, 4]).reused
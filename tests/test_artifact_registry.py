@@ -0,0 +1,27 @@
+import numpy as np
+from lja.utils.storage import LocalStorage, MemoryStorage
+from lja.utils.artifact_registry import load_npy, save_npy
+
+
+def test_registry_separates_storages(working_directory):
+    local, memory = LocalStorage(), MemoryStorage()
+    local.save("results/a.npy", np.zeros(3))
+    memory.save("results/a.npy", np.ones(3))
+
+    np.testing.assert_array_equal(load_npy("p/", "results/a.npy", storage=local), np.zeros(3))
+    np.testing.assert_array_equal(load_npy("p/", "results/a.npy", storage=memory), np.ones(3))
+
+
+def test_registry_shares_and_evicts_rewritten_arrays(working_directory):
+    storage = LocalStorage()
+    storage.save("results/a.npy", np.zeros(3))
+
+    view = load_npy("p/", "results//a.npy", storage=storage)
+    assert np.shares_memory(view, load_npy("p/", "results/a.npy", storage=storage))
+    assert not view.flags.writeable
+
+    save_npy("p/", "results/a.npy", np.ones(4), storage)
+
+    np.testing.assert_array_equal(load_npy("p/", "results/a.npy", storage=storage), np.ones(4))
+    # views handed out before keep the previous array
+    np.testing.assert_array_equal(view, np.zeros(3))
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from lja.clusterer.clusterer_stackedvectors import Clusterer
+from conftest import PATH, write_extraction, write_decomposition
+
+
+def cluster(backend):
+    clusterer = Clusterer(PATH)
+    clusterer.backend = backend
+    clusterer.load()
+    clusterer.cluster_all_layers(
+        k=4, plot=False, n_neighbors=8, number_of_clusters=[3, 3]
+    )
+    clusterer.store()
+
+    return clusterer
+
+
+def new_clusterer():
+    clusterer = Clusterer(PATH)
+    clusterer.side = "left"
+
+    return clusterer
+
+
+@pytest.mark.parametrize("method", ["nystrom", "vote"])
+def test_assign_reproduces_the_clusters_of_the_clustered_samples(
+    working_directory, method
+):
+    write_extraction()
+    write_decomposition()
+    clusterer = cluster("spectral")
+
+    for layer in range(len(clusterer.clusters)):
+        labels = new_clusterer().assign(clusterer.u_list[layer], layer, method)
+
+        assert np.mean(labels == clusterer.clusters[layer][1]) >= 0.95
+
+
+def test_assign_refuses_clusters_of_other_backends(working_directory):
+    write_extraction()
+    write_decomposition()
+    clusterer = cluster("spectral")
+    cluster("minibatch_kmeans")
+
+    with pytest.raises(Exception, match="no assignment stored"):
+        new_clusterer().assign(clusterer.u_list[0], 0)
+
+    minibatch = new_clusterer()
+    minibatch.backend = "minibatch_kmeans"
+    with pytest.raises(Exception, match="not supported"):
+        minibatch.assign(clusterer.u_list[0], 0)
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+import pytest
+from lja.clusterer import clusterer as base
+from lja.clusterer.clusterer_stackedvectors import Clusterer
+from conftest import PATH, write_extraction, write_decomposition
+
+
+@pytest.fixture
+def clusterer(experiment):
+    clusterer = Clusterer(experiment)
+    clusterer.load()
+
+    return clusterer
+
+
+def test_parallel_sweep_matches_serial_sweep(clusterer):
+    arguments = dict(k=4, n_neighbors_list=(5, 8), number_of_clusters_list=[2, 3, 4])
+
+    serial = clusterer.sweep(n_jobs=1, **arguments)
+    parallel = clusterer.sweep(n_jobs=2, **arguments)
+
+    assert len(serial) > 0
+    pd.testing.assert_frame_equal(parallel, serial)
+
+
+def test_parallel_stability_matches_serial_stability(clusterer):
+    arguments = dict(k=4, n_neighbors=8, number_of_clusters=[3, 3], n_bootstraps=4)
+
+    serial, serial_coassignments = clusterer.stability(n_jobs=1, **arguments)
+    parallel, parallel_coassignments = clusterer.stability(n_jobs=2, **arguments)
+
+    assert len(serial) > 0
+    pd.testing.assert_frame_equal(parallel, serial)
+    for layer in serial_coassignments:
+        np.testing.assert_allclose(
+            parallel_coassignments[layer], serial_coassignments[layer]
+        )
+
+
+
+@pytest.fixture
+def embedding_calls(monkeypatch):
+    """Layers of the spectral embeddings computed while the test runs."""
+
+    calls = []
+    compute = base.Clusterer.compute_spectral_embedding
+
+    def counting(self, *args, **kwargs):
+        calls.append(kwargs.get("layer"))
+        return compute(self, *args, **kwargs)
+
+    monkeypatch.setattr(base.Clusterer, "compute_spectral_embedding", counting)
+
+    return calls
+
+
+def cluster(n_neighbors, number_of_clusters):
+    clusterer = Clusterer(PATH)
+    clusterer.load()
+    clusterer.cluster_all_layers(
+        k=4, plot=False, n_neighbors=n_neighbors, number_of_clusters=number_of_clusters
+    )
+    clusterer.store()
+
+    return clusterer
+
+
+def test_spectral_embedding_is_reused_across_numbers_of_clusters(
+    working_directory, embedding_calls
+):
+    write_extraction()
+    write_decomposition()
+
+    first = cluster(8, [3, 3])
+    layers = len(first.get_layers_to_cluster())
+    assert len(embedding_calls) == layers and not first.embedding_reused
+
+    # only the number of clusters changes, the stored embedding is reused
+    second = cluster(8, [2, 4])
+    assert len(embedding_calls) == layers
+    assert second.embedding_reused and not second.reused
+    assert [int(c[0]) for c in second.clusters] == [2, 4]
+    for (eigenvalues, embedding), (expected_eigenvalues, expected_embedding) in zip(
+        second.embeddings, first.embeddings
+    ):
+        np.testing.assert_array_equal(eigenvalues, expected_eigenvalues)
+        np.testing.assert_array_equal(embedding, expected_embedding)
+
+    # another kNN graph invalidates the embedding
+    third = cluster(6, [2, 4])
+    assert len(embedding_calls) == 2 * layers and not third.embedding_reused
+
+
+def test_right_side_decompositions_are_clustered(working_directory):
+    write_extraction()
+    write_decomposition(side="right")
+
+    clusterer = Clusterer(PATH)
+    clusterer.load(side="right")
+    clusterer.cluster_all_layers(
+        k=4, plot=False, n_neighbors=8, number_of_clusters=[3, 3]
+    )
+    clusterer.store()
+
+    assert len(clusterer.u_list) == 0
+    for layer, (n_clusters, labels, centers) in enumerate(clusterer.clusters):
+        vh = clusterer.vh_list[layer]
+
+        assert labels.shape == (vh.shape[0], min(4, vh.shape[1]))
+        assert set(np.unique(labels)) == set(range(n_clusters))
+        assert np.asarray(centers).shape == (n_clusters, vh.shape[2])
+
+    # the base clusterer clusters the stacked read vectors of each sample
+    clusterer = base.Clusterer(PATH)
+    clusterer.load(side="right")
+    clusterer.cluster_all_layers(k=4, plot=False, n_neighbors=8, number_of_clusters=[3])
+
+    labels = clusterer.clusters[0][1]
+    assert labels.shape == (clusterer.vh_list[0].shape[0],)
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+from lja.analyser.dataloader import Dataloader
+from lja.feature_constructor.feature_constructor import ConstructorBySample
+
+
+def test_iter_layers_streams_the_loaded_arrays(experiment):
+    data = Dataloader(experiment)
+    data.load(layers=[1, 2])
+
+    layers = []
+    for layer, arrays in data.iter_layers(artifacts=("u", "transformation")):
+        layers.append(layer)
+        assert arrays["u"] is data.u_list[layer]
+        assert arrays["transformation"] is data.transformation_list[layer]
+
+    assert layers == [1, 2]
+
+
+def test_iter_layers_loads_features_on_demand(experiment):
+    constructor = ConstructorBySample(experiment)
+    constructor.load()
+    constructor.set_k_per_layer([6, 5, 4])
+    features = constructor.construct_layer_features(
+        [1], range(5), np.arange(40), plot=False, reuse_stored_features=False
+    )
+    constructor.flush_feature_stores()
+
+    data = Dataloader(experiment)
+    data.load()
+    assert len(data.feature_list) == 0
+
+    for layer, arrays in data.iter_layers(artifacts=("feature",), layers=[1]):
+        np.testing.assert_allclose(arrays["feature"], features[1])
+
+
+def load(experiment, **selection):
+    data = Dataloader(experiment)
+    data.load(load_cluster=True, **selection)
+
+    return data
+
+
+@pytest.mark.parametrize(
+    "selection",
+    [
+        {"samples": [31, 2, 17, 5]},
+        {"label_filter": [1, 4, 7]},
+        {"misclassified_only": True},
+        {"samples": range(20), "label_filter": [0, 1, 2, 3, 4]},
+    ],
+)
+def test_selected_samples_match_the_full_samples(experiment, selection):
+    full = load(experiment)
+    data = load(experiment, **selection)
+
+    assert 0 < len(data.sample_indices) < len(full.labels)
+    assert len(data.labels) == len(data.sample_indices)
+    if "label_filter" in selection:
+        assert np.isin(data.labels, selection["label_filter"]).all()
+    if selection.get("misclassified_only"):
+        assert data.misclassification_mask.all()
+
+    for index, sample_index in enumerate(data.sample_indices):
+        assert data.get_index(sample_index) == index
+        assert data.get_original_index(index) == sample_index
+        assert data.labels[index] == full.labels[sample_index]
+
+        for layer in range(data.number_of_layers):
+            for name in ["transformation_list", "u_list", "activation_list"]:
+                np.testing.assert_array_equal(
+                    getattr(data, name)[layer][index],
+                    getattr(full, name)[layer][sample_index],
+                )
+
+        # the stacked vectors of the last layer are not clustered
+        for layer in range(data.number_of_layers - 1):
+            np.testing.assert_array_equal(
+                data.clusters[layer][1][index], full.clusters[layer][1][sample_index]
+            )
+
+
+def test_get_index_refuses_samples_that_were_not_selected(experiment):
+    data = load(experiment, samples=[2, 5])
+
+    with pytest.raises(Exception, match="was not selected"):
+        data.get_index(3)
+
+
+def test_arrays_are_opened_memory_mapped_on_first_access(experiment):
+    data = Dataloader(experiment)
+    data.load(load_cluster=True)
+
+    lists = [data.transformation_list, data.activation_list, data.u_list, data.vh_list]
+    for lazy in lists + [data.clusters]:
+        assert not any(lazy.is_loaded(layer) for layer in range(len(lazy)))
+
+    transformation = data.transformation_list[1]
+
+    assert isinstance(transformation, np.memmap)
+    assert data.transformation_list.is_loaded(1)
+    assert not data.transformation_list.is_loaded(0)
+    assert not any(data.u_list.is_loaded(layer) for layer in range(len(data.u_list)))
+    for lazy in lists:
+        assert isinstance(lazy[0], np.memmap)
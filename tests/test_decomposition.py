@@ -0,0 +1,115 @@
+import json
+import numpy as np
+import pytest
+from lja.decomposition.decomposition import Decomposition
+from lja.utils.storage import get_storage
+from conftest import PATH, write_extraction
+
+
+def reconstruct(u, s, vh, side):
+    if side == "left":
+        return np.einsum("nok,k,kd->nod", u, s, vh)
+
+    return np.einsum("ok,k,nkd->nod", u, s, vh)
+
+
+def relative_error(reference, approximation):
+    return np.linalg.norm(approximation - reference) / np.linalg.norm(reference)
+
+
+def split_extraction(number_of_samples, number_of_first_samples):
+    """Stores the first samples of an extraction, returns the transformations of all samples and the arrays to append."""
+
+    transformations = write_extraction(number_of_samples)
+    storage = get_storage()
+    root = "results/transformations/" + PATH
+
+    paths = [root + "labels.npy"]
+    for layer in range(len(transformations) + 1):
+        paths.append(root + "Layer" + str(layer) + "/activation.npy")
+        if layer < len(transformations):
+            paths.append(root + "Layer" + str(layer) + "/transformation.npy")
+
+    appended = {}
+    for path in paths:
+        array = storage.load(path)
+        storage.save(path, array[:number_of_first_samples])
+        appended[path] = array[number_of_first_samples:]
+
+    return transformations, appended
+
+
+def test_storage_append_matches_concatenation(working_directory):
+    storage = get_storage()
+    array = np.arange(24, dtype=np.float32).reshape(4, 3, 2)
+
+    storage.append("a.npy", array[:1])
+    storage.append("a.npy", array[1:3])
+    storage.append("a.npy", array[3:])
+
+    np.testing.assert_array_equal(storage.load("a.npy"), array)
+
+
+@pytest.mark.parametrize("side", ["left", "right"])
+@pytest.mark.parametrize("k_list, tolerance", [([21, 13, 9], 1e-4), ([6, 5, 4], 0.05)])
+def test_incremental_decomposition_matches_batch_decomposition(
+    working_directory, side, k_list, tolerance
+):
+    """
+    With k at least the rank of the stacked transformations the update is exact,
+    otherwise its reconstruction error is close to the one of decomposing all samples at once.
+    """
+
+    transformations, appended = split_extraction(60, 40)
+
+    decomposition = Decomposition(PATH)
+    decomposition.load(side)
+    decomposition.decompose(k_list, side)
+    decomposition.store()
+
+    for path, array in appended.items():
+        get_storage().append(path, array)
+
+    decomposition = Decomposition(PATH)
+    decomposition.load(side, append=True)
+    decomposition.decompose(None, side, append=True)
+
+    for layer, (u, s, vh, k) in enumerate(decomposition.decompositions):
+        T = transformations[layer]
+        error = relative_error(T, reconstruct(u, s, vh, side))
+
+        u_batch, s_batch, vh_batch, _ = decomposition.get_decomposition(T, k, side)
+        error_batch = relative_error(T, reconstruct(u_batch, s_batch, vh_batch, side))
+
+        assert (u if side == "left" else vh).shape[0] == len(T)
+        assert error <= error_batch + tolerance
+
+
+@pytest.mark.parametrize("side", ["left", "right"])
+def test_appended_decomposition_records_precision_of_appended_samples(
+    working_directory, side
+):
+    """The recorded reconstruction error of an exact update is measured on the appended samples."""
+
+    _, appended = split_extraction(60, 40)
+
+    decomposition = Decomposition(PATH)
+    decomposition.load(side)
+    decomposition.decompose([21, 13, 9], side)
+    decomposition.store()
+
+    for path, array in appended.items():
+        get_storage().append(path, array)
+
+    decomposition = Decomposition(PATH)
+    decomposition.load(side, append=True)
+    decomposition.decompose(None, side, append=True)
+    decomposition.store()
+
+    report = json.loads(
+        get_storage().read_text(decomposition.get_results_path(side) + "precision.json")
+    )
+
+    assert len(report["layers"]) == len(decomposition.decompositions)
+    for layer in report["layers"]:
+        assert layer["reconstruction_error"] < 1e-4
@@ -0,0 +1,56 @@
+import numpy as np
+from lja.feature_constructor.feature_cache import FeatureCache
+from lja.feature_constructor.feature_constructor import ConstructorBySample
+
+
+def test_least_recently_used_features_are_evicted():
+    cache = FeatureCache(max_features=2)
+    cache.put("a", np.zeros(3))
+    cache.put("b", np.ones(3))
+
+    # reading a makes b the least recently used
+    cache.get("a", lambda: None)
+    cache.put("c", np.full(3, 2.0))
+
+    assert list(cache.features) == ["a", "c"]
+    assert cache.get("b", lambda: None) is None
+
+
+def test_counters_of_memory_and_store_hits():
+    cache = FeatureCache()
+    stored = {"a": np.arange(4.0)}
+
+    def loader(key):
+        return lambda: stored.get(key)
+
+    np.testing.assert_array_equal(cache.get("a", loader("a")), stored["a"])
+    np.testing.assert_array_equal(cache.get("a", loader("a")), stored["a"])
+    assert cache.get("b", loader("b")) is None
+
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+    assert (stats["store_hits"], stats["store_misses"]) == (1, 1)
+    assert stats["size"] == 1
+    assert stats["nbytes"] == stored["a"].nbytes
+
+
+def test_memory_mapped_features_are_copied():
+    cache = FeatureCache()
+    feature = np.arange(4.0)
+    cache.put("a", feature)
+    feature[:] = 0
+
+    np.testing.assert_array_equal(cache.features["a"], np.arange(4.0))
+
+
+def test_changing_k_clears_the_cache(experiment):
+    constructor = ConstructorBySample(experiment)
+    constructor.load()
+    constructor.set_k_per_layer([6, 5, 4])
+    constructor.set_granularity("sample")
+
+    constructor.construct_single_feature(2, 0, 3, plot=False, store=True)
+    assert constructor.feature_cache.get_stats()["size"] > 0
+
+    constructor.set_k_per_layer([3, 3, 3])
+    assert constructor.feature_cache.get_stats()["size"] == 0
@@ -0,0 +1,234 @@
+import numpy as np
+import pytest
+from lja.feature_constructor.feature_constructor import (
+    ConstructorBySample,
+    ConstructorByProfile,
+    combine_features,
+)
+
+GRANULARITIES = [
+    "sample",
+    "profile",
+    "profile_cluster",
+    "layer_average",
+    "vector_average",
+    "sample_average",
+]
+LAYERS = [1, 2]
+FEATURES = range(4)
+
+
+@pytest.fixture
+def constructor(experiment):
+    constructor = ConstructorBySample(experiment)
+    constructor.load()
+    constructor.set_k_per_layer([6, 5, 4])
+
+    return constructor
+
+
+def test_combine_features_matches_loop():
+    rng = np.random.RandomState(0)
+    write_vectors = rng.normal(size=(3, 4, 5))
+    read_vectors = rng.normal(size=(2, 5))
+    construction_vectors = rng.normal(size=(3, 6, 7))
+
+    expected = np.zeros((3, 2, 7))
+    for t, f, m in np.ndindex(3, 2, 4):
+        similarity = np.dot(write_vectors[t, m], read_vectors[f]) / (
+            np.linalg.norm(write_vectors[t, m]) * np.linalg.norm(read_vectors[f])
+        )
+        expected[t, f] += similarity * construction_vectors[t, m]
+
+    np.testing.assert_allclose(
+        combine_features(write_vectors, read_vectors, construction_vectors), expected
+    )
+
+
+def construct_recursive(constructor, layer, target_indices, feature_indices=FEATURES):
+    return np.array(
+        [
+            [
+                constructor.construct_single_feature(
+                    layer,
+                    feature_index,
+                    target_index,
+                    plot=False,
+                    store=False,
+                    reuse_stored_features=False,
+                )
+                for feature_index in feature_indices
+            ]
+            for target_index in target_indices
+        ]
+    )
+
+
+@pytest.mark.parametrize("granularity", GRANULARITIES)
+@pytest.mark.parametrize("target_indices", [[5, 17], [0, 5, 17], [3, 9, 21, 30]])
+def test_batched_engine_matches_recursive_engine(constructor, granularity, target_indices):
+    constructor.set_granularity(granularity)
+
+    batched = constructor.construct_layer_features(
+        LAYERS,
+        FEATURES,
+        np.array(target_indices),
+        plot=False,
+        store=False,
+        reuse_stored_features=False,
+    )
+
+    for layer in LAYERS:
+        recursive = construct_recursive(constructor, layer, target_indices)
+        features = batched[layer][target_indices][:, list(FEATURES)]
+
+        assert np.abs(recursive).max() > 0
+        np.testing.assert_allclose(features, recursive, rtol=1e-4, atol=1e-6)
+
+
+def test_batched_engine_matches_recursive_engine_by_profile(experiment):
+    constructor = ConstructorByProfile(experiment)
+    constructor.load()
+    constructor.set_k_per_layer([6, 5, 4])
+    profiles = np.arange(constructor.get_number_of_targets(2))
+
+    batched = constructor.construct_layer_features(
+        [2], FEATURES, profiles, plot=False, store=False, reuse_stored_features=False
+    )
+    recursive = construct_recursive(constructor, 2, profiles)
+
+    np.testing.assert_allclose(
+        batched[2][:, list(FEATURES)], recursive, rtol=1e-4, atol=1e-6
+    )
+
+
+def test_batched_engine_stores_the_features(constructor):
+    target_indices = [3, 9]
+    constructor.set_granularity("sample")
+    constructor.get_feature_store().clear()
+
+    constructor.construct_multiple_features(
+        LAYERS,
+        FEATURES,
+        target_indices,
+        granularites=["sample"],
+        plot=False,
+        reuse_stored_features=False,
+        engine="batched",
+    )
+
+    # a new constructor reads them from the feature store
+    reader = ConstructorBySample(constructor.path)
+    reader.load()
+    reader.set_k_per_layer([6, 5, 4])
+
+    for layer in LAYERS:
+        recursive = construct_recursive(reader, layer, target_indices)
+        stored = np.array(
+            [
+                [reader.load_feature(layer, f, t) for f in FEATURES]
+                for t in target_indices
+            ]
+        )
+
+        np.testing.assert_allclose(stored, recursive, rtol=1e-4, atol=1e-6)
+
+
+def test_single_features_are_reused_by_the_next_run(constructor):
+    constructor.set_granularity("sample")
+    constructor.get_feature_store().clear()
+
+    feature = constructor.construct_single_feature(2, 0, 3, plot=False, store=True)
+
+    # the next run keeps the store and reads the feature and the features of the recursion
+    reader = ConstructorBySample(constructor.path)
+    reader.load()
+    reader.set_k_per_layer([6, 5, 4])
+
+    np.testing.assert_allclose(reader.load_feature(2, 0, 3), feature)
+    for layer in [0, 1]:
+        assert reader.open_feature_store(layer).computed[layer].any()
+
+
+def test_stores_that_are_only_read_keep_their_manifest(constructor):
+    constructor.set_granularity("vector_average")
+    store = constructor.get_feature_store()
+    constructor.cache.invalidate(store.path)
+
+    constructor.construct_multiple_features(
+        LAYERS,
+        FEATURES,
+        [3, 9],
+        granularites=["vector_average"],
+        plot=False,
+        store=False,
+        reuse_stored_features=True,
+    )
+
+    assert constructor.cache.read_manifest(store.path) is None
+
+
+@pytest.mark.parametrize("granularity", ["sample", "profile_cluster"])
+def test_parallel_batched_engine_matches_serial_batched_engine(constructor, granularity):
+    constructor.set_granularity(granularity)
+    target_indices = np.array([0, 5, 17, 30])
+
+    serial, parallel = [
+        constructor.construct_layer_features(
+            LAYERS,
+            FEATURES,
+            target_indices,
+            plot=False,
+            store=False,
+            reuse_stored_features=False,
+            n_jobs=n_jobs,
+        )
+        for n_jobs in [1, 2]
+    ]
+
+    for layer in LAYERS:
+        assert np.abs(serial[layer][target_indices]).max() > 0
+        np.testing.assert_allclose(parallel[layer], serial[layer], rtol=1e-5, atol=1e-6)
+
+
+def test_changing_k_reopens_the_feature_stores(constructor):
+    constructor.set_granularity("sample")
+    arguments = dict(granularites=["sample"], plot=False, engine="batched")
+
+    constructor.construct_multiple_features(LAYERS, FEATURES, [3, 9], **arguments)
+    constructor.set_k_per_layer([3, 3, 3])
+    constructor.construct_multiple_features(LAYERS, range(3), [3, 9], **arguments)
+
+    for layer in LAYERS:
+        recursive = construct_recursive(constructor, layer, [3, 9], range(3))
+        stored = np.array(
+            [[constructor.load_feature(layer, f, t) for f in range(3)] for t in [3, 9]]
+        )
+
+        assert constructor.get_feature_store().features[layer].shape[1] == 3
+        np.testing.assert_allclose(stored, recursive, rtol=1e-4, atol=1e-6)
+
+
+def test_vector_average_follows_a_smaller_k_than_the_clusters(constructor):
+    constructor.set_granularity("vector_average")
+    constructor.set_k_per_layer([3, 3, 3])
+
+    for layer in [0, 1]:
+        groups, write_vectors = constructor.get_groups(layer)
+        assert write_vectors.shape[1] == 3
+
+    batched = constructor.construct_layer_features(
+        LAYERS,
+        range(3),
+        np.array([3, 9]),
+        plot=False,
+        store=False,
+        reuse_stored_features=False,
+    )
+    for layer in LAYERS:
+        np.testing.assert_allclose(
+            batched[layer][[3, 9]][:, :3],
+            construct_recursive(constructor, layer, [3, 9], range(3)),
+            rtol=1e-4,
+            atol=1e-6,
+        )
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from sklearn.cluster import AgglomerativeClustering
+from sklearn.datasets import make_blobs
+from sklearn.metrics import adjusted_rand_score
+from lja.clusterer.hierarchy import build_linkage, cut_linkage, linkage_gap_estimate
+
+
+def separated_blobs(number_of_blobs, n_samples=200):
+    """Blobs with equal distances between all centers, far apart compared to their spread."""
+    return make_blobs(
+        n_samples,
+        centers=10 * np.eye(number_of_blobs),
+        cluster_std=0.5,
+        random_state=0,
+    )
+
+
+@pytest.mark.parametrize("number_of_blobs", [2, 3, 4, 5])
+def test_linkage_gap_estimate_finds_separated_blobs(number_of_blobs):
+    X, _ = separated_blobs(number_of_blobs)
+    Z = build_linkage(X)
+
+    assert linkage_gap_estimate(Z) == number_of_blobs
+
+
+def test_linkage_gap_estimate_is_bounded_by_max_number_of_clusters():
+    X, _ = separated_blobs(5)
+    Z = build_linkage(X)
+
+    assert linkage_gap_estimate(Z, max_number_of_clusters=3) <= 3
+    assert linkage_gap_estimate(build_linkage(X[:2])) == 1
+
+
+@pytest.mark.parametrize("n_clusters", [2, 3, 7])
+def test_cut_linkage_matches_ward_clustering(n_clusters):
+    X, _ = make_blobs(150, centers=4, random_state=1)
+    labels = cut_linkage(build_linkage(X), n_clusters)
+
+    reference = AgglomerativeClustering(n_clusters, linkage="ward").fit_predict(X)
+
+    assert len(np.unique(labels)) == n_clusters
+    assert adjusted_rand_score(reference, labels) == 1.0
+    # labels are ordered by cluster size
+    counts = np.bincount(labels)
+    assert np.all(counts[:-1] >= counts[1:])
@@ -0,0 +1,64 @@
+import numpy as np
+from sklearn.datasets import make_blobs
+from sklearn.neighbors import NearestNeighbors, kneighbors_graph
+from lja.clusterer.knn import (
+    approximate_neighbors,
+    connectivity_from_indices,
+    exact_neighbors,
+)
+
+
+def test_exact_neighbors_match_sklearn():
+    vectors = np.random.RandomState(0).normal(size=(300, 8))
+    rows = np.arange(0, 300, 7)
+
+    expected = NearestNeighbors(n_neighbors=5).fit(vectors).kneighbors(
+        vectors[rows], return_distance=False
+    )
+
+    np.testing.assert_array_equal(exact_neighbors(vectors, rows, 5), expected)
+
+
+def measure_full_recall(vectors, indices):
+    exact = NearestNeighbors(n_neighbors=indices.shape[1]).fit(vectors).kneighbors(
+        vectors, return_distance=False
+    )
+    return (indices[:, :, None] == exact[:, None, :]).any(axis=2).mean()
+
+
+def test_approximate_neighbors_reach_the_recall_target():
+    # clustered vectors, few trees with small leaves, so that the neighbor descent has to refine them
+    vectors, _ = make_blobs(3000, n_features=16, centers=20, random_state=0)
+
+    indices, distances, report = approximate_neighbors(
+        vectors, n_neighbors=10, n_trees=2, leaf_size=50, recall_target=0.9
+    )
+
+    assert report["refinement_iterations"] > 0
+    assert report["recall"] >= 0.9
+    assert measure_full_recall(vectors, indices) >= 0.88
+
+    # the vector itself is its closest neighbor, the neighbors are sorted by distance
+    assert np.all(indices[:, 0] == np.arange(len(vectors)))
+    assert np.all(np.diff(distances, axis=1) >= 0)
+
+
+def test_approximate_neighbors_report_the_measured_recall():
+    vectors = np.random.RandomState(0).normal(size=(3000, 16))
+
+    indices, _, report = approximate_neighbors(
+        vectors, n_neighbors=10, n_trees=2, leaf_size=50, max_iterations=1
+    )
+
+    assert abs(report["recall"] - measure_full_recall(vectors, indices)) < 0.05
+
+
+def test_connectivity_matches_kneighbors_graph():
+    vectors = np.random.RandomState(1).normal(size=(100, 4))
+    indices = NearestNeighbors(n_neighbors=6).fit(vectors).kneighbors(
+        vectors, return_distance=False
+    )
+
+    expected = kneighbors_graph(vectors, 6, include_self=True)
+
+    assert (connectivity_from_indices(indices) != expected).nnz == 0
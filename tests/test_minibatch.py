@@ -0,0 +1,79 @@
+import numpy as np
+from sklearn.datasets import make_blobs
+from sklearn.metrics import adjusted_rand_score
+from lja.clusterer.clusterer_stackedvectors import Clusterer
+from lja.clusterer.minibatch import (
+    minibatch_kmeans,
+    predict_batches,
+    sum_per_center,
+)
+from conftest import PATH, write_extraction, write_decomposition
+
+
+def batches_of(vectors, batch_size):
+    return lambda: (vectors[i : i + batch_size] for i in range(0, len(vectors), batch_size))
+
+
+def test_sum_per_center_matches_loop():
+    rng = np.random.RandomState(0)
+    vectors = rng.normal(size=(50, 3))
+    labels = rng.randint(0, 4, 50)
+
+    expected = np.array([vectors[labels == c].sum(axis=0) for c in range(5)])
+
+    np.testing.assert_allclose(sum_per_center(vectors, labels, 5), expected)
+
+
+def test_minibatch_kmeans_recovers_separated_blobs():
+    vectors, blobs = make_blobs(
+        1000, centers=10 * np.eye(4), cluster_std=0.5, random_state=0
+    )
+    iter_batches = batches_of(vectors, 64)
+
+    centers, counts = minibatch_kmeans(iter_batches, vectors[:200], 4, n_epochs=2)
+    labels, inertia, means = predict_batches(iter_batches, centers)
+
+    assert adjusted_rand_score(blobs, labels) == 1.0
+    assert counts.sum() == 2 * len(vectors)
+
+    # the final centers are the exact means of the assigned vectors
+    expected = np.array([vectors[labels == c].mean(axis=0) for c in range(4)])
+    np.testing.assert_allclose(means, expected)
+    np.testing.assert_allclose(
+        inertia, np.sum((vectors - expected[labels]) ** 2), rtol=1e-6
+    )
+
+
+def test_minibatch_backend_clusters_the_write_vectors(working_directory):
+    write_extraction()
+    write_decomposition()
+
+    clusterer = Clusterer(PATH)
+    clusterer.backend = "minibatch_kmeans"
+    clusterer.minibatch_params = {"batch_size": 16, "n_epochs": 3, "init_size": 64}
+    clusterer.load()
+    clusterer.cluster_all_layers(k=4, plot=False, number_of_clusters=[3, 3])
+    clusterer.store()
+
+    for layer, (n_clusters, labels, centers) in enumerate(clusterer.clusters):
+        vectors = clusterer.format_vectors(layer, 4)
+
+        assert n_clusters == 3
+        assert labels.shape == (clusterer.u_list[layer].shape[0], 4)
+        np.testing.assert_allclose(
+            np.array(centers),
+            [vectors[labels.ravel() == c].mean(axis=0) for c in range(3)],
+            rtol=1e-5,
+            atol=1e-6,
+        )
+
+    # the stored clusters are reused for the same decomposition and config
+    reclustered = Clusterer(PATH)
+    reclustered.backend = "minibatch_kmeans"
+    reclustered.minibatch_params = clusterer.minibatch_params
+    reclustered.load()
+    reclustered.cluster_all_layers(k=4, plot=False, number_of_clusters=[3, 3])
+
+    assert reclustered.reused
+    for stored, clusters in zip(reclustered.clusters, clusterer.clusters):
+        np.testing.assert_array_equal(stored[1], clusters[1])
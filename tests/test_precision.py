@@ -0,0 +1,75 @@
+import os
+import shutil
+import numpy as np
+from lja.analyser.dataloader import Dataloader
+from lja.utils.precision import (
+    ComputeView,
+    PrecisionPolicy,
+    get_precision_policy,
+    set_precision_policy,
+)
+from lja.utils.storage import get_storage
+from lja.utils.artifact_registry import registry
+from conftest import PATH, write_extraction, write_decomposition
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_compute_view_casts_what_is_read():
+    stored = np.arange(24, dtype=np.float16).reshape(2, 3, 4)
+    view = PrecisionPolicy("float32").view(stored)
+
+    assert isinstance(view, ComputeView)
+    assert view.shape == stored.shape and view.dtype == np.float32
+    assert view[1, :, :2].dtype == np.float32
+    np.testing.assert_array_equal(view[1, :, :2], stored[1, :, :2].astype(np.float32))
+    np.testing.assert_array_equal(np.asarray(view), stored.astype(np.float32))
+    assert (view * 2).dtype == np.float32
+    assert [item.dtype for item in view] == [np.float32, np.float32]
+
+    # arrays in the compute dtype are not wrapped
+    assert PrecisionPolicy("float16").view(stored) is stored
+
+
+def test_dataloader_keeps_lower_precision_arrays_memory_mapped(working_directory):
+    set_precision_policy(PrecisionPolicy("float32", {"u": "float16"}))
+    write_extraction()
+    write_decomposition()
+
+    data = Dataloader(PATH)
+    data.load()
+    u = data.u_list[0]
+
+    assert isinstance(u, ComputeView)
+    assert isinstance(u.array, np.memmap)
+    assert u[3].dtype == np.float32
+    np.testing.assert_array_equal(u[3], np.asarray(u.array[3], dtype=np.float32))
+
+
+def test_default_policy_keeps_the_predictions(working_directory):
+    """The precision policy shipped in configs.yml predicts the same classes as float32."""
+
+    os.makedirs("configs")
+    shutil.copy(os.path.join(REPOSITORY, "configs", "configs.yml"), "configs")
+    set_precision_policy(None)
+    policy = get_precision_policy()
+
+    write_extraction()
+    full = Dataloader(PATH)
+    full.load(load_decompositions=False)
+    predictions = np.array(full.predictions)
+
+    # store the activations like LTExtractor.store, then run the decomposition on the default policy
+    storage = get_storage()
+    for layer in range(full.number_of_layers + 1):
+        path = full.get_activation_path(layer)
+        storage.save(path, policy.to_storage("activation", storage.load(path)))
+    registry.clear()
+    write_decomposition()
+
+    data = Dataloader(PATH)
+    data.load()
+
+    assert policy.get_storage_dtype("u") == np.float16
+    assert isinstance(data.u_list[0], ComputeView)
+    np.testing.assert_array_equal(data.predictions, predictions)
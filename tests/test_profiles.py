@@ -0,0 +1,67 @@
+import numpy as np
+from lja.analyser.dataloader import Dataloader
+from lja.clusterer.profiles import (
+    build_profiles,
+    transition_counts,
+    majority_previous_profile,
+)
+
+
+def test_build_profiles_indexes_the_distinct_label_rows():
+    labels = np.array([[1, 0], [0, 2], [1, 0], [0, 2], [1, 1]])
+
+    profiles, profile_index, counts = build_profiles(labels)
+
+    np.testing.assert_array_equal(profiles, [[0, 2], [1, 0], [1, 1]])
+    np.testing.assert_array_equal(profiles[profile_index], labels)
+    np.testing.assert_array_equal(counts, [2, 2, 1])
+
+
+def test_majority_previous_profile_matches_counting():
+    rng = np.random.RandomState(0)
+    previous_index = rng.randint(0, 4, 50)
+    profile_index = rng.randint(0, 6, 50)
+
+    transitions = transition_counts(previous_index, profile_index, 4, 6)
+
+    assert transitions.sum() == 50
+    for profile in range(6):
+        counts = np.bincount(previous_index[profile_index == profile], minlength=4)
+        np.testing.assert_array_equal(transitions.toarray()[:, profile], counts)
+        assert majority_previous_profile(transitions)[profile] == np.argmax(counts)
+
+
+def test_stored_profiles_match_the_cluster_labels(experiment):
+    data = Dataloader(experiment)
+    data.load(load_cluster=True)
+    number_of_samples = len(data.labels)
+
+    for layer in range(data.number_of_layers - 1):
+        profiles = data.profiles[layer]
+        labels = np.asarray(data.clusters[layer][1]).reshape(number_of_samples, -1)
+
+        np.testing.assert_array_equal(
+            profiles["profiles"][profiles["profile_index"]], labels
+        )
+        assert profiles["counts"].sum() == number_of_samples
+
+        if layer > 0:
+            previous = data.profiles[layer - 1]
+            transitions = profiles["transitions"].toarray()
+
+            assert transitions.sum() == number_of_samples
+            np.testing.assert_array_equal(transitions.sum(axis=0), profiles["counts"])
+            np.testing.assert_array_equal(transitions.sum(axis=1), previous["counts"])
+            np.testing.assert_array_equal(
+                profiles["previous_profile"], np.argmax(transitions, axis=0)
+            )
+
+
+def test_profiles_of_selected_samples_count_the_selected_samples(experiment):
+    data = Dataloader(experiment)
+    data.load(load_cluster=True, samples=range(0, 40, 3))
+
+    transitions = data.profiles[1]["transitions"]
+
+    assert transitions.sum() == len(data.sample_indices)
+    assert data.profiles[1]["counts"].sum() == len(data.sample_indices)
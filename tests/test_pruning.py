@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from lja.feature_constructor.feature_constructor import (
+    ConstructorBySample,
+    prune_similarity,
+)
+from test_feature_constructor import FEATURES, LAYERS, construct_recursive
+
+
+@pytest.fixture
+def constructor(experiment):
+    constructor = ConstructorBySample(experiment)
+    constructor.load()
+    constructor.set_k_per_layer([6, 5, 4])
+
+    return constructor
+
+
+def test_prune_similarity():
+    similarity = np.array([[0.1, -0.9, 0.5, 0.05], [0.3, 0.2, -0.4, 0.8]])
+
+    np.testing.assert_array_equal(prune_similarity(similarity), similarity)
+    np.testing.assert_array_equal(
+        prune_similarity(similarity, top_m=2),
+        [[0, -0.9, 0.5, 0], [0, 0, -0.4, 0.8]],
+    )
+    np.testing.assert_array_equal(
+        prune_similarity(similarity, similarity_threshold=0.35),
+        [[0, -0.9, 0.5, 0], [0, 0, -0.4, 0.8]],
+    )
+    np.testing.assert_array_equal(
+        prune_similarity(similarity, top_m=1, similarity_threshold=0.85),
+        [[0, -0.9, 0, 0], [0, 0, 0, 0]],
+    )
+
+
+def test_pruning_error(constructor):
+    targets = np.arange(10)
+
+    # keeping all write vectors is exact
+    exact = constructor.measure_pruning_error(LAYERS, FEATURES, targets, top_m=6)
+    assert np.all(exact["relative_error"] < 1e-6)
+
+    errors = [
+        constructor.measure_pruning_error(LAYERS, FEATURES, targets, top_m=m)
+        for m in [1, 2, 4]
+    ]
+    top_layer = [e["relative_error"].iloc[-1] for e in errors]
+
+    assert top_layer[0] > 0
+    assert top_layer[0] >= top_layer[1] >= top_layer[2]
+    assert constructor.pruning is None
+
+
+@pytest.mark.parametrize("pruning", [{"top_m": 2}, {"similarity_threshold": 0.3}])
+def test_pruned_engines_agree(constructor, pruning):
+    targets = [2, 11, 27]
+    constructor.set_pruning(**pruning)
+
+    batched = constructor.construct_layer_features(
+        LAYERS, FEATURES, np.array(targets), plot=False, store=False, reuse_stored_features=False
+    )
+
+    for layer in LAYERS:
+        np.testing.assert_allclose(
+            batched[layer][targets][:, list(FEATURES)],
+            construct_recursive(constructor, layer, targets),
+            rtol=1e-4,
+            atol=1e-6,
+        )
+
+
+def test_pruned_features_are_stored_apart(constructor):
+    exact_store = constructor.get_feature_store()
+
+    constructor.set_pruning(top_m=2)
+    pruned_store = constructor.get_feature_store()
+
+    assert constructor.get_pruning_tag() == "_top2"
+    assert pruned_store is not exact_store
+    assert pruned_store.path != exact_store.path
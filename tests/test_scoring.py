@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from sklearn.datasets import make_blobs
+from sklearn.metrics import silhouette_samples, silhouette_score
+from lja.clusterer.scoring import score_silhouette, silhouette_samples_blocked
+
+
+@pytest.fixture(scope="module")
+def clustering():
+    vectors, labels = make_blobs(
+        3000, n_features=6, centers=5, cluster_std=3.0, random_state=0
+    )
+
+    return vectors, labels
+
+
+def test_blocked_silhouette_matches_sklearn(clustering):
+    vectors, labels = clustering
+    rows = np.arange(0, len(labels), 11)
+
+    np.testing.assert_allclose(
+        silhouette_samples_blocked(vectors, labels, rows, block_size=5000),
+        silhouette_samples(vectors, labels)[rows],
+        atol=1e-8,
+    )
+
+    score = score_silhouette(vectors, labels, mode="exact", block_size=5000)
+    assert score["n_scored"] == len(labels)
+    assert score["silhouette"] == pytest.approx(silhouette_score(vectors, labels))
+
+
+@pytest.mark.parametrize("random_state", range(5))
+def test_stratified_interval_contains_the_exact_score(clustering, random_state):
+    vectors, labels = clustering
+    exact = silhouette_score(vectors, labels)
+
+    score = score_silhouette(
+        vectors, labels, sample_size=300, confidence=0.99, random_state=random_state
+    )
+
+    assert abs(score["n_scored"] - 300) <= 5
+    assert score["lower"] < score["silhouette"] < score["upper"]
+    assert score["lower"] <= exact <= score["upper"]
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from sklearn.datasets import make_blobs
+from sklearn.neighbors import kneighbors_graph
+from lja.clusterer import spectral
+
+
+@pytest.fixture(scope="module")
+def laplacian():
+    vectors, _ = make_blobs(
+        400, n_features=5, centers=4, cluster_std=2.0, random_state=0
+    )
+    connectivity = kneighbors_graph(vectors, n_neighbors=10, include_self=True)
+
+    return spectral.get_laplacian(0.5 * (connectivity + connectivity.T))
+
+
+@pytest.mark.parametrize(
+    "dense_limit, arpack_limit, solver",
+    [(1000, 20000, "dense"), (100, 20000, "arpack"), (100, 200, "lobpcg")],
+)
+def test_sparse_solvers_match_the_dense_solver(
+    monkeypatch, laplacian, dense_limit, arpack_limit, solver
+):
+    L, sqrt_degrees = laplacian
+    dense, _ = spectral.smallest_eigenpairs(L, 10, "dense")
+
+    monkeypatch.setattr(spectral, "DENSE_LIMIT", dense_limit)
+    monkeypatch.setattr(spectral, "ARPACK_LIMIT", arpack_limit)
+    assert spectral.get_eigen_solver(L.shape[0]) == solver
+
+    eigenvalues, eigenvectors = spectral.smallest_eigenpairs(
+        L, 10, initial_vector=sqrt_degrees
+    )
+
+    np.testing.assert_allclose(eigenvalues, dense, atol=1e-4)
+    residuals = np.linalg.norm(L @ eigenvectors - eigenvectors * eigenvalues, axis=0)
+    np.testing.assert_allclose(residuals, 0, atol=1e-3)
+
+    n_clusters, candidates = spectral.eigengap_estimate(eigenvalues)
+    assert n_clusters == spectral.eigengap_estimate(dense)[0] == 4
+    np.testing.assert_array_equal(candidates, spectral.eigengap_estimate(dense)[1])
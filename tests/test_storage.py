@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from lja.utils.storage import ContainerStorage, MemoryStorage, Storage
+
+
+def test_storage_is_abstract():
+    with pytest.raises(TypeError):
+        Storage()
+
+
+@pytest.mark.parametrize("backend", ["memory", "container"])
+def test_storages_round_trip(tmp_path, backend):
+    storage = MemoryStorage() if backend == "memory" else ContainerStorage(str(tmp_path) + "/")
+    array = np.arange(12, dtype=np.float32).reshape(3, 4)
+
+    storage.save("a//b.npy", array)
+    storage.append("a/b.npy", array[:1])
+    storage.write_text("a/c.json", "{}")
+
+    np.testing.assert_array_equal(storage.load("a/b.npy"), np.concatenate((array, array[:1])))
+    assert storage.read_text("a/c.json") == "{}"
+    assert storage.list("a/") == ["a/b.npy", "a/c.json"]
+
+
+def test_container_compact_keeps_open_views_valid(tmp_path):
+    storage = ContainerStorage(str(tmp_path) + "/")
+    array = np.arange(1000, dtype=np.float64)
+
+    storage.save("a.npy", array)
+    storage.save("b.npy", array[:10])
+    storage.save("a.npy", 2 * array)
+    view = storage.load("a.npy", mmap_mode="r")
+    fingerprint = storage.get_fingerprint("")
+
+    storage.compact()
+
+    np.testing.assert_array_equal(view, 2 * array)
+    np.testing.assert_array_equal(storage.load("a.npy"), 2 * array)
+    np.testing.assert_array_equal(storage.load("b.npy"), array[:10])
+    assert storage.get_fingerprint("") == fingerprint
+
+    # a reopened container reads the compacted file
+    reopened = ContainerStorage(str(tmp_path) + "/")
+    np.testing.assert_array_equal(reopened.load("a.npy"), 2 * array)